@@ -1,2 +1,4 @@
 from .api import project_data_from_master_api as project_data_from_master
 from .api import project_data_from_master_month_api as project_data_from_master_month
+from .api import import_master_api as import_master
+from .async_api import load_master_async, load_masters_async
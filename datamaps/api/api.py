@@ -1,5 +1,9 @@
+from pathlib import Path
+from typing import Any, Optional, Union
+
 from ..core import Quarter
 from ..plugins.dft.master import Master
+from ..plugins.dft.portfolio import project_data_from_columns
 
 
 def project_data_from_master_api(master_file: str, quarter: int, year: int):
@@ -42,3 +46,56 @@ def project_data_from_master_month_api(master_file: str, month: int, year: int)
         year = year - 1
     m = Master(Quarter(quarter, year), master_file, month)
     return m
+
+
+def import_master_api(
+    quarter: int,
+    year: int,
+    input_dir: Optional[Union[str, Path]] = None,
+    datamap: Optional[Union[str, Path]] = None,
+    zip_input: Optional[Union[str, Path]] = None,
+    row_limit: Optional[Union[int, str]] = None,
+    save: bool = False,
+    type_values: bool = False,
+    **kwargs: Any,
+) -> Master:
+    """Import the populated templates, as ``datamaps import templates`` does, and
+    return the result as a Master object, without reading back a master xlsx file.
+
+    Args:
+        quarter (int): an integer representing the financial quarter
+        year (int): an integer representing the year
+        input_dir (str): the directory containing the templates and the datamap;
+            the datamaps input directory if not given
+        datamap (str): the datamap file name, if not the one in the config file
+        zip_input (str): a zip file of templates to use instead of ``input_dir``
+        row_limit (int or str): as for ``--rowlimit``, including ``"auto"``
+        save (bool): if True, the master xlsx file is also written to the output directory
+        type_values (bool): as for ``Master``
+
+    Any other keyword arguments (e.g. ``streaming=True``, ``pipeline=True``,
+    ``dedupe="files"``) are the options of ``datamaps import templates``, other than
+    ``watch`` and ``validationonly``, which do not produce a master. A validation
+    report is written if the datamap has a type column, as it is by the command.
+    """
+    from engine.config import Config
+
+    unsupported = sorted({"watch", "validationonly"} & set(kwargs))
+    if unsupported:
+        raise ValueError(f"import_master does not take {', '.join(unsupported)}.")
+
+    from ..process.importer import import_and_create_master
+
+    Config.initialise()
+    columns = import_and_create_master(
+        None,
+        datamap=datamap,
+        inputdir=Path(input_dir).absolute() if input_dir else None,
+        zipinput=Path(zip_input).absolute() if zip_input else None,
+        rowlimit=row_limit,
+        savemaster=save,
+        **kwargs,
+    )
+    path = Path(Config.PLATFORM_DOCS_DIR) / "output" / Config.config_parser["DEFAULT"]["master file name"]
+    data = project_data_from_columns(columns, type_values=type_values)
+    return Master.from_data(Quarter(quarter, year), data, str(path))
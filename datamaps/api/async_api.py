@@ -0,0 +1,88 @@
+"""
+Loading masters from asyncio code.
+
+Creating a :py:class:`datamaps.plugins.dft.master.Master` parses a whole xlsx
+file, which can take several seconds and would block the event loop. These
+functions do the parsing in an executor instead::
+
+    m = await load_master_async("/tmp/master_1_2019.xlsx", 1, 2019)
+
+    masters = await load_masters_async(
+        [("/tmp/master_1_2019.xlsx", 1, 2019), ("/tmp/master_2_2019.xlsx", 2, 2019)],
+        limit=2,
+    )
+
+By default the event loop's default executor (a thread pool) is used. Pass a
+:py:class:`concurrent.futures.ProcessPoolExecutor` as ``executor`` to parse
+masters in other processes, in parallel.
+"""
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Iterable, List, Optional, Tuple
+
+from ..core import Quarter
+from ..plugins.dft.master import Master
+
+
+def _load_master(master_file: str, quarter: int, year: int, **kwargs: Any) -> Master:
+    # module level, so that it can be sent to a ProcessPoolExecutor
+    return Master(Quarter(quarter, year), master_file, **kwargs)
+
+
+async def load_master_async(
+    master_file: str, quarter: int, year: int, executor: Optional[Executor] = None, **kwargs: Any
+) -> Master:
+    """Create a Master object without blocking the event loop.
+
+    Args:
+        master_file (str): the path to a master file
+        quarter (int): an integer representing the financial quarter
+        year (int): an integer representing the year
+        executor (:py:class:`concurrent.futures.Executor`): where to parse the master;
+            the event loop's default executor if not given
+
+    Any other keyword arguments (e.g. ``type_values``) are passed to ``Master``.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, partial(_load_master, master_file, quarter, year, **kwargs)
+    )
+
+
+async def load_masters_async(
+    masters: Iterable[Tuple[str, int, int]],
+    limit: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    **kwargs: Any,
+) -> List[Master]:
+    """Create several Master objects at once without blocking the event loop.
+
+    Args:
+        masters: ``(master_file, quarter, year)`` for each master
+        limit (int): the most masters to parse at the same time; no limit if not given
+        executor (:py:class:`concurrent.futures.Executor`): where to parse the masters;
+            the event loop's default executor if not given
+
+    Returns:
+        The Master objects, in the same order as ``masters``.
+
+    If loading any master fails, or this is cancelled, the masters which have
+    not started loading yet are cancelled. A master already being parsed in
+    the executor cannot be interrupted, but its result is discarded.
+    """
+    semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def load(master_file, quarter, year):
+        if semaphore is None:
+            return await load_master_async(master_file, quarter, year, executor, **kwargs)
+        async with semaphore:
+            return await load_master_async(master_file, quarter, year, executor, **kwargs)
+
+    tasks = [asyncio.ensure_future(load(*m)) for m in masters]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
@@ -0,0 +1,49 @@
+"""
+Benchmarks for datamaps, using synthetic data.
+
+Run them with ``python -m datamaps.benchmarks`` (see ``--help``), or with
+pytest-benchmark installed, ``pytest datamaps/benchmarks``.
+"""
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, List, Optional
+
+
+class Benchmark:
+    """A minimal stand-in for pytest-benchmark's ``benchmark`` fixture.
+
+    Calling it runs ``func(*args, **kwargs)`` ``rounds`` times, keeps the
+    duration of each run and returns the result of the last one. If ``memory``
+    is True, it is then run once more with tracemalloc on, to find the most
+    memory allocated in this process at once (``peak_memory``, in bytes).
+    """
+
+    def __init__(self, rounds: int = 3, memory: bool = False) -> None:
+        self.rounds = rounds
+        self.memory = memory
+        self.times: List[float] = []
+        self.peak_memory: Optional[int] = None
+
+    def __call__(self, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        result = None
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            self.times.append(time.perf_counter() - start)
+        if self.memory:
+            tracemalloc.start()
+            try:
+                func(*args, **kwargs)
+                self.peak_memory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        return result
+
+    @property
+    def min(self) -> float:
+        return min(self.times)
+
+    @property
+    def mean(self) -> float:
+        return statistics.mean(self.times)
@@ -0,0 +1,48 @@
+import argparse
+import tempfile
+from pathlib import Path
+
+from datamaps.benchmarks import Benchmark
+from datamaps.benchmarks.scenarios import SCALES, SCENARIOS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m datamaps.benchmarks",
+        description="Run datamaps benchmarks against generated data.",
+    )
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="also measure the peak memory allocated by each scenario (in an extra, slower round)",
+    )
+    parser.add_argument(
+        "--workdir",
+        type=Path,
+        help="directory in which to keep generated data between runs (default: a temporary directory)",
+    )
+    args = parser.parse_args(argv)
+    names = args.scenarios or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    scale = SCALES[args.scale]
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        header = f"{'scenario':<34}{'rounds':>8}{'min (s)':>12}{'mean (s)':>12}"
+        print(header + (f"{'peak (MB)':>12}" if args.memory else ""))
+        for name in names:
+            bench = Benchmark(args.rounds, memory=args.memory)
+            SCENARIOS[name](bench, workdir, scale)
+            line = f"{name:<34}{len(bench.times):>8}{bench.min:>12.4f}{bench.mean:>12.4f}"
+            if args.memory:
+                line += f"{bench.peak_memory / (1024 * 1024):>12.1f}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
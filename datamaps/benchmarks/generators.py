@@ -0,0 +1,197 @@
+"""
+Deterministic generators for synthetic benchmark data.
+
+Everything here is driven by a seeded :py:class:`random.Random`, so the same
+arguments always produce the same files.
+"""
+import csv
+import datetime
+import random
+from pathlib import Path
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence
+
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+SHEETS = ["Summary", "Finance", "Milestones", "Resources", "Risks"]
+
+WORDS = [
+    "project", "budget", "baseline", "forecast", "milestone", "benefit", "approval",
+    "delivery", "assurance", "capital", "revenue", "income", "scope", "risk", "owner",
+    "status", "review", "programme", "start", "end", "date", "total", "whole", "life",
+]
+
+# How untidy keys and strings can be, as found in real masters and templates.
+_MESS: List[Callable[[str], str]] = [
+    lambda s: s,
+    lambda s: s,
+    lambda s: s + " ",
+    lambda s: s + "  ",
+    lambda s: s.replace(" ", " – ", 1),
+    lambda s: s.replace(" ", ", ", 1),
+    lambda s: s.replace(" ", "  ", 1),
+    lambda s: "'" + s,
+    lambda s: s.replace(" ", "\n", 1),
+]
+
+
+class DatamapLine(NamedTuple):
+    key: str
+    sheet: str
+    cellref: str
+    data_type: str
+
+
+def _phrase(rng: random.Random, words: int = 4) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def keys(count: int, seed: int = 0, messy: bool = True) -> List[str]:
+    """Return ``count`` unique master keys, some of which need cleaning."""
+    rng = random.Random(seed)
+    output = []
+    for i in range(count):
+        key = f"{_phrase(rng)} {i}"
+        if messy:
+            key = rng.choice(_MESS)(key)
+        output.append(key)
+    return output
+
+
+def _messy_string(rng: random.Random) -> str:
+    kind = rng.randrange(7)
+    if kind == 0:
+        return f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2000, 2040)}"
+    if kind == 1:
+        return f"{rng.randint(2000, 2040)}-{rng.randint(1, 12)}-{rng.randint(1, 28)}"
+    if kind == 2:
+        return str(rng.randint(-10000, 10000))
+    if kind == 3:
+        return f"{rng.uniform(-1000, 1000):.3f}"
+    if kind == 4:
+        return f"{rng.randint(0, 100)}%"
+    if kind == 5:
+        return f"£{rng.randint(0, 10**7)}.{rng.randint(0, 99):02d}"
+    return rng.choice(_MESS)(_phrase(rng, rng.randint(2, 8)))
+
+
+def messy_strings(count: int, seed: int = 0) -> List[str]:
+    """Return ``count`` strings of the kind the ``Cleanser`` is used on: untidy
+    text, dates, numbers, percentages and sums of money."""
+    rng = random.Random(seed)
+    return [_messy_string(rng) for _ in range(count)]
+
+
+def value(rng: random.Random) -> Any:
+    """Return a single master/template value of a random type."""
+    kind = rng.randrange(8)
+    if kind == 0:
+        return None
+    if kind == 1:
+        return rng.randint(0, 10**6)
+    if kind == 2:
+        return round(rng.uniform(0, 10**7), 2)
+    if kind == 3:
+        return datetime.datetime(rng.randint(2000, 2040), rng.randint(1, 12), rng.randint(1, 28))
+    if kind == 4:
+        return _messy_string(rng)
+    return rng.choice(_MESS)(_phrase(rng, rng.randint(1, 12)))
+
+
+def _value_for_type(rng: random.Random, data_type: str) -> Any:
+    if data_type == "NUMBER":
+        return rng.choice([rng.randint(0, 10**6), round(rng.uniform(0, 10**7), 2)])
+    if data_type == "DATE":
+        return datetime.datetime(rng.randint(2000, 2040), rng.randint(1, 12), rng.randint(1, 28))
+    return _phrase(rng, rng.randint(1, 12))
+
+
+def write_master(
+    path: Path, projects: int, keys_count: int, seed: int = 0, key_names: Optional[Sequence[str]] = None
+) -> Path:
+    """Write a master with ``keys_count`` keys in column A and ``projects`` columns.
+
+    The keys are generated unless ``key_names`` is given.
+    """
+    rng = random.Random(seed)
+    if key_names is None:
+        key_names = keys(keys_count, seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Master")
+    ws.append(["file name"] + [f"Project {p}" for p in range(projects)])
+    for key in key_names:
+        ws.append([key] + [value(rng) for _ in range(projects)])
+    wb.save(path)
+    return path
+
+
+def datamap_lines(count: int, sheets: Sequence[str] = SHEETS, seed: int = 0) -> List[DatamapLine]:
+    """Return ``count`` datamap lines, interleaved across ``sheets`` as real datamaps tend to be."""
+    rng = random.Random(seed)
+    used = set()
+    output = []
+    types = ["TEXT", "NUMBER", "DATE"]
+    for key in keys(count, seed, messy=False):
+        while True:
+            sheet = rng.choice(sheets)
+            cellref = f"{get_column_letter(rng.randint(2, 12))}{rng.randint(1, max(count // 4, 20))}"
+            if (sheet, cellref) not in used:
+                used.add((sheet, cellref))
+                break
+        output.append(DatamapLine(key, sheet, cellref, rng.choice(types)))
+    return output
+
+
+def write_datamap(path: Path, lines: Sequence[DatamapLine]) -> Path:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["cell_key", "template_sheet", "cellreference", "type"])
+        for line in lines:
+            writer.writerow(line)
+    return path
+
+
+def write_blank_template(path: Path, sheets: Sequence[str] = SHEETS) -> Path:
+    wb = Workbook()
+    wb.active.title = sheets[0]
+    for sheet in sheets[1:]:
+        wb.create_sheet(sheet)
+    wb.save(path)
+    return path
+
+
+def write_template(
+    path: Path, lines: Sequence[DatamapLine], seed: int = 0, filler_rows: int = 0
+) -> Path:
+    """Write a template populated at every cell referred to by ``lines``.
+
+    If ``filler_rows`` is given, that many rows of text not used by the datamap
+    are added below the datamap's cells in each sheet, as in templates with
+    guidance notes, lookup tables or rows which have been copied far down.
+    """
+    rng = random.Random(seed)
+    wb = Workbook()
+    sheets = sorted({line.sheet for line in lines})
+    wb.active.title = sheets[0]
+    for sheet in sheets[1:]:
+        wb.create_sheet(sheet)
+    for line in lines:
+        wb[line.sheet][line.cellref] = _value_for_type(rng, line.data_type)
+    for sheet in sheets:
+        ws = wb[sheet]
+        start = ws.max_row + 1
+        for row in range(start, start + filler_rows):
+            for column in range(1, 13):
+                ws.cell(row=row, column=column, value=_phrase(rng, 2))
+    wb.save(path)
+    return path
+
+
+def write_templates(
+    directory: Path, lines: Sequence[DatamapLine], count: int, seed: int = 0, filler_rows: int = 0
+) -> List[Path]:
+    """Write ``count`` populated templates to ``directory``."""
+    return [
+        write_template(Path(directory) / f"Project {i}.xlsx", lines, seed + i, filler_rows)
+        for i in range(count)
+    ]
@@ -0,0 +1,320 @@
+"""
+Benchmark scenarios for the hot paths in datamaps.
+
+Each scenario is a function taking ``(benchmark, workdir, scale)``. It generates
+whatever data it needs in ``workdir`` and then calls ``benchmark(func, *args)``
+exactly once with the code to be measured - the same calling convention as the
+``benchmark`` fixture from pytest-benchmark, so the scenarios can be run by
+pytest-benchmark where it is installed, or by ``python -m datamaps.benchmarks``
+where it is not.
+"""
+import random
+import shutil
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple
+
+from openpyxl import Workbook
+
+from datamaps.benchmarks import generators
+
+
+class Scale(NamedTuple):
+    projects: int
+    keys: int
+    templates: int
+    strings: int
+
+
+SCALES = {
+    "tiny": Scale(projects=3, keys=40, templates=2, strings=200),
+    "small": Scale(projects=20, keys=300, templates=5, strings=5_000),
+    "medium": Scale(projects=100, keys=1_000, templates=20, strings=50_000),
+    "large": Scale(projects=400, keys=2_000, templates=100, strings=200_000),
+}
+
+SCENARIOS: Dict[str, Callable] = OrderedDict()
+
+
+def scenario(func: Callable) -> Callable:
+    """Register ``func`` as a benchmark scenario."""
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+@contextmanager
+def docs_dir(workdir: Path):
+    """Point bcompiler-engine's configuration at a Documents directory inside ``workdir``."""
+    from engine.config import Config
+
+    names = [
+        "PLATFORM_DOCS_DIR",
+        "FULL_PATH_INPUT",
+        "FULL_PATH_OUTPUT",
+        "DATAMAPS_LIBRARY_DATA_DIR",
+        "DATAMAPS_LIBRARY_CONFIG_DIR",
+        "DATAMAPS_LIBRARY_CONFIG_FILE",
+    ]
+    saved = {name: getattr(Config, name) for name in names}
+    docs = Path(workdir) / "Documents" / "datamaps"
+    Config.PLATFORM_DOCS_DIR = docs
+    Config.FULL_PATH_INPUT = docs / "input"
+    Config.FULL_PATH_OUTPUT = docs / "output"
+    Config.DATAMAPS_LIBRARY_DATA_DIR = Path(workdir) / "data"
+    Config.DATAMAPS_LIBRARY_CONFIG_DIR = Path(workdir) / "config"
+    Config.DATAMAPS_LIBRARY_CONFIG_FILE = Path(workdir) / "config" / "config.ini"
+    try:
+        Config.initialise()
+        yield Config
+    finally:
+        for name, value in saved.items():
+            setattr(Config, name, value)
+
+
+def _master(workdir: Path, scale: Scale) -> Path:
+    path = Path(workdir) / f"master_{scale.projects}x{scale.keys}.xlsx"
+    if not path.exists():
+        generators.write_master(path, scale.projects, scale.keys)
+    return path
+
+
+def _import_inputs(workdir: Path, scale: Scale) -> Path:
+    input_dir = Path(workdir) / "templates"
+    if not input_dir.exists():
+        input_dir.mkdir()
+        lines = generators.datamap_lines(scale.keys)
+        generators.write_datamap(input_dir / "datamap.csv", lines)
+        generators.write_templates(input_dir, lines, scale.templates)
+    return input_dir
+
+
+@scenario
+def project_data_from_master(benchmark, workdir, scale):
+    from datamaps.plugins.dft.portfolio import project_data_from_master
+
+    benchmark(project_data_from_master, str(_master(workdir, scale)))
+
+
+@scenario
+def project_data_from_master_typed(benchmark, workdir, scale):
+    from datamaps.plugins.dft.portfolio import project_data_from_master
+
+    benchmark(project_data_from_master, str(_master(workdir, scale)), type_values=True)
+
+
+@scenario
+def project_data_from_master_xml(benchmark, workdir, scale):
+    from datamaps.plugins.dft.portfolio import project_data_from_master
+
+    benchmark(project_data_from_master, str(_master(workdir, scale)), engine="xml")
+
+
+@scenario
+def query_master_file(benchmark, workdir, scale):
+    from datamaps.plugins.dft.query import Query
+    from datamaps.process import Cleanser
+
+    wanted = [Cleanser(k).clean() for k in generators.keys(scale.keys)[:: max(scale.keys // 10, 1)]]
+    q = Query.from_file(_master(workdir, scale)).select(*wanted).where(wanted[0], "!=", None)
+    benchmark(q.results)
+
+
+@scenario
+def master_diff(benchmark, workdir, scale):
+    from datamaps.plugins.dft.diff import diff_master_files
+
+    path = _master(workdir, scale)
+
+    def diff():
+        return sum(1 for _ in diff_master_files(path, path))
+
+    benchmark(diff)
+
+
+@scenario
+def cleanser(benchmark, workdir, scale):
+    from datamaps.process import Cleanser
+
+    strings = generators.messy_strings(scale.strings)
+
+    def clean_all():
+        return [Cleanser(s).clean() for s in strings]
+
+    benchmark(clean_all)
+
+
+@scenario
+def pull_keys(benchmark, workdir, scale):
+    from datamaps.plugins.dft.master import ProjectData
+    from datamaps.plugins.dft.portfolio import project_data_from_master
+
+    data = project_data_from_master(str(_master(workdir, scale)))
+    projects = [ProjectData(d) for d in data.values()]
+    wanted = list(next(iter(data.values())).keys())[:: max(scale.keys // 50, 1)]
+
+    def pull_all():
+        for p in projects:
+            p.pull_keys(wanted)
+            p.pull_keys(wanted, flat=True)
+
+    benchmark(pull_all)
+
+
+@scenario
+def sqlite_pull_keys(benchmark, workdir, scale):
+    from datamaps.core import Quarter
+    from datamaps.plugins.dft.master import Master
+
+    db = Path(workdir) / f"masters_{scale.projects}x{scale.keys}.db"
+    if not db.exists():
+        Master(Quarter(1, 2021), str(_master(workdir, scale))).to_sqlite(db, "master")
+    m = Master.from_sqlite(db, "master")
+    wanted = list(m.data[m.projects[0]])[:: max(scale.keys // 50, 1)]
+
+    def pull_all():
+        for p in m.projects:
+            m[p].pull_keys(wanted)
+
+    benchmark(pull_all)
+
+
+@scenario
+def snapshot_pull_keys(benchmark, workdir, scale):
+    from datamaps.core import Quarter
+    from datamaps.plugins.dft.master import Master
+
+    path = Path(workdir) / f"master_{scale.projects}x{scale.keys}.snapshot"
+    if not path.exists():
+        Master(Quarter(1, 2021), str(_master(workdir, scale))).to_snapshot(path)
+
+    def open_and_pull():
+        m = Master.from_snapshot(path)
+        wanted = list(m.data[m.projects[0]])[:: max(scale.keys // 50, 1)]
+        for p in m.projects:
+            m[p].pull_keys(wanted)
+
+    benchmark(open_and_pull)
+
+
+@scenario
+def row_bind(benchmark, workdir, scale):
+    from datamaps.core import Row
+
+    rows = [generators.value(random.Random(i)) for i in range(scale.keys)]
+
+    def bind():
+        ws = Workbook().active
+        for i in range(scale.projects):
+            Row(2, i + 1, rows).bind(ws)
+        return ws
+
+    benchmark(bind)
+
+
+@scenario
+def import_templates(benchmark, workdir, scale):
+    from datamaps.main import output_funcs
+    from datamaps.process import importer
+
+    input_dir = _import_inputs(workdir, scale)
+    with docs_dir(workdir):
+        benchmark(importer.import_and_create_master, output_funcs, inputdir=input_dir)
+
+
+def _large_templates(workdir: Path, scale: Scale):
+    template_dir = Path(workdir) / "large_templates"
+    if not template_dir.exists():
+        template_dir.mkdir()
+        lines = generators.datamap_lines(scale.keys)
+        generators.write_datamap(template_dir / "datamap.csv", lines)
+        generators.write_templates(
+            template_dir, lines, min(scale.templates, 5), filler_rows=max(scale.keys // 2, 50)
+        )
+    return template_dir / "datamap.csv", sorted(template_dir.glob("*.xlsx"))
+
+
+def _extract_templates(benchmark, workdir, scale, streaming):
+    from datamaps.process import importer
+    from datamaps.process.datamap import compile_datamap
+
+    datamap, templates = _large_templates(workdir, scale)
+    with docs_dir(workdir):
+        compiled = compile_datamap(datamap)
+
+        def extract_all():
+            for template in templates:
+                importer.read_template(template, 500, datamap=compiled, streaming=streaming)
+
+        benchmark(extract_all)
+
+
+@scenario
+def extract_templates(benchmark, workdir, scale):
+    _extract_templates(benchmark, workdir, scale, streaming=False)
+
+
+@scenario
+def extract_templates_streaming(benchmark, workdir, scale):
+    _extract_templates(benchmark, workdir, scale, streaming=True)
+
+
+def _export_master(benchmark, workdir, scale, engine):
+    from datamaps.process import exporter
+
+    lines = generators.datamap_lines(scale.keys)
+    export_dir = Path(workdir) / "export"
+    if export_dir.exists():
+        shutil.rmtree(export_dir)
+    export_dir.mkdir()
+    datamap = generators.write_datamap(export_dir / "datamap.csv", lines)
+    blank = generators.write_blank_template(export_dir / "blank_template.xlsx")
+    master = generators.write_master(
+        export_dir / "master.xlsx", scale.templates, len(lines), key_names=[x.key for x in lines]
+    )
+    with docs_dir(workdir):
+        benchmark(exporter.write_master_to_templates, blank, datamap, master, engine=engine)
+
+
+@scenario
+def export_master(benchmark, workdir, scale):
+    _export_master(benchmark, workdir, scale, "openpyxl")
+
+
+@scenario
+def export_master_xml(benchmark, workdir, scale):
+    _export_master(benchmark, workdir, scale, "xml")
+
+
+def _master_data(scale: Scale):
+    lines = generators.datamap_lines(scale.keys)
+    rng = random.Random(0)
+    return [
+        {f"Project {i}.xlsx": [(line.key, generators.value(rng)) for line in lines]}
+        for i in range(scale.projects)
+    ]
+
+
+@scenario
+def master_output_xlsx(benchmark, workdir, scale):
+    from engine.repository.master import MasterOutputRepository
+
+    data = _master_data(scale)
+    with docs_dir(workdir):
+        benchmark(lambda: MasterOutputRepository(data, "master.xlsx").save())
+
+
+@scenario
+def master_output_csv(benchmark, workdir, scale):
+    from datamaps.process.pipeline import write_master_csv
+
+    data = _master_data(scale)
+    names = [next(iter(column)) for column in data]
+    keys = [key for key, _ in data[0][names[0]]]
+    with docs_dir(workdir) as config:
+
+        def write():
+            columns = [[value for _, value in column[name]] for column, name in zip(data, names)]
+            write_master_csv(config.FULL_PATH_OUTPUT / "master.csv", keys, names, columns)
+
+        benchmark(write)
@@ -0,0 +1,22 @@
+"""Run the scenarios under pytest-benchmark, if it is installed.
+
+The scale defaults to "small"; set DATAMAPS_BENCHMARK_SCALE to change it.
+"""
+import os
+
+import pytest
+
+from datamaps.benchmarks.scenarios import SCALES, SCENARIOS
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.fixture(scope="module")
+def workdir(tmp_path_factory):
+    return tmp_path_factory.mktemp("benchmarks")
+
+
+@pytest.mark.parametrize("name", list(SCENARIOS))
+def test_scenario(benchmark, workdir, name):
+    scale = SCALES[os.environ.get("DATAMAPS_BENCHMARK_SCALE", "small")]
+    SCENARIOS[name](benchmark, workdir, scale)
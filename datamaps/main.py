@@ -24,18 +24,13 @@ from pathlib import Path
 
 import click
 from click import version_option
-from engine.adapters import cli as engine_cli
-from engine.config import Config as engine_config
-from engine.exceptions import (DatamapFileEncodingError,
-                               DatamapNotCSVException,
-                               MalFormedCSVHeaderException,
-                               MissingCellKeyError, MissingLineError,
-                               MissingSheetFieldError, NestedZipError,
-                               NoApplicableSheetsInTemplateFiles,
-                               RemoveFileWithNoSheetRequiredByDatamap)
 
 from datamaps import __version__
 
+# NOTE: bcompiler-engine (and through it openpyxl) is expensive to import, so
+# it is imported inside the commands that need it rather than at module level.
+# This keeps `datamaps --help`, `datamaps config ...` etc. fast.
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s: %(levelname)s - %(message)s",
@@ -60,9 +55,35 @@ class Config:
         self.verbose = False
 
 
+def _engine_config():
+    """Import and initialise the bcompiler-engine configuration.
+
+    Only commands which touch the input/output directories need this, so it is
+    deferred until one of them runs.
+    """
+    from engine.config import Config as engine_config
+
+    engine_config.initialise()
+    return engine_config
+
+
 pass_config = click.make_pass_decorator(Config, ensure=True)
 
 
+class RowLimit(click.ParamType):
+    """A number of rows, or "auto" (``datamaps.process.importer.AUTO_ROW_LIMIT``)."""
+
+    name = "rowlimit"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int) or value == "auto":
+            return value
+        try:
+            return int(value)
+        except ValueError:
+            self.fail(f'{value} is not a number or "auto"', param, ctx)
+
+
 @version_option(__version__)
 @click.group()
 @click.option("--verbose", is_flag=True, help="This currently has no effect.")
@@ -84,7 +105,6 @@ def cli(config, verbose):
         f"Welcome to datamaps {__version__} © 2022 Twenty Four Software", fg="yellow"
     )
     config.verbose = verbose
-    engine_config.initialise()
 
 
 @cli.group("import")
@@ -121,7 +141,16 @@ def _config():
 )
 def restart():
     """Removes the configuration file (config.ini)."""
-    engine_cli.delete_config(engine_config)
+    from engine.config import delete_config_file
+
+    engine_config = _engine_config()
+    try:
+        delete_config_file(engine_config)
+    except FileNotFoundError:
+        logger.critical(
+            f"Could not find {engine_config.DATAMAPS_LIBRARY_CONFIG_FILE}. Run datamaps config restart "
+            "to recreate it and reset defaults."
+        )
 
 
 @_config.command(
@@ -132,7 +161,10 @@ def show_file():
     """
     Shows location of the config file.
     """
-    engine_cli.show_config_file(engine_config)
+    from engine.config import Config as engine_config
+    from engine.config import show_config_file
+
+    show_config_file(engine_config)
 
 
 @_import.command()
@@ -149,9 +181,9 @@ def show_file():
 @click.option("--zipinput", "-z", help="Path to zip containing templates", type=Path, metavar="ZIP_PATH")
 @click.option(
     "--rowlimit",
-    type=int,
-    help="Set row limit to prevent spurious Excel files with hidden rows being processed."
-    "Default is 500.",
+    type=RowLimit(),
+    help="Set row limit to prevent spurious Excel files with hidden rows being processed. "
+    'Default is 500. "auto" reads only as far as the datamap needs.',
 )
 @click.option(
     "--inputdir",
@@ -169,7 +201,122 @@ def show_file():
         " option"
     ),
 )
-def templates(to_master, datamap, zipinput, rowlimit, inputdir, validationonly):
+@click.option(
+    "--timings",
+    "--profile",
+    "timings",
+    is_flag=True,
+    default=False,
+    help=(
+        "Record how long each stage of the import takes for each template, and peak memory use, "
+        "and write them to a timings report (JSON and CSV) in the output directory."
+    ),
+)
+@click.option(
+    "--streaming",
+    is_flag=True,
+    default=False,
+    help=(
+        "Open each template read-only and read only the rows needed by the datamap, "
+        "sheet by sheet, rather than loading the whole template first."
+    ),
+)
+@click.option(
+    "--isolate",
+    is_flag=True,
+    default=False,
+    help=(
+        "Read each template in a process of its own, so that a template which cannot be read "
+        "does not stop the import."
+    ),
+)
+@click.option(
+    "--max-memory",
+    "maxmemory",
+    type=click.IntRange(min=1),
+    metavar="MB",
+    help="The memory a template may use before it is abandoned. Default is 2048. Implies --isolate.",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    metavar="SECONDS",
+    help="How long a template may take before it is abandoned. Default is 300. Implies --isolate.",
+)
+@click.option(
+    "--pipeline",
+    is_flag=True,
+    default=False,
+    help=(
+        "Validate each template and write it to the validation report as soon as it is read, "
+        "keeping only the values needed for the master, rather than reading every template first."
+    ),
+)
+@click.option(
+    "--checkpoint",
+    is_flag=True,
+    default=False,
+    help="Keep the data read from each template until the import has finished, for --resume.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help=(
+        "Carry on with an import which did not finish, without reading the templates already "
+        "read. Implies --checkpoint."
+    ),
+)
+@click.option(
+    "--format",
+    "master_format",
+    type=click.Choice(["xlsx", "csv", "both"]),
+    default="xlsx",
+    show_default=True,
+    help="Write the master (-m) as an Excel file, a CSV file, or both.",
+)
+@click.option(
+    "--dedupe",
+    type=click.Choice(["files", "cells"]),
+    help=(
+        "Leave out templates which are copies of another (files), or whose datamap cells have "
+        "the same values as another's (cells)."
+    ),
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    default=False,
+    help="Keep watching the input directory, updating the master as templates are added or changed.",
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.1),
+    default=2.0,
+    show_default=True,
+    metavar="SECONDS",
+    help="How often --watch checks the input directory.",
+)
+def templates(
+    to_master,
+    datamap,
+    zipinput,
+    rowlimit,
+    inputdir,
+    validationonly,
+    timings,
+    streaming,
+    isolate,
+    maxmemory,
+    timeout,
+    pipeline,
+    checkpoint,
+    resume,
+    master_format,
+    dedupe,
+    watch,
+    interval,
+):
     """Import data to a from populated templates.
 
     Import data from the template files stored in the input directory to create
@@ -188,6 +335,41 @@ def templates(to_master, datamap, zipinput, rowlimit, inputdir, validationonly):
     imperceptible performance improvement gained by reducing this value to as low as possible, but
     its primary purpose is to prevent fatal memory leaks when processing a problematic file.
 
+    Pass --rowlimit auto to set the limit for each sheet from the datamap: each sheet is read only as
+    far as the last row the datamap uses, so long templates are not cut short and short ones are not
+    read further than needed. Before any template is opened, the size each of its sheets claims to be
+    is read from the file; templates with sheets of hundreds of thousands of rows are reported and
+    not imported. This implies --streaming.
+
+    A single broken template can use all the available memory, or never finish. With the --isolate
+    flag (or --max-memory or --timeout), each template is read in a new process, which is stopped
+    if it uses more memory than --max-memory (in MB, default 2048; only on Linux) or takes longer
+    than --timeout (in seconds, default 300). That template is listed as FAIL in the validation
+    report, and the rest of the templates are imported as usual.
+
+    For a large batch, the --pipeline flag reduces memory use: each template is validated, written
+    to the validation report and reduced to the values needed for the master as soon as it has
+    been read, while the next templates are being read. The master is written at the end, without
+    building a full openpyxl workbook in memory. The validation report lists the checks template by
+    template.
+
+    With --checkpoint, the data read from each template is kept until the import has finished. If
+    an import of a large batch stops part of the way through, run it again with the --resume flag:
+    the templates which were read before it stopped are not read again, unless they, the datamap or
+    the options used to read them have changed since. The data is kept apart for each input
+    directory or zip file, so imports from different places do not share it.
+
+    Templates are often in the input directory more than once, for instance when they have been
+    sent twice, or saved again under another name. With --dedupe files, a template which is the
+    same file as another is not read. With --dedupe cells, a template whose datamap cells have the
+    same values as another's is left out as well, although it has to be read to find that out. The
+    first of the copies by file name is kept, and the rest are listed in the validation report.
+
+    With the --watch flag, the import keeps running: the input directory is checked every --interval
+    seconds, and once it has stopped changing, only the templates which are new or have been changed
+    are read, and the master and validation report are written again. The datamap is only read
+    again if it changes. Press Ctrl-C to stop.
+
     Validation is carried out on the data when importing to a master according the 'type' column
     in the datamap. Validation output is currently exported as a CSV file which is saved in the
     output directory after import. If there is no 'type' column in the datamap, no validation
@@ -203,7 +385,37 @@ def templates(to_master, datamap, zipinput, rowlimit, inputdir, validationonly):
     If you only require validation, use the -v flag instead of -m - no master will be produced, only
     a validation report. This may provide another almost inperceptible performance benefit as producing
     the master file is quite expensive.
+
+    If the master is only needed as a table of data, use --format csv to write it as master.csv instead,
+    with the keys in column A and a column for each template, as in master.xlsx. This is written a row
+    at a time and is much quicker than building an Excel file. Use --format both to get both files.
+
+    To find out where the time goes in a large import, use the --timings flag. The time spent parsing
+    the datamap, opening and extracting data from each template, validating and writing the master
+    is written to a timings report (both JSON and CSV) in the output directory, alongside the
+    validation report. Measuring memory use slows the import down, so only use this when needed.
+
+    With the --streaming flag, each template is opened read-only and only the rows of each sheet
+    which contain cells in the datamap are parsed, from top to bottom, once. This is much quicker
+    and uses less memory for large templates, particularly those with a lot of content that the
+    datamap does not use.
     """
+    from engine.exceptions import (DatamapFileEncodingError,
+                                   DatamapNotCSVException,
+                                   MalFormedCSVHeaderException,
+                                   MissingCellKeyError, MissingSheetFieldError,
+                                   NestedZipError,
+                                   NoApplicableSheetsInTemplateFiles,
+                                   RemoveFileWithNoSheetRequiredByDatamap)
+
+    from datamaps.process import importer
+    from datamaps.process.timings import Timings
+
+    engine_config = _engine_config()
+    if timings:
+        timings = Timings()
+    else:
+        timings = None
     if datamap:
         if not datamap.is_absolute():
             datamap = Path.cwd() / datamap
@@ -213,12 +425,37 @@ def templates(to_master, datamap, zipinput, rowlimit, inputdir, validationonly):
     if inputdir:
         if not inputdir.is_absolute():
             inputdir = Path.cwd() / inputdir
+    if timeout is not None and timeout <= 0:
+        logging.critical("Timeout must be more than 0 seconds. Quitting.")
+        sys.exit(1)
+    if isolate or maxmemory or timeout:
+        isolate = True
+        maxmemory = maxmemory or 2048
+        timeout = timeout or 300
     if rowlimit == 0:
         logging.critical("Row limit cannot be 0. Quitting.")
         sys.exit(1)
     if zipinput and inputdir:
         logging.critical("Cannot select both --inputdir and --zipinput/-z flags.")
         sys.exit(1)
+    if watch and zipinput:
+        logging.critical("Cannot watch a zip file. Use --inputdir with --watch.")
+        sys.exit(1)
+    if watch:
+        unwatched = [
+            flag
+            for flag, used in (
+                ("--dedupe", dedupe),
+                ("--pipeline", pipeline),
+                ("--checkpoint", checkpoint),
+                ("--resume", resume),
+                ("--timings", timings),
+            )
+            if used
+        ]
+        if unwatched:
+            logging.critical(f"Cannot use {', '.join(unwatched)} with --watch.")
+            sys.exit(1)
     if to_master and validationonly:
         logging.critical(
             "Cannot select both -m/--to-master and -v/--validationonly flags."
@@ -226,13 +463,24 @@ def templates(to_master, datamap, zipinput, rowlimit, inputdir, validationonly):
         sys.exit(1)
     if validationonly:
         try:
-            engine_cli.import_and_create_master(
+            importer.import_and_create_master(
                 echo_funcs=output_funcs,
+                timings=timings,
                 datamap=datamap,
                 zipinput=zipinput,
                 rowlimit=rowlimit,
                 inputdir=inputdir,
                 validationonly=validationonly,
+                streaming=streaming,
+                isolate=isolate,
+                maxmemory=maxmemory,
+                timeout=timeout,
+                pipeline=pipeline,
+                checkpoint=checkpoint,
+                resume=resume,
+                dedupe=dedupe,
+                watch=watch,
+                interval=interval,
             )
         except MalFormedCSVHeaderException as e:
             click.echo(
@@ -272,12 +520,24 @@ def templates(to_master, datamap, zipinput, rowlimit, inputdir, validationonly):
 
     if to_master:
         try:
-            engine_cli.import_and_create_master(
+            importer.import_and_create_master(
                 echo_funcs=output_funcs,
+                timings=timings,
                 datamap=datamap,
                 zipinput=zipinput,
                 rowlimit=rowlimit,
                 inputdir=inputdir,
+                streaming=streaming,
+                isolate=isolate,
+                maxmemory=maxmemory,
+                timeout=timeout,
+                pipeline=pipeline,
+                checkpoint=checkpoint,
+                resume=resume,
+                format=master_format,
+                dedupe=dedupe,
+                watch=watch,
+                interval=interval,
             )
         except MalFormedCSVHeaderException as e:
             click.echo(
@@ -315,6 +575,13 @@ def templates(to_master, datamap, zipinput, rowlimit, inputdir, validationonly):
             logger.critical(e)
             sys.exit(1)
 
+    if timings is not None and timings.records:
+        timings.stop()
+        json_report, csv_report = timings.write(engine_config.FULL_PATH_OUTPUT)
+        logger.info(f"Timings report written to {json_report} and {csv_report}.")
+        for template, seconds in timings.per_template()[:5]:
+            logger.info(f"{template} took {seconds:.2f}s to import.")
+
 
 @export.command()
 # @click.argument("datamap")
@@ -326,7 +593,14 @@ def templates(to_master, datamap, zipinput, rowlimit, inputdir, validationonly):
 @click.option(
     "--template", "-t", help="Path to blank template (spreadsheet) file.", type=Path,  metavar="TEMPLATE_FILE_PATH"
 )
-def master(master, datamap, template):
+@click.option(
+    "--engine",
+    type=click.Choice(["openpyxl", "xml"]),
+    default="openpyxl",
+    show_default=True,
+    help="Populate the templates with openpyxl, or by patching the blank template's XML (much quicker).",
+)
+def master(master, datamap, template, engine):
     """Export data from a Master file.
 
     Export data from a master file (at MASTER_FILE_PATH). A new populated template
@@ -334,6 +608,14 @@ def master(master, datamap, template):
 
     The default datamap file will be used unless you pass the -d flag with a path to a different file.
     """
+    from engine.exceptions import (DatamapFileEncodingError,
+                                   DatamapNotCSVException,
+                                   MissingCellKeyError, MissingLineError,
+                                   MissingSheetFieldError)
+
+    from datamaps.process import exporter
+
+    engine_config = _engine_config()
     input_dir = engine_config.PLATFORM_DOCS_DIR / "input"
 
     blank_fn = engine_config.config_parser["DEFAULT"]["blank file name"]
@@ -357,7 +639,7 @@ def master(master, datamap, template):
     be_logger.info(f"Exporting master {master} to templates based on {blank}.")
 
     try:
-        engine_cli.write_master_to_templates(blank, datamap_pth, master)
+        exporter.write_master_to_templates(blank, datamap_pth, master, engine=engine)
     except (FileNotFoundError, RuntimeError) as e:
         logger.critical(str(e))
         sys.exit(1)
@@ -380,41 +662,210 @@ def master(master, datamap, template):
 
 
 @report.command()
-@click.argument("target_file")
-def excel_validations(target_file):
-    """Shows any Excel cell-validation code in the target file.
-    Requires the path to the target spreadsheet file. This is different
-    from datamaps validation using the 'type' column in the datamap file."""
-    logger.info(f"Getting Excel data validations from: {target_file}")
+@click.argument("targets", nargs=-1, required=True, metavar="TARGET...")
+@click.option(
+    "--output",
+    "-o",
+    type=Path,
+    metavar="REPORT_FILE_PATH",
+    help="Write the validations to this file - as JSON if it ends in .json, otherwise as CSV.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    help="Number of files to read at once. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Read every file, even those unchanged since the last report.",
+)
+def excel_validations(targets, output, jobs, no_cache):
+    """Shows any Excel cell-validation code in the target files.
+    Each TARGET can be a spreadsheet file, a directory of spreadsheets, a glob
+    pattern such as "templates/*.xlsm" or a zip file of spreadsheets. This is different
+    from datamaps validation using the 'type' column in the datamap file.
+
+    The validations are logged, or, if --output is given, written to a CSV or
+    JSON file as each file is read. The results for each file are remembered,
+    so files which have not changed are not read again next time."""
+    from datamaps.process.excel_validations import (ValidationCache,
+                                                    ValidationReportWriter,
+                                                    expand_targets,
+                                                    report_validations)
+
+    if jobs is not None and jobs < 1:
+        logger.critical("--jobs must be at least 1. Quitting.")
+        sys.exit(1)
+    engine_config = _engine_config()
+    cache = ValidationCache(
+        None
+        if no_cache
+        else Path(engine_config.DATAMAPS_LIBRARY_DATA_DIR) / "excel_validations_cache.json"
+    )
+    writer = ValidationReportWriter(output) if output else None
+    errors = 0
     try:
-        report = engine_cli.report_data_validations_in_file(target_file)
+        with expand_targets(targets) as files:
+            for file_name, validations, error in report_validations(files, cache, jobs):
+                if error:
+                    errors += 1
+                    logger.critical(f"Cannot read {file_name}: {error}")
+                    continue
+                logger.info(f"Getting Excel data validations from: {file_name}")
+                for v in validations:
+                    if writer is not None:
+                        writer.write(v)
+                    else:
+                        logger.info(v.report_line)
     except FileNotFoundError as e:
         logger.critical(e)
         sys.exit(1)
-    for r in report:
-        logger.info(r)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        logger.info(f"{writer.count} Excel validations written to {output}.")
+    if errors:
+        sys.exit(1)
 
 
-@cli.command()
-def check():
+@report.command()
+@click.argument("master_files", nargs=-1, required=True, type=Path, metavar="MASTER_FILE_PATH...")
+@click.option(
+    "--output",
+    "-o",
+    type=Path,
+    metavar="REPORT_FILE_PATH",
+    help="Write the report to this file - as JSON if it ends in .json, otherwise as CSV.",
+)
+@click.option(
+    "--values",
+    is_flag=True,
+    default=False,
+    help="Also report values which would be converted to dates, numbers, percentages or sums of money.",
+)
+def cleansing(master_files, output, values):
+    """Reports how many cells in one or more master files needed cleaning.
+
+    Counts how many times each cleaning rule (removing commas, fixing dashes,
+    converting dates, etc.) is applied when reading the masters, totalled
+    across all of them. By default only the keys in column A are cleaned; use
+    --values to include the typing of values too.
     """
-    Checks for a correctly-named blank template in the input directory and
-    a datamap file in the input directory. Checks for correct headers in datamap.
+    from datamaps.plugins.dft.portfolio import project_data_from_master
+    from datamaps.process import CleansingReport
+
+    cleansing_report = CleansingReport()
+    for master_file in master_files:
+        logger.info(f"Checking cleansing required by {master_file}")
+        try:
+            project_data_from_master(
+                str(master_file), report=cleansing_report, type_values=values
+            )
+        except FileNotFoundError as e:
+            logger.critical(e)
+            sys.exit(1)
+    logger.info(
+        f"{cleansing_report.cleaned} of {cleansing_report.strings} cells required cleaning."
+    )
+    for rule, count in cleansing_report.counts.most_common():
+        logger.info(f"{rule}: {count}")
+    if output:
+        logger.info(f"Cleansing report written to {cleansing_report.write(output)}.")
+
+
+@report.command()
+@click.argument("master_a", type=Path, metavar="MASTER_A")
+@click.argument("master_b", type=Path, metavar="MASTER_B")
+@click.option(
+    "--output",
+    "-o",
+    type=Path,
+    metavar="REPORT_FILE_PATH",
+    help="Path to the CSV report. Defaults to a file in the output directory.",
+)
+def diff(master_a, master_b, output):
+    """Reports what changed between two master files.
+
+    Compares MASTER_A (e.g. last quarter's master) with MASTER_B and writes a CSV
+    report listing each project and key added or removed and each value which
+    has changed. The masters are read a row at a time, so comparing very large
+    masters does not need a lot of memory.
     """
+    from datamaps.plugins.dft.diff import diff_master_files, write_diff_report
+
+    if output is None:
+        engine_config = _engine_config()
+        output = engine_config.FULL_PATH_OUTPUT / f"diff_{master_a.stem}_{master_b.stem}.csv"
+    logger.info(f"Comparing {master_a} with {master_b}")
     try:
-        engine_cli.check_aux_files(engine_config)
-    except MalFormedCSVHeaderException as e:
-        logger.critical(e)
-        sys.exit(1)
-    except MissingSheetFieldError as e:
-        logger.critical(e)
-        sys.exit(1)
-    except MissingCellKeyError as e:
-        logger.critical(e)
-        sys.exit(1)
-    except DatamapFileEncodingError as e:
+        counts = write_diff_report(diff_master_files(master_a, master_b), output)
+    except FileNotFoundError as e:
         logger.critical(e)
         sys.exit(1)
-    except MissingLineError as e:
-        logger.critical(e)
+    for change, count in counts.items():
+        logger.info(f"{change}: {count}")
+    logger.info(f"Diff report written to {output}.")
+
+
+@cli.command()
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    help="Check the files even if they have not changed since they were last checked.",
+)
+def check(no_cache):
+    """
+    Checks for a correctly-named blank template in the input directory and
+    a datamap file in the input directory. Checks for correct headers in datamap,
+    that every line of the datamap is complete and that every sheet and cell
+    reference in the datamap exists in the blank template.
+
+    All problems found are reported at once. The result is remembered, so
+    checking again when neither file has changed is very quick.
+    """
+    from engine.config import check_for_blank, check_for_datamap
+
+    from datamaps.process.checks import ERROR, CheckCache, check_files
+
+    engine_config = _engine_config()
+    input_dir = engine_config.PLATFORM_DOCS_DIR / "input"
+    blank_t = check_for_blank(engine_config)
+    if blank_t[0]:
+        logger.info(f"Blank template named {blank_t[1]} present in input directory.")
+    else:
+        logger.critical(
+            f"No blank template present. Config requires a file called "
+            f"{engine_config.config_parser['DEFAULT']['blank file name']} in input directory."
+        )
+        sys.exit(0)
+    dm_t = check_for_datamap(engine_config)
+    if dm_t[0]:
+        logger.info(f"Datamap file named {dm_t[1]} present in input directory.")
+    else:
+        logger.critical(
+            f"No datamap file present. Config requires a file called "
+            f"{engine_config.config_parser['DEFAULT']['datamap file name']} in input directory."
+        )
+        sys.exit(0)
+    cache = CheckCache(
+        None if no_cache else Path(engine_config.DATAMAPS_LIBRARY_DATA_DIR) / "check_cache.json"
+    )
+    problems, cached = check_files(input_dir / dm_t[1], input_dir / blank_t[1], cache)
+    if cached:
+        logger.info("Datamap and blank template unchanged since last checked.")
+    errors = 0
+    for problem in problems:
+        if problem.severity == ERROR:
+            errors += 1
+            logger.critical(str(problem))
+        else:
+            logger.warning(str(problem))
+    if errors:
+        logger.critical(f"Datamap tests failed with {errors} error(s).")
         sys.exit(1)
+    logger.info("Datamap file passes tests. Check any WARNING messages. Ok to proceed.")
@@ -0,0 +1,187 @@
+"""
+Find what changed between two masters.
+
+Both masters are aligned by project (the header row) and by key (column A),
+and whole rows are compared at once; only the rows which differ are looked at
+cell by cell. Changes are yielded as they are found, so a report can be written
+out without holding the changes - or, when reading from files, the masters -
+in memory.
+"""
+import csv
+import logging
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Set, Tuple
+
+from datamaps.plugins.dft.portfolio import iter_master_rows
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ADDED = "project added"
+PROJECT_REMOVED = "project removed"
+KEY_ADDED = "key added"
+KEY_REMOVED = "key removed"
+VALUE_CHANGED = "value changed"
+DUPLICATE_KEY = "duplicate key"
+
+ROW = Tuple[Any, Tuple[Any, ...]]
+
+
+class Change(NamedTuple):
+    """A single difference between two masters.
+
+    ``project`` is ``None`` for added or removed keys and ``key`` is ``None``
+    for added or removed projects. A ``DUPLICATE_KEY`` change has the values
+    of the repeated row as ``old`` when it is in the first master and as
+    ``new`` when it is in the second.
+    """
+
+    change: str
+    project: Optional[str]
+    key: Optional[str]
+    old: Any = None
+    new: Any = None
+
+
+def _getter(indexes: Sequence[int]):
+    """Return a function taking a row and returning the values at ``indexes``, as a tuple."""
+    if not indexes:
+        return lambda row: ()
+    if len(indexes) == 1:
+        i = indexes[0]
+        return lambda row: (row[i],)
+    return itemgetter(*indexes)
+
+
+def diff_rows(
+    a_projects: Sequence[str],
+    a_rows: Iterable[ROW],
+    b_projects: Sequence[str],
+    b_rows: Iterable[ROW],
+) -> Iterator[Change]:
+    """Yield the differences between two masters given as rows.
+
+    Each row is a ``(key, values)`` pair, where ``values`` has one item per
+    project, in the order given by ``a_projects``/``b_projects``. The two sets
+    of rows are consumed together, so when both masters have their keys in the
+    same order only the rows which have no partner yet are held in memory.
+
+    A key should appear once in each master. Only the first row for a key is
+    compared; each later row with the same key is reported as a
+    ``DUPLICATE_KEY`` change rather than being dropped.
+    """
+    b_set = set(b_projects)
+    a_set = set(a_projects)
+    for p in a_projects:
+        if p not in b_set:
+            yield Change(PROJECT_REMOVED, p, None)
+    for p in b_projects:
+        if p not in a_set:
+            yield Change(PROJECT_ADDED, p, None)
+    common = [p for p in a_projects if p in b_set]
+    a_common = _getter([a_projects.index(p) for p in common])
+    b_common = _getter([b_projects.index(p) for p in common])
+
+    def compare(key, a_values, b_values):
+        a_values = a_common(a_values)
+        b_values = b_common(b_values)
+        if a_values == b_values:
+            return
+        for project, old, new in zip(common, a_values, b_values):
+            if old != new:
+                yield Change(VALUE_CHANGED, project, key, old, new)
+
+    def duplicate(key, seen, values, master):
+        if key not in seen:
+            seen.add(key)
+            return None
+        logger.warning(
+            f"Key {key} appears more than once in the {master} master; "
+            "only its first row is compared"
+        )
+        if master == "first":
+            return Change(DUPLICATE_KEY, None, key, old=values)
+        return Change(DUPLICATE_KEY, None, key, new=values)
+
+    pending_a: Dict[Any, Tuple] = {}
+    pending_b: Dict[Any, Tuple] = {}
+    a_seen: Set[Any] = set()
+    b_seen: Set[Any] = set()
+    a_iter = iter(a_rows)
+    b_iter = iter(b_rows)
+    a_done = b_done = False
+    while not (a_done and b_done):
+        if not a_done:
+            try:
+                key, values = next(a_iter)
+            except StopIteration:
+                a_done = True
+            else:
+                dup = duplicate(key, a_seen, values, "first")
+                if dup is not None:
+                    yield dup
+                elif key in pending_b:
+                    yield from compare(key, values, pending_b.pop(key))
+                else:
+                    pending_a[key] = values
+        if not b_done:
+            try:
+                key, values = next(b_iter)
+            except StopIteration:
+                b_done = True
+            else:
+                dup = duplicate(key, b_seen, values, "second")
+                if dup is not None:
+                    yield dup
+                elif key in pending_a:
+                    yield from compare(key, pending_a.pop(key), values)
+                else:
+                    pending_b[key] = values
+    for key in pending_a:
+        yield Change(KEY_REMOVED, None, key)
+    for key in pending_b:
+        yield Change(KEY_ADDED, None, key)
+
+
+def diff_data(a: Dict[str, Dict], b: Dict[str, Dict]) -> Iterator[Change]:
+    """Yield the differences between two sets of master data, as returned by
+    :py:func:`datamaps.plugins.dft.portfolio.project_data_from_master`."""
+    return diff_rows(list(a), _data_rows(a), list(b), _data_rows(b))
+
+
+def _data_rows(data: Dict[str, Dict]) -> Iterator[ROW]:
+    columns = list(data.values())
+    if not columns:
+        return
+    # every project in a master has the same keys, those in column A
+    for key in columns[0]:
+        yield key, tuple(column.get(key) for column in columns)
+
+
+def diff_master_files(a_file: Path, b_file: Path) -> Iterator[Change]:
+    """Yield the differences between two master files, reading both a row at a time."""
+    a_projects, a_rows = iter_master_rows(a_file)
+    b_projects, b_rows = iter_master_rows(b_file)
+    return diff_rows(a_projects, a_rows, b_projects, b_rows)
+
+
+def write_diff_report(changes: Iterable[Change], path: Path) -> Dict[str, int]:
+    """Write ``changes`` to a CSV file at ``path`` as they arrive.
+
+    Returns the number of each kind of change written.
+    """
+    counts: Dict[str, int] = {
+        PROJECT_ADDED: 0,
+        PROJECT_REMOVED: 0,
+        KEY_ADDED: 0,
+        KEY_REMOVED: 0,
+        VALUE_CHANGED: 0,
+        DUPLICATE_KEY: 0,
+    }
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Change", "Project", "Key", "Old value", "New value"])
+        for c in changes:
+            counts[c.change] += 1
+            writer.writerow(c)
+    return counts
@@ -3,10 +3,15 @@ import logging
 import re
 import unicodedata
 from pathlib import Path
-from typing import Any, Iterable, List, Optional, Tuple
+from typing import Any, Iterable, Iterator, List, Mapping, Optional, Tuple
 
 from datamaps.core.temporal import Quarter
+from datamaps.plugins.dft.diff import Change, diff_data
+from datamaps.plugins.dft.metrics import Metrics, get_metrics, timed
 from datamaps.plugins.dft.portfolio import project_data_from_master
+from datamaps.plugins.dft.query import Query
+from datamaps.plugins.dft.snapshot import ProjectView, Snapshot, write_snapshot
+from datamaps.plugins.dft.sqlite import SQLiteMasterData, save_master
 from datamaps.process.cleansers import DATE_REGEX_4
 from openpyxl import load_workbook
 
@@ -18,7 +23,7 @@ class ProjectData:
     ProjectData class
     """
 
-    def __init__(self, d: dict) -> None:
+    def __init__(self, d: Mapping) -> None:
         """
         :py:func:`OrderedDict` is easiest to get from project_data_from_master[x]
         """
@@ -100,13 +105,58 @@ class ProjectData:
         return f"ProjectData() - with data: {id(self._data)}"
 
 
+class SnapshotProjectData(ProjectData):
+    """
+    ProjectData for a project in a master snapshot (see :py:meth:`Master.from_snapshot`).
+
+    ``pull_keys`` only decodes the requested keys.
+    """
+
+    def __init__(self, view: ProjectView) -> None:
+        super().__init__(view)
+        self._view = view
+
+    def pull_keys(self, input_iter: Iterable, flat=False) -> List[Tuple[Any, ...]]:
+        return ProjectData(self._view.subset(input_iter)).pull_keys(input_iter, flat)
+
+
+class SQLiteProjectData(ProjectData):
+    """
+    ProjectData for a project in a master stored in SQLite (see :py:meth:`Master.from_sqlite`).
+
+    ``pull_keys`` only reads the requested keys from the database; the whole
+    project is only read if needed for anything else.
+    """
+
+    def __init__(self, master_data: SQLiteMasterData, project: str) -> None:
+        if project not in master_data:
+            raise KeyError(project)
+        self._master_data = master_data
+        self._project = project
+        self._loaded: Optional[dict] = None
+
+    @property
+    def _data(self):
+        if self._loaded is None:
+            self._loaded = self._master_data[self._project]
+        return self._loaded
+
+    def pull_keys(self, input_iter: Iterable, flat=False) -> List[Tuple[Any, ...]]:
+        if self._loaded is not None:
+            return super().pull_keys(input_iter, flat)
+        # fetch every key which could match, then match exactly as ProjectData does
+        subset = self._master_data.project_keys(self._project, input_iter)
+        return ProjectData(subset).pull_keys(input_iter, flat)
+
+
 def _convert_str_date_to_object(d_str: tuple) -> Tuple[str, Optional[datetime.date]]:
     try:
         if re.match(DATE_REGEX_4, d_str[1]):
             try:
                 ds = d_str[1].split("-")
                 return (d_str[0], datetime.date(int(ds[0]), int(ds[1]), int(ds[2])))
-            except TypeError:
+            except (TypeError, ValueError):
+                # e.g. "20/08/2011" matches DATE_REGEX_4 but is not split by "-"
                 return d_str
         else:
             return d_str
@@ -120,6 +170,13 @@ class Master:
     Args:
         quarter (:py:class:`bcompiler.api.Quarter`): creating using ``Quarter(1, 2017)`` for example.
         path (str): path to the master xlsx file
+        metrics (:py:class:`datamaps.plugins.dft.metrics.Metrics`): optional collector for
+            load timings and counters; the process-wide collector is used if not given.
+        type_values (bool): if True, string values which look like dates, numbers,
+            percentages or sums of money are converted when the master is loaded.
+        engine (str): ``"xml"`` to read the master file's XML directly, which is quicker,
+            rather than with openpyxl (``"openpyxl"``, the default). See
+            :py:func:`datamaps.plugins.dft.portfolio.project_data_from_master`.
 
     A master object is a composition between a :py:class:`datamaps.api.Quarter` object and an
     actual master xlsx file on disk.
@@ -151,9 +208,23 @@ class Master:
     """
 
     def __init__(
-        self, quarter: Quarter, path: str, declared_month: Optional[int] = None
+        self,
+        quarter: Quarter,
+        path: str,
+        declared_month: Optional[int] = None,
+        metrics: Optional[Metrics] = None,
+        type_values: bool = False,
+        engine: str = "openpyxl",
     ) -> None:
+        self._setup(quarter, path, declared_month, metrics)
+        self._data = project_data_from_master(
+            self.path, metrics=metrics, type_values=type_values, engine=engine
+        )
+        self._project_titles = [item for item in self.data.keys()]
+
+    def _setup(self, quarter, path, declared_month, metrics) -> None:
         self._quarter = quarter
+        self._metrics = metrics
         self._declared_month = declared_month
         self.path = path
         if self._declared_month:
@@ -162,10 +233,111 @@ class Master:
             self.year = self._quarter.months[m_idx].year
         else:
             self.year = self._quarter.year
-        self._data = project_data_from_master(self.path)
-        self._project_titles = [item for item in self.data.keys()]
+
+    @classmethod
+    def from_data(
+        cls,
+        quarter: Quarter,
+        data: dict,
+        path: str,
+        declared_month: Optional[int] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> "Master":
+        """Create a Master from project data already in memory, rather than from a file.
+
+        Args:
+            quarter (:py:class:`datamaps.api.Quarter`): the quarter of the data
+            data (dict): the data for each project, by project name, in the form returned
+                by :py:func:`datamaps.plugins.dft.portfolio.project_data_from_master`
+            path (str): the path the master has been, or would be, saved to
+        """
+        m = cls.__new__(cls)
+        m._setup(quarter, path, declared_month, metrics)
+        m._data = data
+        m._project_titles = list(data)
+        return m
+
+    @classmethod
+    def from_sqlite(cls, db_path: str, name: str, metrics: Optional[Metrics] = None) -> "Master":
+        """Open a master saved in a SQLite database with :py:meth:`Master.to_sqlite`.
+
+        Args:
+            db_path (str): path to the SQLite database
+            name (str): the name the master was saved under - by default, its filename
+
+        The master xlsx file is not read. Project data is read from the database
+        as it is needed, so ``m[project]`` and ``m[project].pull_keys(...)`` are
+        indexed lookups.
+        """
+        data = SQLiteMasterData(db_path, name)
+        m = cls.__new__(cls)
+        m._setup(Quarter(data.quarter, data.year), data.path, data.declared_month, metrics)
+        m._data = data
+        m._project_titles = list(data)
+        return m
+
+    def to_sqlite(self, db_path: str, name: Optional[str] = None) -> str:
+        """Save this master to a SQLite database, to be opened with :py:meth:`Master.from_sqlite`.
+
+        Args:
+            db_path (str): path to the SQLite database, which is created if it does not exist
+            name (str): the name to save the master under - by default, its filename.
+                Any master already saved under this name is replaced.
+
+        Returns:
+            The name the master was saved under.
+        """
+        if name is None:
+            name = self.filename
+        save_master(
+            db_path,
+            name,
+            self._data,
+            path=self.path,
+            quarter=self._quarter.quarter,
+            year=self._quarter.year,
+            declared_month=self._declared_month,
+        )
+        return name
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path: str, metrics: Optional[Metrics] = None) -> "Master":
+        """Open a master snapshot written by :py:meth:`Master.to_snapshot`.
+
+        Args:
+            snapshot_path (str): path to the snapshot file
+
+        The snapshot is mapped into memory rather than read, so any number of
+        processes can open the same snapshot and share one copy of it. Values
+        are decoded as they are read.
+        """
+        data = Snapshot(snapshot_path)
+        m = cls.__new__(cls)
+        m._setup(Quarter(data.quarter, data.year), data.master_path, data.declared_month, metrics)
+        m._data = data
+        m._project_titles = list(data)
+        return m
+
+    def to_snapshot(self, snapshot_path: str) -> Path:
+        """Write this master to a snapshot file, to be opened with :py:meth:`Master.from_snapshot`.
+
+        Args:
+            snapshot_path (str): path to the snapshot file, which is replaced if it exists
+        """
+        return write_snapshot(
+            snapshot_path,
+            self._data,
+            master_path=self.path,
+            quarter=self._quarter.quarter,
+            year=self._quarter.year,
+            declared_month=self._declared_month,
+        )
 
     def __getitem__(self, project_name):
+        if isinstance(self._data, SQLiteMasterData):
+            return SQLiteProjectData(self._data, project_name)
+        if isinstance(self._data, Snapshot):
+            return SnapshotProjectData(self._data[project_name])
         return ProjectData(self._data[project_name])
 
     @property
@@ -244,7 +416,8 @@ class Master:
         Returns:
             duplicates (set): a set of duplicated keys
         """
-        wb = load_workbook(self.path)
+        with timed(get_metrics(self._metrics), "master.duplicate_keys", master=self.filename):
+            wb = load_workbook(self.path)
         ws = wb.active
         col_a = next(ws.iter_cols())
         col_a = [item.value for item in col_a]
@@ -271,6 +444,34 @@ class Master:
         else:
             return False
 
+    def query(self) -> Query:
+        """Start a query over the projects in this master.
+
+        Example::
+
+            q = m1.query().select("Total Budget").where("DCA", "==", "Red")
+            red_projects = q.results()
+
+        See :py:class:`datamaps.plugins.dft.query.Query`.
+        """
+        return Query(self)
+
+    def diff(self, other: "Master") -> Iterator[Change]:
+        """Find what has changed between this master and ``other``.
+
+        Args:
+            other (:py:class:`Master`): the later master, e.g. for the following quarter.
+
+        Returns:
+            An iterator of :py:class:`datamaps.plugins.dft.diff.Change` tuples -
+            ``(change, project, key, old, new)`` - for each project or key added or
+            removed and each value changed. For example::
+
+                for change in m1.diff(m2):
+                    print(change.project, change.key, change.old, change.new)
+        """
+        return diff_data(self._data, other.data)
+
     def __repr__(self):
         if self._declared_month:
             return f"Master for {self.month} - {self.month.year}({self.path}, {self.quarter.quarter}, {self.quarter.year})"
@@ -0,0 +1,86 @@
+"""
+Instrumentation hooks for loading masters.
+
+By default nothing is recorded. To export timings and counters to your own
+metrics system, subclass :py:class:`Metrics` and either install it for the whole
+process::
+
+    from datamaps.plugins.dft.metrics import Metrics, set_metrics
+
+    class StatsdMetrics(Metrics):
+        def timing(self, name, seconds, **tags):
+            statsd.timing(name, seconds * 1000, tags=tags)
+
+        def count(self, name, value=1, **tags):
+            statsd.increment(name, value, tags=tags)
+
+    set_metrics(StatsdMetrics())
+
+or pass it to a single load, e.g. ``Master(quarter, path, metrics=StatsdMetrics())``.
+
+:py:class:`InMemoryMetrics` keeps everything in memory, which is useful in tests.
+"""
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class Metrics:
+    """The no-op metrics collector used unless another is installed."""
+
+    def timing(self, name: str, seconds: float, **tags: Any) -> None:
+        """Record that ``name`` took ``seconds``."""
+
+    def count(self, name: str, value: int = 1, **tags: Any) -> None:
+        """Add ``value`` to the counter ``name``."""
+
+
+class InMemoryMetrics(Metrics):
+    """Collects timings and counters in memory.
+
+    Timings are kept as a list of durations per name; counters are summed.
+    Every call is also kept, with its tags, in ``events``.
+    """
+
+    def __init__(self) -> None:
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.events: List[Tuple[str, str, Any, Dict[str, Any]]] = []
+
+    def timing(self, name: str, seconds: float, **tags: Any) -> None:
+        self.timings[name].append(seconds)
+        self.events.append(("timing", name, seconds, tags))
+
+    def count(self, name: str, value: int = 1, **tags: Any) -> None:
+        self.counts[name] += value
+        self.events.append(("count", name, value, tags))
+
+    def clear(self) -> None:
+        self.timings.clear()
+        self.counts.clear()
+        self.events.clear()
+
+
+_metrics: Metrics = Metrics()
+
+
+def set_metrics(metrics: Optional[Metrics]) -> None:
+    """Install ``metrics`` as the process-wide collector (``None`` restores the no-op)."""
+    global _metrics
+    _metrics = metrics if metrics is not None else Metrics()
+
+
+def get_metrics(metrics: Optional[Metrics] = None) -> Metrics:
+    """Return ``metrics`` if given, otherwise the process-wide collector."""
+    return metrics if metrics is not None else _metrics
+
+
+@contextmanager
+def timed(metrics: Metrics, name: str, **tags: Any):
+    """Record the time taken by the enclosed block as ``name``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timing(name, time.perf_counter() - start, **tags)
@@ -0,0 +1,178 @@
+"""
+Querying masters.
+
+A :py:class:`Query` picks out projects by the values of their keys, e.g. the
+projects whose DCA rating is Red and whose total budget is over £50m::
+
+    q = (
+        master.query()
+        .select("Project/Programme Name", "Total Budget")
+        .where("DCA", "==", "Red")
+        .where("Total Budget", ">", 50_000_000)
+    )
+    for project, values in q.results().items():
+        ...
+
+The values of each key used are gathered into a column, one value per project,
+and the ``where`` conditions are checked against those columns; keys which the
+query does not use are never looked at. Querying a file with
+:py:meth:`Query.from_file` goes further and only reads the rows of the master
+for those keys.
+"""
+import operator
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from datamaps.plugins.dft.portfolio import iter_master_rows
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "in": lambda value, options: value in options,
+    "contains": lambda value, part: part in value,
+}
+
+PREDICATE = Callable[[Any], bool]
+
+
+def _predicate(op: Union[str, PREDICATE], operand: Any) -> PREDICATE:
+    if callable(op):
+        func = op
+    else:
+        try:
+            compare = OPERATORS[op]
+        except KeyError:
+            raise ValueError(
+                f"{op} is not a valid operator. Use one of {', '.join(OPERATORS)} or a function."
+            )
+
+        def func(value):
+            return compare(value, operand)
+
+    def safe(value):
+        # a comparison which makes no sense for the value (e.g. None > 10) is not a match
+        try:
+            return bool(func(value))
+        except TypeError:
+            return False
+
+    return safe
+
+
+class Query:
+    """A query over the projects in a master.
+
+    Create one with :py:meth:`datamaps.plugins.dft.master.Master.query` or
+    :py:meth:`Query.from_file`. Each method returns a new query, so queries can
+    be built up a step at a time and reused.
+    """
+
+    def __init__(self, master=None, master_file=None, type_values: bool = False) -> None:
+        self._master = master
+        self._master_file = master_file
+        self._type_values = type_values
+        self._keys: Optional[Tuple[str, ...]] = None
+        self._conditions: List[Tuple[str, PREDICATE]] = []
+        self._project_filter: Optional[PREDICATE] = None
+
+    @classmethod
+    def from_file(cls, master_file, type_values: bool = False) -> "Query":
+        """Query a master file without loading it all.
+
+        Only the rows for the keys used by the query are read when it is run.
+        If ``type_values`` is True, values in those rows which look like dates,
+        numbers, percentages or sums of money are converted, as by ``Master``.
+        """
+        return cls(master_file=master_file, type_values=type_values)
+
+    def _copy(self) -> "Query":
+        q = Query(self._master, self._master_file, self._type_values)
+        q._keys = self._keys
+        q._conditions = list(self._conditions)
+        q._project_filter = self._project_filter
+        return q
+
+    def select(self, *keys: str) -> "Query":
+        """Only return the values for ``keys``, in that order. By default all keys are returned."""
+        q = self._copy()
+        q._keys = keys
+        return q
+
+    def where(self, key: str, op: Union[str, PREDICATE], value: Any = None) -> "Query":
+        """Only return projects where the value of ``key`` matches.
+
+        ``op`` is one of ``==``, ``!=``, ``>``, ``>=``, ``<``, ``<=``, ``in`` or
+        ``contains``, compared against ``value``, or a function taking the
+        value and returning True or False. Values which cannot be compared
+        (e.g. an empty cell with ``>``) do not match.
+        """
+        q = self._copy()
+        q._conditions.append((key, _predicate(op, value)))
+        return q
+
+    def projects(self, *names: str, where: Optional[PREDICATE] = None) -> "Query":
+        """Only return the projects called ``names``, or whose name matches the function ``where``."""
+        q = self._copy()
+        if names:
+            wanted = set(names)
+            q._project_filter = lambda name: name in wanted
+        else:
+            q._project_filter = where
+        return q
+
+    def _columns(self, keys: Optional[set]) -> Tuple[List[Any], Dict[str, Tuple[Any, ...]]]:
+        """Return the project names and a column of values for each of ``keys``."""
+        if self._master_file is not None:
+            projects, rows = iter_master_rows(
+                self._master_file, keys=keys, type_values=self._type_values
+            )
+            return projects, OrderedDict(rows)
+        data = self._master.data
+        projects = list(data)
+        columns: Iterable[str] = []
+        if keys is not None:
+            columns = keys
+        elif projects:
+            columns = data[projects[0]].keys()
+        return projects, OrderedDict(
+            (key, tuple(data[p].get(key) for p in projects))
+            for key in columns
+            if not projects or key in data[projects[0]]
+        )
+
+    def results(self) -> "OrderedDict[str, OrderedDict[str, Any]]":
+        """Run the query.
+
+        Returns:
+            An ``OrderedDict`` of the matching projects, in master order, each
+            an ``OrderedDict`` of the selected keys and their values.
+
+        Raises:
+            KeyError: if a key used by the query is not in the master.
+        """
+        if self._keys is None:
+            needed = None
+        else:
+            needed = set(self._keys).union(key for key, _ in self._conditions)
+        projects, columns = self._columns(needed)
+        for key in list(self._keys or []) + [key for key, _ in self._conditions]:
+            if key not in columns:
+                raise KeyError(f"{key} is not a key in the master")
+        candidates: Sequence[int] = range(len(projects))
+        if self._project_filter is not None:
+            candidates = [i for i in candidates if self._project_filter(projects[i])]
+        for key, predicate in self._conditions:
+            column = columns[key]
+            candidates = [i for i in candidates if predicate(column[i])]
+        keys = list(columns) if self._keys is None else self._keys
+        return OrderedDict(
+            (projects[i], OrderedDict((key, columns[key][i]) for key in keys))
+            for i in candidates
+        )
+
+    def __iter__(self) -> Iterator[Tuple[str, "OrderedDict[str, Any]"]]:
+        return iter(self.results().items())
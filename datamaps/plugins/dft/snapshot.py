@@ -0,0 +1,283 @@
+"""
+A compact, read-only snapshot format for masters, opened with ``mmap``.
+
+When several worker processes each load the same master they each hold their
+own copy of it in memory. A master written to a snapshot with
+:py:meth:`Master.to_snapshot` and opened with :py:meth:`Master.from_snapshot`
+is instead mapped into memory straight from the file, so the operating system
+keeps one copy of it however many processes have it open. Values are only
+decoded when they are asked for.
+
+The file is laid out as::
+
+    header         magic (with the format version), counts, the master's quarter
+                   and the offsets of each section below
+    string offsets n_strings + 1 little-endian uint64s, into the string data
+    string data    every distinct string (project names, keys and text values), UTF-8
+    projects       n_projects uint32 string numbers
+    keys           n_keys uint32 string numbers (NO_STRING for a project or key of None)
+    cells          n_projects * n_keys cells of 9 bytes - a type byte and an
+                   8-byte value - one project after another, in key order
+
+Numbers are stored in the cell itself; text is stored as a string number, and
+dates and times as integers.
+"""
+import datetime
+import mmap
+import os
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+from datamaps.plugins.dft.portfolio import match_key
+
+MAGIC = b"DMSNAP\x00\x02"
+
+# magic, n_strings, n_projects, n_keys, quarter, year, declared_month, path string,
+# offsets of: string offsets, string data, projects, keys, cells
+_HEADER = struct.Struct("<8s3I3iq5Q")
+_CELL = struct.Struct("<Bq")
+_CELL_FLOAT = struct.Struct("<Bd")
+NO_STRING = 0xFFFFFFFF
+
+MISSING, NONE, INT, FLOAT, STRING, BOOL, DATE, DATETIME, TIME, BIGINT = range(10)
+
+_EPOCH = datetime.datetime(1, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+_INT64 = (-(2 ** 63), 2 ** 63 - 1)
+
+
+class _Strings:
+    def __init__(self) -> None:
+        self.index: Dict[str, int] = {}
+
+    def add(self, s: str) -> int:
+        try:
+            return self.index[s]
+        except KeyError:
+            self.index[s] = n = len(self.index)
+            return n
+
+    def add_name(self, name: Any) -> int:
+        """Add a project name or key, keeping ``None`` apart from the text "None"."""
+        return NO_STRING if name is None else self.add(str(name))
+
+
+def _encode(value: Any, strings: _Strings) -> bytes:
+    if value is None:
+        return _CELL.pack(NONE, 0)
+    if isinstance(value, bool):
+        return _CELL.pack(BOOL, int(value))
+    if isinstance(value, int):
+        if _INT64[0] <= value <= _INT64[1]:
+            return _CELL.pack(INT, value)
+        return _CELL.pack(BIGINT, strings.add(str(value)))
+    if isinstance(value, float):
+        return _CELL_FLOAT.pack(FLOAT, value)
+    if isinstance(value, datetime.datetime):
+        return _CELL.pack(DATETIME, (value.replace(tzinfo=None) - _EPOCH) // _MICROSECOND)
+    if isinstance(value, datetime.date):
+        return _CELL.pack(DATE, value.toordinal())
+    if isinstance(value, datetime.time):
+        micro = ((value.hour * 60 + value.minute) * 60 + value.second) * 10 ** 6
+        return _CELL.pack(TIME, micro + value.microsecond)
+    return _CELL.pack(STRING, strings.add(str(value)))
+
+
+def write_snapshot(
+    path: Union[str, Path],
+    data: Mapping,
+    master_path: Optional[str] = None,
+    quarter: int = 0,
+    year: int = 0,
+    declared_month: Optional[int] = None,
+) -> Path:
+    """Write master data, as returned by
+    :py:func:`datamaps.plugins.dft.portfolio.project_data_from_master`, to a
+    snapshot file at ``path``.
+
+    The snapshot is written to a temporary file first and moved into place,
+    so processes which already have the old snapshot open are not affected.
+    """
+    path = Path(path)
+    strings = _Strings()
+    projects = list(data)
+    keys: List[Any] = list(dict.fromkeys(k for p in projects for k in data[p]))
+    project_ids = [strings.add_name(p) for p in projects]
+    key_ids = [strings.add_name(k) for k in keys]
+    path_id = strings.add("" if master_path is None else str(master_path))
+    cells = bytearray()
+    missing = _CELL.pack(MISSING, 0)
+    for p in projects:
+        values = data[p]
+        for k in keys:
+            cells += _encode(values[k], strings) if k in values else missing
+    encoded = [s.encode("utf-8") for s in strings.index]
+    string_offsets = [0]
+    for s in encoded:
+        string_offsets.append(string_offsets[-1] + len(s))
+
+    offsets_at = _HEADER.size
+    data_at = offsets_at + 8 * len(string_offsets)
+    projects_at = data_at + string_offsets[-1]
+    keys_at = projects_at + 4 * len(projects)
+    cells_at = keys_at + 4 * len(keys)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(
+            _HEADER.pack(
+                MAGIC, len(encoded), len(projects), len(keys), quarter, year,
+                declared_month or 0, path_id, offsets_at, data_at, projects_at, keys_at, cells_at,
+            )
+        )
+        f.write(struct.pack(f"<{len(string_offsets)}Q", *string_offsets))
+        f.write(b"".join(encoded))
+        f.write(struct.pack(f"<{len(projects)}I", *project_ids))
+        f.write(struct.pack(f"<{len(keys)}I", *key_ids))
+        f.write(cells)
+    os.replace(tmp, path)
+    return path
+
+
+class Snapshot(Mapping):
+    """A master snapshot file, mapped into memory.
+
+    This behaves like the dictionary returned by
+    :py:func:`datamaps.plugins.dft.portfolio.project_data_from_master`,
+    mapping project names to a :py:class:`ProjectView` of their keys and values.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mmap)
+        (
+            magic, self._n_strings, n_projects, self._n_keys, self.quarter, self.year,
+            declared_month, path_id, self._offsets_at, self._data_at, projects_at,
+            keys_at, self._cells_at,
+        ) = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a datamaps master snapshot")
+        self.declared_month = declared_month or None
+        self.master_path = self.string(path_id) or None
+        self.projects = [
+            self.name(i) for i in struct.unpack_from(f"<{n_projects}I", self._buf, projects_at)
+        ]
+        self._project_index = {p: i for i, p in enumerate(self.projects)}
+        self._key_ids = struct.unpack_from(f"<{self._n_keys}I", self._buf, keys_at)
+        self._key_index: Optional[Dict[Optional[str], int]] = None
+        self._key_names: Optional[List[Optional[str]]] = None
+        self._match_index: Optional[Dict[str, List[int]]] = None
+
+    def close(self) -> None:
+        self._buf.release()
+        self._mmap.close()
+
+    def string(self, n: int) -> str:
+        start, end = struct.unpack_from("<2Q", self._buf, self._offsets_at + 8 * n)
+        return str(self._buf[self._data_at + start: self._data_at + end], "utf-8")
+
+    def name(self, n: int) -> Optional[str]:
+        """A project name or key, which may be ``None``."""
+        return None if n == NO_STRING else self.string(n)
+
+    @property
+    def keys_index(self) -> Dict[Optional[str], int]:
+        """The position of each key, in master order."""
+        if self._key_index is None:
+            self._key_index = {self.name(k): i for i, k in enumerate(self._key_ids)}
+        return self._key_index
+
+    @property
+    def key_names(self) -> List[Optional[str]]:
+        """The keys, in master order."""
+        if self._key_names is None:
+            self._key_names = list(self.keys_index)
+        return self._key_names
+
+    def matching_keys(self, keys: Iterable[Any]) -> List[int]:
+        """The positions of the keys which ``ProjectData.pull_keys`` could match to ``keys``."""
+        if self._match_index is None:
+            self._match_index = {}
+            for key, i in self.keys_index.items():
+                self._match_index.setdefault(match_key(key), []).append(i)
+        found: Set[int] = set()
+        for k in keys:
+            for name in (k, match_key(k)):
+                found.update(self._match_index.get(name, ()))
+        return sorted(found)
+
+    def has_value(self, project: int, key: int) -> bool:
+        """Whether ``project`` has ``key`` (every project in a master normally has every key)."""
+        at = self._cells_at + _CELL.size * (project * self._n_keys + key)
+        return bool(self._buf[at] != MISSING)
+
+    def value(self, project: int, key: int) -> Any:
+        at = self._cells_at + _CELL.size * (project * self._n_keys + key)
+        kind, raw = _CELL.unpack_from(self._buf, at)
+        if kind == INT:
+            return raw
+        if kind == STRING:
+            return self.string(raw)
+        if kind == NONE:
+            return None
+        if kind == FLOAT:
+            return _CELL_FLOAT.unpack_from(self._buf, at)[1]
+        if kind == DATE:
+            return datetime.date.fromordinal(raw)
+        if kind == DATETIME:
+            return _EPOCH + raw * _MICROSECOND
+        if kind == BOOL:
+            return bool(raw)
+        if kind == TIME:
+            seconds, micro = divmod(raw, 10 ** 6)
+            minutes, second = divmod(seconds, 60)
+            return datetime.time(minutes // 60, minutes % 60, second, micro)
+        if kind == BIGINT:
+            return int(self.string(raw))
+        raise KeyError(key)
+
+    def __getitem__(self, project: Optional[str]) -> "ProjectView":
+        return ProjectView(self, self._project_index[project])
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        return iter(self.projects)
+
+    def __len__(self) -> int:
+        return len(self.projects)
+
+    def __contains__(self, project: object) -> bool:
+        return project in self._project_index
+
+
+class ProjectView(Mapping):
+    """The keys and values of one project in a :py:class:`Snapshot`, decoded as they are read."""
+
+    def __init__(self, snapshot: Snapshot, project: int) -> None:
+        self._snapshot = snapshot
+        self._project = project
+
+    def __getitem__(self, key: Optional[str]) -> Any:
+        return self._snapshot.value(self._project, self._snapshot.keys_index[key])
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        for key, i in self._snapshot.keys_index.items():
+            if self._snapshot.has_value(self._project, i):
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def subset(self, keys: Iterable[Any]) -> Dict[Optional[str], Any]:
+        """Return the keys and values which ``ProjectData.pull_keys`` could match to ``keys``,
+        without decoding any others."""
+        snapshot = self._snapshot
+        names = snapshot.key_names
+        return {
+            names[i]: snapshot.value(self._project, i)
+            for i in snapshot.matching_keys(keys)
+            if snapshot.has_value(self._project, i)
+        }
@@ -0,0 +1,230 @@
+"""
+Storing masters in a SQLite database.
+
+Parsing a master xlsx file is slow. Once a master has been saved to a SQLite
+database with :py:func:`save_master` (or :py:meth:`Master.to_sqlite`), it can be
+opened again with :py:meth:`Master.from_sqlite` without touching the xlsx file,
+and project data is then read from the database with indexed lookups as it is
+needed. Many masters can be kept in the same database, and read from many
+threads or processes at once.
+
+The database has four tables: ``masters``, ``projects`` and ``keys`` (each
+project and key in a master, in master order) and ``cell_values`` (the value
+of each key for each project).
+"""
+import datetime
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from datamaps.plugins.dft.portfolio import match_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS masters (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    path TEXT,
+    quarter INTEGER,
+    year INTEGER,
+    declared_month INTEGER
+);
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    master_id INTEGER NOT NULL REFERENCES masters(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS keys (
+    id INTEGER PRIMARY KEY,
+    master_id INTEGER NOT NULL REFERENCES masters(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT,
+    match_name TEXT
+);
+CREATE TABLE IF NOT EXISTS cell_values (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    key_id INTEGER NOT NULL REFERENCES keys(id) ON DELETE CASCADE,
+    value,
+    type TEXT
+);
+CREATE INDEX IF NOT EXISTS projects_master_name ON projects (master_id, name);
+CREATE INDEX IF NOT EXISTS keys_master_name ON keys (master_id, name);
+CREATE INDEX IF NOT EXISTS keys_master_match_name ON keys (master_id, match_name);
+CREATE INDEX IF NOT EXISTS cell_values_project_key ON cell_values (project_id, key_id);
+CREATE INDEX IF NOT EXISTS cell_values_key ON cell_values (key_id);
+"""
+
+# types which SQLite does not store itself, and how to get them back
+_DECODERS = {
+    "date": datetime.date.fromisoformat,
+    "datetime": datetime.datetime.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "bool": lambda v: bool(v),
+}
+
+
+def _encode(value: Any) -> Tuple[Any, Optional[str]]:
+    if isinstance(value, bool):
+        return int(value), "bool"
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(), "datetime"
+    if isinstance(value, datetime.date):
+        return value.isoformat(), "date"
+    if isinstance(value, datetime.time):
+        return value.isoformat(), "time"
+    if value is None or isinstance(value, (int, float, str)):
+        return value, None
+    return str(value), None
+
+
+def _decode(value: Any, value_type: Optional[str]) -> Any:
+    if value_type is None or value is None:
+        return value
+    return _DECODERS[value_type](value)
+
+
+def connect(db_path, read_only: bool = False) -> sqlite3.Connection:
+    """Open the database at ``db_path``, creating the tables if needed."""
+    if read_only:
+        conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    else:
+        conn = sqlite3.connect(str(db_path))
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def save_master(
+    db_path,
+    name: str,
+    data: Dict[str, Dict[str, Any]],
+    path: Optional[str] = None,
+    quarter: Optional[int] = None,
+    year: Optional[int] = None,
+    declared_month: Optional[int] = None,
+) -> None:
+    """Save master data, as returned by
+    :py:func:`datamaps.plugins.dft.portfolio.project_data_from_master`, to the
+    database at ``db_path`` as ``name``, replacing any master already saved
+    under that name."""
+    projects = list(data)
+    keys: List[Any] = list(OrderedDict.fromkeys(k for p in projects for k in data[p]))
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM masters WHERE name = ?", (name,))
+            master_id = conn.execute(
+                "INSERT INTO masters (name, path, quarter, year, declared_month) VALUES (?, ?, ?, ?, ?)",
+                (name, None if path is None else str(path), quarter, year, declared_month),
+            ).lastrowid
+            project_ids = [
+                conn.execute(
+                    "INSERT INTO projects (master_id, position, name) VALUES (?, ?, ?)",
+                    (master_id, i, p),
+                ).lastrowid
+                for i, p in enumerate(projects)
+            ]
+            key_ids = [
+                conn.execute(
+                    "INSERT INTO keys (master_id, position, name, match_name) VALUES (?, ?, ?, ?)",
+                    (master_id, i, k, match_key(k)),
+                ).lastrowid
+                for i, k in enumerate(keys)
+            ]
+            conn.executemany(
+                "INSERT INTO cell_values (project_id, key_id, value, type) VALUES (?, ?, ?, ?)",
+                (
+                    (project_id, key_id) + _encode(data[p][k])
+                    for p, project_id in zip(projects, project_ids)
+                    for k, key_id in zip(keys, key_ids)
+                    if k in data[p]
+                ),
+            )
+    finally:
+        conn.close()
+
+
+def list_masters(db_path) -> List[str]:
+    """Return the names of the masters saved in the database at ``db_path``."""
+    conn = connect(db_path, read_only=True)
+    try:
+        return [row[0] for row in conn.execute("SELECT name FROM masters ORDER BY id")]
+    finally:
+        conn.close()
+
+
+class SQLiteMasterData(Mapping):
+    """The data for one master in a SQLite database, read as it is needed.
+
+    This behaves like the dictionary returned by
+    :py:func:`datamaps.plugins.dft.portfolio.project_data_from_master`:
+    it maps project names to an ``OrderedDict`` of their keys and values.
+    Each thread gets its own read-only connection to the database.
+    """
+
+    def __init__(self, db_path, name: str) -> None:
+        self.db_path = Path(db_path)
+        self.name = name
+        self._local = threading.local()
+        row = self._conn.execute(
+            "SELECT id, path, quarter, year, declared_month FROM masters WHERE name = ?",
+            (name,),
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"There is no master called {name} in {db_path}")
+        self.master_id, self.path, self.quarter, self.year, self.declared_month = row
+        self._projects = OrderedDict(
+            self._conn.execute(
+                "SELECT name, id FROM projects WHERE master_id = ? ORDER BY position",
+                (self.master_id,),
+            )
+        )
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path, read_only=True)
+        return conn
+
+    def __getitem__(self, project: str) -> "OrderedDict[str, Any]":
+        project_id = self._projects[project]
+        return OrderedDict(
+            (key, _decode(value, value_type))
+            for key, value, value_type in self._conn.execute(
+                "SELECT k.name, v.value, v.type FROM cell_values v JOIN keys k ON k.id = v.key_id "
+                "WHERE v.project_id = ? ORDER BY k.position",
+                (project_id,),
+            )
+        )
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._projects)
+
+    def __len__(self) -> int:
+        return len(self._projects)
+
+    def __contains__(self, project: object) -> bool:
+        return project in self._projects
+
+    def project_keys(self, project: str, keys: Iterable[Any]) -> "OrderedDict[str, Any]":
+        """Return the keys and values for ``project`` which ``ProjectData.pull_keys``
+        could match to ``keys``, using the index on the keys table."""
+        keys = list(keys)
+        match_names = list(set(keys) | {match_key(k) for k in keys})
+        if not match_names:
+            return OrderedDict()
+        placeholders = ", ".join("?" * len(match_names))
+        return OrderedDict(
+            (key, _decode(value, value_type))
+            for key, value, value_type in self._conn.execute(
+                "SELECT k.name, v.value, v.type FROM keys k JOIN cell_values v ON v.key_id = k.id "
+                f"WHERE k.master_id = ? AND k.match_name IN ({placeholders}) AND v.project_id = ? "
+                "ORDER BY k.position",
+                [self.master_id, *match_names, self._projects[project]],
+            )
+        )
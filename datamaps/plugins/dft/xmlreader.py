@@ -0,0 +1,180 @@
+"""
+Reading the cells of a master without openpyxl.
+
+openpyxl builds a ``Cell`` object, with its style, for every cell in a
+workbook, although reading a master only needs the values. An xlsx file is a
+zip of XML files; here the shared strings and the active sheet are parsed
+directly, a row at a time, and each cell's value is worked out as openpyxl
+would work it out, including the conversion of numbers in date formats to
+datetimes.
+
+Masters are written as plain values. A sheet with formulae or merged cells,
+which openpyxl reads differently, raises :py:class:`UnsupportedMaster` so that
+the caller can use openpyxl instead.
+"""
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+from xml.etree.ElementTree import fromstring, iterparse
+
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH, from_excel, from_ISO8601
+
+from datamaps.process.sniff import sheet_paths
+
+_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_ROW = f"{_MAIN}row"
+_CELL = f"{_MAIN}c"
+_VALUE = f"{_MAIN}v"
+_FORMULA = f"{_MAIN}f"
+_INLINE = f"{_MAIN}is"
+_TEXT = f"{_MAIN}t"
+_RUN = f"{_MAIN}r"
+_SHARED_STRING = f"{_MAIN}si"
+_MERGE_CELLS = f"{_MAIN}mergeCells"
+_DIGITS = "0123456789"
+
+
+class UnsupportedMaster(Exception):
+    """The sheet has something in it which is not read here as openpyxl reads it."""
+
+
+def _text(node) -> str:
+    # as openpyxl.cell.text.Text.content: the plain text and that of each run, but
+    # not phonetic runs
+    if len(node) == 1 and node[0].tag == _TEXT:
+        return node[0].text or ""
+    snippets = []
+    plain = node.find(_TEXT)
+    if plain is not None and plain.text is not None:
+        snippets.append(plain.text)
+    for run in node.iterfind(_RUN):
+        t = run.find(_TEXT)
+        if t is not None and t.text is not None:
+            snippets.append(t.text)
+    return "".join(snippets)
+
+
+def _shared_strings(zf: zipfile.ZipFile) -> List[str]:
+    try:
+        f = zf.open("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+    strings = []
+    with f:
+        for _, node in iterparse(f):
+            if node.tag == _SHARED_STRING:
+                strings.append(_text(node).replace("x005F_", ""))
+                node.clear()
+    return strings
+
+
+def _date_styles(zf: zipfile.ZipFile) -> Tuple[Set[int], Set[int]]:
+    """Return the indexes of the cell styles with date formats, and of those with
+    timedelta formats."""
+    try:
+        styles = fromstring(zf.read("xl/styles.xml"))
+    except KeyError:
+        return set(), set()
+    custom = {
+        int(fmt.get("numFmtId", -1)): fmt.get("formatCode")
+        for fmt in styles.iterfind(f"{_MAIN}numFmts/{_MAIN}numFmt")
+    }
+    dates, timedeltas = set(), set()
+    for idx, xf in enumerate(styles.iterfind(f"{_MAIN}cellXfs/{_MAIN}xf")):
+        fmt_id = int(xf.get("numFmtId", 0))
+        fmt = custom[fmt_id] if fmt_id in custom else builtin_format_code(fmt_id)
+        if is_date_format(fmt):
+            dates.add(idx)
+        if is_timedelta_format(fmt):
+            timedeltas.add(idx)
+    return dates, timedeltas
+
+
+def _active_sheet(zf: zipfile.ZipFile) -> Tuple[str, Any]:
+    """Return the path in the zip of the active sheet's XML, and the workbook's epoch."""
+    workbook = fromstring(zf.read("xl/workbook.xml"))
+    view = workbook.find(f"{_MAIN}bookViews/{_MAIN}workbookView")
+    active = int(view.get("activeTab", 0)) if view is not None else 0
+    sheets = [sheet.get("name", "") for sheet in workbook.iterfind(f"{_MAIN}sheets/{_MAIN}sheet")]
+    pr = workbook.find(f"{_MAIN}workbookPr")
+    date1904 = pr is not None and pr.get("date1904") in ("1", "true")
+    try:
+        return sheet_paths(zf)[sheets[active]], MAC_EPOCH if date1904 else WINDOWS_EPOCH
+    except (IndexError, KeyError):
+        raise UnsupportedMaster("The active sheet could not be found.")
+
+
+def _number(value: str):
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+def read_active_sheet(path: Path) -> Tuple[Dict[Tuple[int, int], Any], int, int]:
+    """Return the value of each cell in the active sheet of the xlsx file at ``path``, by
+    ``(row, column)``, and the largest row and column which have a cell, as openpyxl's
+    ``max_row`` and ``max_column`` give them."""
+    with zipfile.ZipFile(path) as zf:
+        sheet_path, epoch = _active_sheet(zf)
+        strings = _shared_strings(zf)
+        dates, timedeltas = _date_styles(zf)
+        cells: Dict[Tuple[int, int], Any] = {}
+        max_row = max_column = 1
+        row_counter = 0
+        columns: Dict[str, int] = {}
+        with zf.open(sheet_path) as f:
+            for _, node in iterparse(f):
+                if node.tag == _MERGE_CELLS:
+                    raise UnsupportedMaster("The sheet has merged cells.")
+                if node.tag != _ROW:
+                    continue
+                row_counter = int(node.get("r", row_counter + 1))
+                column = 0
+                for c in node:
+                    if c.tag != _CELL:
+                        continue
+                    ref = c.get("r")
+                    if ref:
+                        letters = ref.rstrip(_DIGITS)
+                        row = int(ref[len(letters):])
+                        column = columns.get(letters) or columns.setdefault(
+                            letters, column_index_from_string(letters)
+                        )
+                    else:
+                        row, column = row_counter, column + 1
+                    value: Any = None
+                    inline = None
+                    for child in c:
+                        if child.tag == _VALUE:
+                            value = child.text or None
+                        elif child.tag == _FORMULA:
+                            raise UnsupportedMaster(f"Cell {ref} has a formula.")
+                        elif child.tag == _INLINE:
+                            inline = child
+                    data_type = c.get("t", "n")
+                    if data_type == "inlineStr":
+                        value = None if inline is None else _text(inline)
+                    elif value is not None:
+                        if data_type == "n":
+                            value = _number(value)
+                            style = int(c.get("s", 0))
+                            if style in dates:
+                                try:
+                                    value = from_excel(value, epoch, timedelta=style in timedeltas)
+                                except (OverflowError, ValueError):
+                                    value = "#VALUE!"
+                        elif data_type == "s":
+                            value = strings[int(value)]
+                        elif data_type == "b":
+                            value = bool(int(value))
+                        elif data_type == "d":
+                            value = from_ISO8601(value)
+                    cells[(row, column)] = value
+                    if row > max_row:
+                        max_row = row
+                    if column > max_column:
+                        max_column = column
+                node.clear()
+    return cells, max_row, max_column
@@ -1 +1 @@
-from .cleansers import Cleanser
+from .cleansers import Cleanser, CleansingReport, ValueTyper
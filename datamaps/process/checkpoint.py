@@ -0,0 +1,102 @@
+"""
+Keeping the data extracted from each template during an import.
+
+As each template is read, its data is saved to a work directory, so that if
+the import stops part of the way through a large batch, it can be resumed
+(``datamaps import templates --resume``) without reading the templates which
+were done again. A template's saved data is only used if the template (both its
+name and its contents), the datamap and the options used to read it are all
+unchanged.
+"""
+import hashlib
+import logging
+import pickle
+import shutil
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+    """The data extracted from templates so far, kept in ``directory``.
+
+    Args:
+        directory: where the data is kept
+        options: anything which affects what is read from a template, such as
+            the datamap's checksum and the row limit
+    """
+
+    def __init__(self, directory: Path, *options: Any) -> None:
+        self.directory = Path(directory)
+        self.options = ":".join(str(o) for o in (CHECKPOINT_VERSION,) + options)
+        self._keys: Dict[Path, str] = {}
+
+    def _path(self, template_file: Path) -> Path:
+        template_file = Path(template_file)
+        if template_file not in self._keys:
+            # the data is keyed by file name, so a copy of a template under another
+            # name must not use it
+            h = hashlib.md5(f"{self.options}:{template_file.name}".encode())
+            with open(template_file, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            self._keys[template_file] = h.hexdigest()
+        return self.directory / f"{self._keys[template_file]}.pickle"
+
+    def load(self, template_file: Path) -> Optional[Dict[str, Any]]:
+        """Return the data saved for ``template_file``, or None if there is none."""
+        path = self._path(template_file)
+        try:
+            with open(path, "rb") as f:
+                data: Dict[str, Any] = pickle.load(f)
+            return data
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, ValueError):
+            logger.warning(f"Ignoring unreadable checkpoint {path}.")
+            return None
+
+    def save(self, template_file: Path, data: Dict[str, Any]) -> None:
+        """Save the data read from ``template_file``."""
+        path = self._path(template_file)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        # pickled, as the data includes dates and times
+        with open(tmp, "wb") as f:
+            pickle.dump(data, f)
+        tmp.replace(path)
+
+    def wrap(self, reader: Callable, resume: bool = False, timed: bool = False) -> Callable:
+        """Return ``reader`` (as used by :py:func:`datamaps.process.importer.extract`),
+        saving the data it reads from each template. If ``resume`` is True, data already
+        saved for a template is used rather than reading it again. ``timed`` says whether
+        ``reader`` returns timings records along with the data."""
+        return _CheckpointedReader(self, reader, resume, timed)
+
+    def clear(self) -> None:
+        """Remove all saved data."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class _CheckpointedReader:
+    """A template reader which saves what it reads; picklable, so that it can be run
+    in worker processes."""
+
+    def __init__(self, checkpoint: Checkpoint, reader: Callable, resume: bool, timed: bool) -> None:
+        self.checkpoint = checkpoint
+        self.reader = reader
+        self.resume = resume
+        self.timed = timed
+
+    def __call__(self, template_file):
+        if self.resume:
+            data = self.checkpoint.load(template_file)
+            if data is not None:
+                logger.info(f"Using data already read from {Path(template_file).name}.")
+                return (data, []) if self.timed else data
+        result = self.reader(template_file)
+        self.checkpoint.save(template_file, result[0] if self.timed else result)
+        return result
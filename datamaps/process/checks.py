@@ -0,0 +1,226 @@
+"""
+Checking the datamap and blank template before an import or export.
+
+Rather than stopping at the first problem, every line of the datamap is
+checked, and every sheet and cell reference it uses is checked against the
+blank template, so that all of the problems can be reported at once. The
+result is cached against the checksums of the two files, so checking again
+when neither has changed is almost free.
+"""
+import csv
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from engine.domain.datamap import DatamapFile
+from engine.exceptions import (DatamapFileEncodingError, DatamapNotCSVException,
+                               MalFormedCSVEmptyTailRowsException,
+                               MalFormedCSVHeaderException)
+from engine.utils.extraction import datamap_check, tail_rows_check
+from openpyxl import load_workbook
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string
+from openpyxl.utils.exceptions import CellCoordinatesException
+
+from .importer import hash_file
+
+logger = logging.getLogger(__name__)
+
+ERROR = "ERROR"
+WARNING = "WARNING"
+CACHE_VERSION = 1
+
+# the largest worksheet Excel allows
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+
+
+class Problem(NamedTuple):
+    severity: str
+    message: str
+    line: Optional[int] = None
+
+    def __str__(self) -> str:
+        if self.line is None:
+            return self.message
+        return f"Line {self.line} of datamap: {self.message}"
+
+
+class DatamapEntry(NamedTuple):
+    line: int
+    key: str
+    sheet: str
+    cellref: str
+    data_type: Optional[str]
+
+
+def _clean(value: Optional[str]) -> str:
+    return (value or "").strip()
+
+
+def _line_problem(line: Dict[str, str], headers: Dict[str, str]) -> Optional[str]:
+    """Return what is missing from a datamap line, if anything, with the same
+    messages as the engine gives when it stops at the line."""
+    missing = [field for field, value in line.items() if value == ""]
+    key, sheet, cellref = (headers.get(h) in missing for h in ("key", "sheet", "cellref"))
+    if key and sheet and cellref:
+        return "Datamap contains a missing line. Please fix datamap before proceeding."
+    if sheet:
+        return (
+            f"Line whose key is {line[headers['key']]} is missing a sheet field. Cannot proceed."
+            " Please fix datamap."
+        )
+    if key:
+        return (
+            f"Line missing a key field. Contains sheet {line[headers['sheet']]} and cell "
+            f"reference {line[headers['cellref']]}. Cannot proceed. Please fix datamap."
+        )
+    return None
+
+
+def check_datamap(dm_file: Path) -> Tuple[List[DatamapEntry], List[Problem]]:
+    """Check every line of the datamap at ``dm_file``.
+
+    Returns the lines which could be read and the problems found.
+    """
+    try:
+        headers = datamap_check(dm_file)
+        if isinstance(headers, Exception):
+            raise headers
+        tail_rows_check(dm_file)
+    except (
+        DatamapNotCSVException,
+        DatamapFileEncodingError,
+        MalFormedCSVHeaderException,
+        MalFormedCSVEmptyTailRowsException,
+    ) as e:
+        # nothing more can be checked without usable headers
+        return [], [Problem(ERROR, str(e))]
+    lines = []
+    problems = []
+    seen: Dict[str, int] = {}
+    with DatamapFile(dm_file) as datamap_file:
+        reader = csv.DictReader(datamap_file)
+        for line in reader:
+            n = reader.line_num
+            problem = _line_problem(line, headers)
+            if problem is not None:
+                problems.append(Problem(ERROR, problem, n))
+                continue
+            key = _clean(line[headers["key"]])
+            if key in seen:
+                problems.append(
+                    Problem(WARNING, f'Key "{key}" is also used on line {seen[key]}.', n)
+                )
+            else:
+                seen[key] = n
+            data_type = _clean(line[headers["type"]]) if headers["type"] else None
+            lines.append(
+                DatamapEntry(
+                    n,
+                    key,
+                    _clean(line[headers["sheet"]]),
+                    _clean(line[headers["cellref"]]).upper(),
+                    data_type or None,
+                )
+            )
+    return lines, problems
+
+
+def check_template(blank: Path, lines: List[DatamapEntry]) -> List[Problem]:
+    """Check that the sheet and cell reference of each datamap line exist in the
+    blank template at ``blank``, opening it once, read-only.
+
+    A cell reference outside the area of the sheet which is in use is reported
+    as a warning, as it may be a mistake.
+    """
+    problems: List[Problem] = []
+    wb = load_workbook(blank, read_only=True, keep_links=False)
+    try:
+        dimensions = {}
+        for line in lines:
+            n = line.line
+            if line.sheet not in wb.sheetnames:
+                problems.append(
+                    Problem(ERROR, f'Sheet "{line.sheet}" is not in {Path(blank).name}.', n)
+                )
+                continue
+            try:
+                column, row = coordinate_from_string(line.cellref)
+                column = column_index_from_string(column)
+                if not (1 <= row <= MAX_ROW and column <= MAX_COLUMN):
+                    raise ValueError
+            except (CellCoordinatesException, ValueError):
+                problems.append(
+                    Problem(ERROR, f'"{line.cellref}" is not a valid cell reference.', n)
+                )
+                continue
+            if line.sheet not in dimensions:
+                ws = wb[line.sheet]
+                dimensions[line.sheet] = (ws.max_row, ws.max_column)
+            max_row, max_column = dimensions[line.sheet]
+            if max_row is not None and max_column is not None:
+                if row > max_row or column > max_column:
+                    problems.append(
+                        Problem(
+                            WARNING,
+                            f"{line.cellref} is outside the area used in sheet "
+                            f'"{line.sheet}" of {Path(blank).name}.',
+                            n,
+                        )
+                    )
+    finally:
+        wb.close()
+    return problems
+
+
+class CheckCache:
+    """The problems found by earlier checks, keyed by the checksums of the files checked."""
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = path
+        self._results: Dict[str, list] = {}
+        if path is not None and Path(path).is_file():
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    self._results = data["results"]
+            except (ValueError, KeyError):
+                logger.warning(f"Ignoring unreadable check cache {path}.")
+
+    def get(self, key: str) -> Optional[List[Problem]]:
+        try:
+            return [Problem(*p) for p in self._results[key]]
+        except KeyError:
+            return None
+
+    def put(self, key: str, problems: List[Problem]) -> None:
+        if self.path is None:
+            return
+        self._results[key] = [list(p) for p in problems]
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(self.path).with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "results": self._results}, f)
+        tmp.replace(self.path)
+
+
+def check_files(
+    dm_file: Path, blank: Path, cache: Optional[CheckCache] = None
+) -> Tuple[List[Problem], bool]:
+    """Check the datamap and the blank template.
+
+    Returns all the problems found, and whether they came from ``cache``.
+    """
+    key = f"{hash_file(dm_file)}:{hash_file(blank)}"
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, True
+    lines, problems = check_datamap(dm_file)
+    problems.extend(check_template(blank, lines))
+    problems.sort(key=lambda p: (p.line or 0))
+    if cache is not None:
+        cache.put(key, problems)
+    return problems, False
@@ -1,8 +1,12 @@
+import csv
 import datetime
+import json
 import logging
 import re
+from collections import Counter
 from datetime import date
 from operator import itemgetter
+from pathlib import Path
 
 from dateutil.parser import parse
 
@@ -28,10 +32,74 @@ PERCENT_REGEX = r"^(\d{1,3})%$"
 POUND_REGEX = r"^(-)?£(\d+(\.\d{1,2})?)(\d+)?$"  # handles negative numbers
 
 
+class CleansingReport:
+    """
+    Accumulates, across any number of strings, how many times each cleaning
+    rule was applied by :py:class:`Cleanser`.
+
+    Pass the same report to each ``Cleanser`` in a batch; the counts made by
+    ``Cleanser`` when it analyses a string are added to the report as the
+    string is cleaned, so no second pass over the data is needed.
+
+    >>> report = CleansingReport()
+    >>> Cleanser("Text, with commas", report=report).clean()
+    'Text with commas'
+    >>> Cleanser("No problem", report=report).clean()
+    'No problem'
+    >>> report.counts["commas"], report.strings, report.cleaned
+    (1, 2, 1)
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.strings = 0
+        self.cleaned = 0
+
+    def record(self, applied):
+        """Record one string, and the (c_type, count) of each rule applied to it."""
+        self.strings += 1
+        if applied:
+            self.cleaned += 1
+            for c_type, count in applied:
+                self.counts[c_type] += count
+
+    def update(self, other):
+        """Add the counts from another report to this one."""
+        self.counts.update(other.counts)
+        self.strings += other.strings
+        self.cleaned += other.cleaned
+
+    def to_dict(self):
+        return dict(
+            strings=self.strings,
+            cleaned=self.cleaned,
+            rules=dict(self.counts.most_common()),
+        )
+
+    def write(self, path):
+        """Write the report to ``path``, as JSON if it ends in .json, otherwise as CSV."""
+        path = Path(path)
+        if path.suffix.lower() == ".json":
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
+        else:
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["Rule", "Count"])
+                for c_type, count in self.counts.most_common():
+                    writer.writerow([c_type, count])
+                writer.writerow(["strings", self.strings])
+                writer.writerow(["cleaned", self.cleaned])
+        return path
+
+
 class Cleanser:
     """
     Takes a string, and cleans it.
 
+    If a :py:class:`CleansingReport` is passed as ``report``, the rules
+    applied by :py:meth:`clean` are added to it.
+
     Doctests:
     >>> t = "Text, with commas"
     >>> c = Cleanser(t)
@@ -44,8 +112,10 @@ class Cleanser:
 
     """
 
-    def __init__(self, string):
+    def __init__(self, string, report=None):
         self.string = string
+        self.report = report
+        self.applied = []
 
         # a list of dicts that describe everything needed to fix errors in
         # string passed to class constructor. Method self.clean() runs through
@@ -281,10 +351,70 @@ class Cleanser:
         """Runs each applicable cleaning action and returns the cleaned
         string."""
         self._sort_checks()
+        applied = []
         for check in self._checks:
             if check["count"] > 0:
                 self.string = check["func"](check["rule"], check["fix"])
+                applied.append((check["c_type"], check["count"]))
                 check["count"] = 0
             else:
-                return self.string
+                break
+        self.applied = applied
+        if self.report is not None:
+            self.report.record(applied)
         return self.string
+
+
+# the Cleanser rules which turn a string into a typed value
+_TYPING_REGEX = re.compile(
+    "|".join(
+        "(?:{})".format(r)
+        for r in [DATE_REGEX, DATE_REGEX_TIME, INT_REGEX, FLOAT_REGEX, PERCENT_REGEX, POUND_REGEX]
+    )
+)
+
+
+class ValueTyper:
+    """
+    Turns strings which look like dates, integers, floats, percentages or
+    sums of money into ``datetime.date``, ``int`` or ``float`` values, using
+    the same rules as :py:class:`Cleanser`. Anything else is returned as is -
+    in particular, text is not otherwise cleaned.
+
+    Values which are not strings are returned immediately, and the result for
+    each distinct string is cached, so a ``ValueTyper`` is cheap to call on
+    every value in a master.
+
+    >>> typer = ValueTyper()
+    >>> typer("£12.50"), typer("45%"), typer("12"), typer("Text, with commas"), typer(3)
+    (12.5, 0.45, 12, 'Text, with commas', 3)
+    >>> typer("03/05/2016")
+    datetime.date(2016, 5, 3)
+    >>> typer("12"), typer.hits, typer.misses
+    (12, 1, 5)
+    """
+
+    def __init__(self, report=None):
+        self.report = report
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+
+    def __call__(self, value):
+        if type(value) is not str:
+            return value
+        try:
+            typed, applied = self._cache[value]
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            typed, applied = value, []
+            if _TYPING_REGEX.match(value):
+                c = Cleanser(value)
+                cleaned = c.clean()
+                if not isinstance(cleaned, str):
+                    typed, applied = cleaned, c.applied
+            self._cache[value] = (typed, applied)
+        if self.report is not None:
+            self.report.record(applied)
+        return typed
@@ -0,0 +1,171 @@
+"""
+Compiled datamaps.
+
+Parsing and checking ``datamap.csv`` is repeated by every import and export.
+A :py:class:`CompiledDatamap` holds the result of doing it once: each line's
+key, sheet and cell reference, with the cell reference resolved to integer
+``(row, column)`` coordinates and the lines grouped by sheet. Compiled datamaps
+are cached on disk, keyed by the checksum of the datamap file, so a datamap is
+only parsed again when it changes.
+"""
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from engine.config import Config
+from engine.domain.datamap import DatamapFile
+from engine.utils.extraction import datamap_check, datamap_reader
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string
+from openpyxl.utils.exceptions import CellCoordinatesException
+
+logger = logging.getLogger(__name__)
+
+COMPILED_VERSION = 1
+
+
+class CompiledLine(NamedTuple):
+    key: str
+    sheet: str
+    cellref: str
+    data_type: Optional[str]
+    row: int
+    column: int
+
+
+def _coordinates(cellref: str) -> Tuple[int, int]:
+    """Return the (row, column) of ``cellref``, or (0, 0) if it is not a valid reference."""
+    try:
+        column, row = coordinate_from_string(cellref)
+        return row, column_index_from_string(column)
+    except (CellCoordinatesException, ValueError):
+        return 0, 0
+
+
+class CompiledDatamap:
+    """A parsed datamap, with its cell references resolved.
+
+    Args:
+        lines: the datamap lines, in datamap order
+        is_typed (bool): whether the datamap has a 'type' column
+        checksum (str): the checksum of the datamap file
+        path: where the datamap file is
+    """
+
+    def __init__(self, lines: List[CompiledLine], is_typed: bool, checksum: str, path) -> None:
+        self.lines = lines
+        self.is_typed = is_typed
+        self.checksum = checksum
+        self.path = Path(path)
+        self.sheets: Dict[str, List[int]] = OrderedDict()
+        self.key_index: Dict[str, int] = {}
+        for i, line in enumerate(lines):
+            self.sheets.setdefault(line.sheet, []).append(i)
+            self.key_index.setdefault(line.key, i)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def coordinates(self, sheet: str) -> List[Tuple[int, int, int]]:
+        """Return ``(line number, row, column)`` for each line in ``sheet`` with a valid cell reference."""
+        return [
+            (i, self.lines[i].row, self.lines[i].column)
+            for i in self.sheets.get(sheet, [])
+            if self.lines[i].row
+        ]
+
+    def max_row(self, sheet: str) -> int:
+        """The last row in ``sheet`` used by the datamap."""
+        return max((self.lines[i].row for i in self.sheets.get(sheet, [])), default=0)
+
+    def to_dicts(self) -> List[Dict[str, Optional[str]]]:
+        """Return the lines as ``engine.domain.datamap.DatamapLine.to_dict()`` does,
+        for use with bcompiler-engine."""
+        filename = str(self.path)
+        return [
+            {
+                "key": line.key,
+                "sheet": line.sheet,
+                "cellref": line.cellref,
+                "data_type": line.data_type,
+                "filename": filename,
+            }
+            for line in self.lines
+        ]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "version": COMPILED_VERSION,
+                "checksum": self.checksum,
+                "is_typed": self.is_typed,
+                "lines": [list(line) for line in self.lines],
+            }
+        )
+
+    @classmethod
+    def from_json(cls, s: str, path) -> "CompiledDatamap":
+        data = json.loads(s)
+        if data.get("version") != COMPILED_VERSION:
+            raise ValueError("Compiled datamap is from a different version of datamaps.")
+        return cls(
+            [CompiledLine(*line) for line in data["lines"]], data["is_typed"], data["checksum"], path
+        )
+
+
+def _compile(dm_file: Path, checksum: str) -> CompiledDatamap:
+    lines = [
+        CompiledLine(dml.key, dml.sheet, dml.cellref, dml.data_type, *_coordinates(dml.cellref))
+        for dml in datamap_reader(dm_file)
+    ]
+    is_typed = datamap_check(dm_file)["type"] is not None
+    return CompiledDatamap(lines, is_typed, checksum, dm_file)
+
+
+# compiled datamaps already loaded by this process, by checksum
+_compiled: Dict[str, CompiledDatamap] = {}
+
+
+def compile_datamap(dm_file: Union[Path, str], cache_dir: Optional[Path] = None) -> CompiledDatamap:
+    """Return the compiled datamap for the datamap file at ``dm_file``.
+
+    The datamap is only parsed (by bcompiler-engine, with all its checks) if it
+    has not been compiled before; compiled datamaps are kept in ``cache_dir``,
+    which is the ``datamaps`` directory in the datamaps data directory by default.
+
+    Raises the same exceptions as ``engine.utils.extraction.datamap_reader``.
+    """
+    dm_file = Path(dm_file)
+    # raises DatamapNotCSVException or FileNotFoundError as bcompiler-engine does
+    with DatamapFile(dm_file):
+        pass
+    checksum = hashlib.md5(dm_file.read_bytes()).hexdigest()
+    if checksum in _compiled:
+        logger.info(f"Reading datamap {dm_file}")
+        known = _compiled[checksum]
+        if known.path != dm_file:
+            known = CompiledDatamap(known.lines, known.is_typed, checksum, dm_file)
+        return known
+    if cache_dir is None:
+        cache_dir = Path(Config.DATAMAPS_LIBRARY_DATA_DIR) / "datamaps"
+    cached = Path(cache_dir) / f"{checksum}.json"
+    compiled: Optional[CompiledDatamap] = None
+    if cached.is_file():
+        try:
+            compiled = CompiledDatamap.from_json(cached.read_text(encoding="utf-8"), dm_file)
+            logger.info(f"Reading datamap {dm_file}")
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring unreadable compiled datamap {cached}.")
+    if compiled is None:
+        compiled = _compile(dm_file, checksum)
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cached.with_suffix(".tmp")
+            tmp.write_text(compiled.to_json(), encoding="utf-8")
+            tmp.replace(cached)
+        except OSError as e:
+            logger.warning(f"Cannot save compiled datamap to {cached}: {e}")
+    _compiled[checksum] = compiled
+    return compiled
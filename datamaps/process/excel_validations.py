@@ -0,0 +1,241 @@
+"""
+Reporting the Excel cell validations in many spreadsheet files.
+
+This is the multi-file counterpart of
+``engine.adapters.cli.report_data_validations_in_file``: the targets can be
+files, directories, glob patterns or zip files; the files are read in parallel
+and each validation is written to a CSV or JSON report as soon as it is found.
+Results are cached by the checksum of each file, so files which have not
+changed since the last run are not opened again.
+"""
+import csv
+import glob
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import zipfile
+from concurrent import futures
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from openpyxl import load_workbook
+
+from .importer import hash_file
+
+logger = logging.getLogger(__name__)
+
+SPREADSHEET_SUFFIXES = {".xlsx", ".xlsm"}
+CACHE_VERSION = 1
+
+
+class ExcelValidation(NamedTuple):
+    file_name: str
+    sheet: str
+    cells: str
+    type: str
+    formula: str
+    report_line: str
+
+
+def file_validations(file_path: Path, file_name: Optional[str] = None) -> List[ExcelValidation]:
+    """Return the Excel cell validations in the spreadsheet at ``file_path``.
+
+    ``report_line`` is the same line reported by bcompiler-engine.
+    """
+    if file_name is None:
+        file_name = Path(file_path).name
+    wb = load_workbook(file_path)
+    output = []
+    try:
+        for ws in wb.worksheets:
+            for v in ws.data_validations.dataValidation:
+                output.append(
+                    ExcelValidation(
+                        file_name,
+                        ws.title,
+                        str(v.sqref),
+                        str(v.type),
+                        str(v.formula1),
+                        f"Sheet: {ws.title}; {v.sqref}; Type: {v.type}; Formula: {v.formula1}",
+                    )
+                )
+    finally:
+        wb.close()
+    return output
+
+
+def _checked_file(job: Tuple[Path, str]) -> Tuple[Optional[List[ExcelValidation]], Optional[str]]:
+    file_path, file_name = job
+    try:
+        return file_validations(file_path, file_name), None
+    except Exception as e:  # a broken file should not stop the rest being checked
+        return None, f"{type(e).__name__}: {e}"
+
+
+@contextmanager
+def expand_targets(targets: Iterable) -> Iterator[List[Tuple[Path, str]]]:
+    """Find the spreadsheet files referred to by ``targets``.
+
+    Each target may be a spreadsheet file, a directory (whose spreadsheets are
+    used), a glob pattern or a zip file (whose spreadsheets are extracted to a
+    temporary directory, removed on exit). Yields a list of ``(path, name)``
+    pairs, where ``name`` is the name to report the file as.
+
+    Raises:
+        FileNotFoundError: if a target does not exist or matches no files.
+    """
+    tmp_dirs = []
+    output: List[Tuple[Path, str]] = []
+    try:
+        for target in targets:
+            target = Path(target)
+            if target.is_dir():
+                output.extend(
+                    (p, p.name)
+                    for p in sorted(target.iterdir())
+                    if p.suffix.lower() in SPREADSHEET_SUFFIXES
+                )
+            elif target.suffix.lower() == ".zip" and target.is_file():
+                tmp_dir = Path(tempfile.mkdtemp())
+                tmp_dirs.append(tmp_dir)
+                with zipfile.ZipFile(target) as zf:
+                    for i, member in enumerate(zf.namelist()):
+                        if Path(member).suffix.lower() in SPREADSHEET_SUFFIXES:
+                            extracted = tmp_dir / str(i) / Path(member).name
+                            extracted.parent.mkdir()
+                            with zf.open(member) as src, open(extracted, "wb") as dst:
+                                shutil.copyfileobj(src, dst)
+                            output.append((extracted, f"{target.name}/{member}"))
+            elif target.is_file():
+                output.append((target, target.name))
+            else:
+                matches = sorted(glob.glob(str(target)))
+                if not matches:
+                    raise FileNotFoundError(f"Cannot find {target}")
+                output.extend(
+                    (Path(p), Path(p).name)
+                    for p in matches
+                    if Path(p).suffix.lower() in SPREADSHEET_SUFFIXES
+                )
+        yield output
+    finally:
+        for tmp_dir in tmp_dirs:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class ValidationCache:
+    """Excel validations found in each file, keyed by the file's checksum, kept in a JSON file."""
+
+    def __init__(self, path: Optional[Path]) -> None:
+        self.path = path
+        self._files: Dict[str, list] = {}
+        self.changed = False
+        if path is not None and Path(path).is_file():
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    self._files = data["files"]
+            except (ValueError, KeyError):
+                logger.warning(f"Ignoring unreadable Excel validations cache {path}.")
+
+    def get(self, checksum: str, file_name: str) -> Optional[List[ExcelValidation]]:
+        try:
+            return [ExcelValidation(file_name, *v) for v in self._files[checksum]]
+        except KeyError:
+            return None
+
+    def put(self, checksum: str, validations: List[ExcelValidation]) -> None:
+        self._files[checksum] = [list(v[1:]) for v in validations]
+        self.changed = True
+
+    def save(self) -> None:
+        if self.path is None or not self.changed:
+            return
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(self.path).with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "files": self._files}, f)
+        tmp.replace(self.path)
+
+
+def report_validations(
+    files: List[Tuple[Path, str]], cache: Optional[ValidationCache] = None, jobs: Optional[int] = None
+) -> Iterator[Tuple[str, List[ExcelValidation], Optional[str]]]:
+    """Yield ``(file name, validations, error)`` for each of ``files``, in order.
+
+    Files found in ``cache`` are not opened; the rest are read in ``jobs``
+    processes (one per CPU by default; 1 reads them in this process).
+    """
+    if cache is None:
+        cache = ValidationCache(None)
+    checksums = [hash_file(file_path) for file_path, _ in files]
+    cached = [cache.get(checksum, name) for checksum, (_, name) in zip(checksums, files)]
+    to_read = [f for f, found in zip(files, cached) if found is None]
+    logger.info(f"{len(files) - len(to_read)} of {len(files)} files unchanged since the last report.")
+
+    results: Iterator[Tuple[Optional[List[ExcelValidation]], Optional[str]]]
+    if jobs == 1 or len(to_read) < 2:
+        executor = None
+        results = map(_checked_file, to_read)
+    else:
+        executor = futures.ProcessPoolExecutor(jobs)
+        results = executor.map(_checked_file, to_read)
+    try:
+        for (_, file_name), checksum, found in zip(files, checksums, cached):
+            if found is not None:
+                yield file_name, found, None
+                continue
+            validations, error = next(results)
+            if validations is not None:
+                cache.put(checksum, validations)
+            yield file_name, validations or [], error
+    finally:
+        if executor is not None:
+            # files not yet read are not waited for, where Python can cancel them (3.9+)
+            if sys.version_info >= (3, 9):
+                executor.shutdown(cancel_futures=True)
+            else:
+                executor.shutdown()
+        cache.save()
+
+
+class ValidationReportWriter:
+    """Writes Excel validations to a file as they are found - as JSON if ``path``
+    ends in .json, otherwise as CSV."""
+
+    HEADER = ["File", "Sheet", "Cells", "Type", "Formula"]
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.json = self.path.suffix.lower() == ".json"
+        self.count = 0
+        self._f = open(self.path, "w", newline="", encoding="utf-8")
+        if self.json:
+            self._f.write("[")
+        else:
+            self._csv = csv.writer(self._f)
+            self._csv.writerow(self.HEADER)
+
+    def write(self, validation: ExcelValidation) -> None:
+        if self.json:
+            if self.count:
+                self._f.write(",")
+            self._f.write("\n" + json.dumps(dict(zip(self.HEADER, validation[:5]))))
+        else:
+            self._csv.writerow(validation[:5])
+        self.count += 1
+
+    def close(self) -> None:
+        if self.json:
+            self._f.write("\n]\n")
+        self._f.close()
+
+    def __enter__(self) -> "ValidationReportWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
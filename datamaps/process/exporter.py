@@ -0,0 +1,167 @@
+"""
+Export data from a master to a populated template for each project.
+
+This is an equivalent of ``engine.adapters.cli.write_master_to_templates``,
+using a :py:class:`datamaps.process.datamap.CompiledDatamap` rather than
+parsing the datamap again and searching it for each key of each project. The
+blank template is read from disk once, and each populated template is saved as
+soon as it is written, rather than all of them being kept in memory until the
+end.
+
+With the ``"xml"`` engine, the templates are written by patching the blank
+template's XML (see :py:mod:`datamaps.process.xmlpatch`) rather than with
+openpyxl.
+"""
+import io
+import logging
+from pathlib import Path
+from typing import Any, List, Tuple
+
+from engine.config import Config
+from openpyxl import load_workbook
+
+from .datamap import CompiledDatamap, compile_datamap
+from .xmlpatch import TemplatePatcher, UnsupportedTemplate
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("openpyxl", "xml")
+
+
+def _master_columns(master: Path) -> List[Tuple[Any, ...]]:
+    wb = load_workbook(master, read_only=True)
+    try:
+        rows = list(wb.active.iter_rows(values_only=True))
+    finally:
+        wb.close()
+    width = max((len(row) for row in rows), default=0)
+    return list(zip(*(row + (None,) * (width - len(row)) for row in rows)))
+
+
+def _check_keys(datamap: CompiledDatamap, col_a: Tuple[Any, ...]) -> None:
+    """Stop, as bcompiler-engine does, if the master's keys do not match the datamap."""
+    master_keys = []
+    for value in col_a[1:]:
+        try:
+            master_keys.append(value.strip())
+        except AttributeError:
+            master_keys.append("EMPTY")
+    datamap_keys = [line.key for line in datamap.lines]
+    if all(a == b for a, b in zip(datamap_keys, master_keys)):
+        return
+    missing = set(datamap_keys) - set(master_keys)
+    if missing:
+        for key in missing:
+            logger.critical(f"Key {key} in the datamap but not in the master. Not continuing.")
+        raise RuntimeError("Not continuing. Ensure all keys from datamap are in the master.")
+
+
+def master_projects(datamap: CompiledDatamap, master: Path) -> List[Tuple[str, List[Tuple[int, Any]]]]:
+    """Return the name of each project in ``master`` with its values, as (datamap line number, value) pairs.
+
+    Keys in the master which are not in the datamap are left out.
+    """
+    columns = _master_columns(master)
+    if not columns:
+        return []
+    _check_keys(datamap, columns[0])
+    keys = columns[0][1:]
+    output = []
+    for col in columns[1:]:
+        try:
+            file_name = col[0].split(".")[0]
+        except AttributeError:
+            logger.warning(
+                "Found values in cells beyond end of expected end column. "
+                "For most reliable results, use a clean master file."
+            )
+            break
+        logger.info(f"Extracting data for {file_name} from {master}")
+        values = []
+        for key, value in zip(keys, col[1:]):
+            if key is None:
+                logger.warning(
+                    "Found values in cells beyond end of expected end row. "
+                    "For most reliable results, use a clean master file."
+                )
+                break
+            i = datamap.key_index.get(key.strip())
+            if i is not None:
+                values.append((i, value))
+        output.append((file_name, values))
+    return output
+
+
+def populate_template(blank: bytes, datamap: CompiledDatamap, values: List[Tuple[int, Any]]):
+    """Return a workbook of the blank template (given as the contents of the file),
+    populated with ``values``."""
+    wb = load_workbook(io.BytesIO(blank), read_only=False, keep_vba=True)
+    for i, value in values:
+        line = datamap.lines[i]
+        try:
+            ws = wb[line.sheet]
+        except KeyError:
+            logger.warning(
+                f"Key: {line.key} missing a 'sheet' value in datamap. Check your datamap. "
+                "Data MAY not export."
+            )
+            continue
+        if not line.row:
+            logger.warning(f"No cellref in datamap for key: {line.key}. Cannot export this cell.")
+            continue
+        cell = ws.cell(row=line.row, column=line.column)
+        try:
+            cell.value = value
+        except AttributeError:
+            raise AttributeError(
+                f"PROBLEM: Key->{line.key} Current Val->{cell.value} Attempted Val->{value}"
+            )
+    return wb
+
+
+def write_master_to_templates(
+    blank_template: Path, datamap: Path, master: Path, engine: str = "openpyxl"
+) -> List[Path]:
+    """Write each project in ``master`` to a copy of ``blank_template`` in the output directory.
+
+    If ``engine`` is ``"xml"``, the copies are written by
+    :py:class:`datamaps.process.xmlpatch.TemplatePatcher`, falling back to openpyxl if the
+    blank template cannot be patched.
+
+    Returns the paths of the files written.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {', '.join(ENGINES)}, not {engine!r}")
+    compiled = compile_datamap(datamap)
+    projects = master_projects(compiled, Path(master))
+    try:
+        blank = Path(blank_template).read_bytes()
+    except FileNotFoundError as e:
+        raise FileNotFoundError(
+            f"Cannot find file {e.filename}. Do you have "
+            "file set correctly in config file, or is file missing?"
+        )
+    patcher = None
+    if engine == "xml":
+        try:
+            patcher = TemplatePatcher(blank, compiled)
+        except UnsupportedTemplate as e:
+            logger.info(f"Using openpyxl to populate the templates. {e}")
+    logger.info(
+        "Preparing to populate blank templates - this can take a few minutes depending on size of master."
+    )
+    output_dir = Path(Config.PLATFORM_DOCS_DIR) / "output"
+    output = []
+    for file_name, values in projects:
+        logger.info(f"Populating {file_name}")
+        path = output_dir / f"{file_name}.xlsm"
+        if patcher is None:
+            wb = populate_template(blank, compiled, values)
+            logger.info(f"Saving {path.name}")
+            wb.save(path)
+        else:
+            data = patcher.populate(values)
+            logger.info(f"Saving {path.name}")
+            path.write_bytes(data)
+        output.append(path)
+    return output
@@ -0,0 +1,670 @@
+"""
+Import data from a batch of populated templates, optionally creating a master.
+
+This is a staged equivalent of ``engine.adapters.cli.import_and_create_master``.
+Rather than handing the whole job to a single bcompiler-engine use case, each
+stage - reading the datamap, opening and extracting each template, validating
+and writing the master - is run here in turn, which allows every stage to be
+timed (see :py:class:`datamaps.process.timings.Timings`).
+
+The data structures passed between stages are the same as those used by
+bcompiler-engine, so its validation, reporting and output code is reused as is.
+"""
+import datetime
+import hashlib
+import logging
+import shutil
+import sys
+from concurrent import futures
+from contextlib import nullcontext
+from functools import partial
+from pathlib import Path
+from xml.etree import ElementTree
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, cast
+from zipfile import BadZipFile
+
+import engine.use_cases.parsing
+from engine.config import Config
+from engine.domain.datamap import DatamapLineValueType
+from engine.domain.template import TemplateCell
+from engine.reports.validation import ValidationReportCSV
+from engine.repository.master import MasterOutputRepository, ValidationOnlyRepository
+from engine.utils.extraction import (check_datamap_sheets, extract_zip_file_to_tmpdir,
+                                     get_xlsx_files, remove_failing_files)
+from engine.utils.validation import ValidationCheck, validation_checker
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+from .checkpoint import Checkpoint
+from .datamap import CompiledDatamap, compile_datamap
+from .sandbox import run_isolated
+from .sniff import oversized_sheets
+from .timings import Timings
+
+logger = logging.getLogger(__name__)
+
+# {"file.xlsm": {"checksum": "...", "data": {"Sheet": {"A1": {...TemplateCell...}}}}}
+TEMPLATE_DATA = Dict[str, Dict[str, Any]]
+# [{"file.xlsm": [(key, value), ...]}, ...]
+MASTER_DATA = List[Dict[str, List[Tuple[str, Any]]]]
+# [{"key": ..., "sheet": ..., "cellref": ..., "data_type": ..., "filename": ...}, ...]
+DATAMAP_DATA = List[Dict[str, Optional[str]]]
+
+# a row limit which reads each sheet only as far as the datamap needs
+AUTO_ROW_LIMIT = "auto"
+
+# leave out templates which are the same file as another
+DEDUPE_FILES = "files"
+# and also those whose datamap cells have the same values as another's
+DEDUPE_CELLS = "cells"
+
+
+def _stage(timings: Optional[Timings], stage: str, template: str = ""):
+    if timings is None:
+        return nullcontext()
+    return timings.stage(stage, template)
+
+
+def hash_file(filepath: Path) -> str:
+    """Return the md5 checksum of a file, as bcompiler-engine does."""
+    h = hashlib.md5()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _open_template(template_file, read_only: bool = False):
+    try:
+        return load_workbook(template_file, data_only=True, read_only=read_only)
+    except TypeError:
+        logger.critical(
+            "Unable to open {}. Potential corruption of file. Try resaving "
+            "in Excel or removing conditional formatting. See issue at "
+            "https://github.com/hammerheadlemon/bcompiler-engine/issues/3 for update. "
+            "Quitting.".format(template_file)
+        )
+        raise
+    except BadZipFile:
+        logger.critical(
+            f"Cannot open {template_file} due to file not conforming to expected format. "
+            f"Not continuing. Remove file from input directory and try again."
+        )
+        raise RuntimeError
+
+
+def _template_cell(file_name: str, sheet: str, cellref: str, value: Any) -> Dict[str, str]:
+    if isinstance(value, str):
+        val: Any = value.strip()
+        c_type = DatamapLineValueType.TEXT
+    elif isinstance(value, (float, int)):
+        val = value
+        c_type = DatamapLineValueType.NUMBER
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        val = value.isoformat()
+        c_type = DatamapLineValueType.DATE
+    else:
+        val = str(value)
+        c_type = DatamapLineValueType.TEXT
+    cell: Dict[str, str] = TemplateCell(file_name, sheet, cellref, val, c_type).to_dict()
+    return cell
+
+
+def _sheet_data(file_name: str, sheet, row_limit: int) -> Dict[str, Dict[str, str]]:
+    sheet_data = {}
+    for rowcnt, row in enumerate(sheet.rows):
+        if rowcnt > row_limit:
+            break
+        for cell in row:
+            if cell.value is not None:
+                cellref = f"{cell.column_letter}{cell.row}"
+                sheet_data[cellref] = _template_cell(file_name, sheet.title, cellref, cell.value)
+    return sheet_data
+
+
+def _datamap_sheet_data(
+    file_name: str, sheet, row_limit: int, datamap: CompiledDatamap
+) -> Dict[str, Dict[str, str]]:
+    """Return the data in the cells of ``sheet`` used by ``datamap``."""
+    sheet_data = {}
+    for _, row, column in datamap.coordinates(sheet.title):
+        if row > row_limit + 1:
+            continue
+        # this adds an empty cell to the sheet where there is none, which does not
+        # matter as the workbook is only read
+        cell = sheet.cell(row=row, column=column)
+        if cell.value is not None:
+            sheet_data[cell.coordinate] = _template_cell(
+                file_name, sheet.title, cell.coordinate, cell.value
+            )
+    if not sheet_data and datamap.coordinates(sheet.title):
+        sheet_data = _first_value(file_name, sheet, row_limit)
+    return sheet_data
+
+
+def _first_value(file_name: str, sheet, row_limit: int) -> Dict[str, Dict[str, str]]:
+    """Return the first value in ``sheet`` as sheet data.
+
+    bcompiler-engine only validates a sheet with something in it, so where none of the
+    cells used by the datamap have a value, this is kept to show that the sheet is not empty.
+    """
+    for row_n, row in enumerate(sheet.iter_rows(max_row=row_limit + 1, values_only=True), 1):
+        for column, value in enumerate(row, 1):
+            if value is not None:
+                cellref = f"{get_column_letter(column)}{row_n}"
+                return {cellref: _template_cell(file_name, sheet.title, cellref, value)}
+    return {}
+
+
+def _streamed_sheet_data(
+    file_name: str, sheet, row_limit: int, datamap: CompiledDatamap
+) -> Dict[str, Dict[str, str]]:
+    """Return the data in the cells of ``sheet`` used by ``datamap``, where ``sheet``
+    is from a read-only workbook.
+
+    The rows of a read-only sheet are parsed as they are iterated over, so only
+    the rows and columns spanning the cells used are read, once, from top to bottom.
+    """
+    wanted = sorted(
+        (row, column) for _, row, column in datamap.coordinates(sheet.title) if row <= row_limit + 1
+    )
+    sheet_data = {}
+    if wanted:
+        min_column = min(column for _, column in wanted)
+        max_column = max(column for _, column in wanted)
+        rows = sheet.iter_rows(
+            min_row=wanted[0][0],
+            max_row=wanted[-1][0],
+            min_col=min_column,
+            max_col=max_column,
+            values_only=True,
+        )
+        i = 0
+        for row_n, row in enumerate(rows, wanted[0][0]):
+            while i < len(wanted) and wanted[i][0] == row_n:
+                column = wanted[i][1]
+                i += 1
+                value = row[column - min_column] if column - min_column < len(row) else None
+                if value is not None:
+                    cellref = f"{get_column_letter(column)}{row_n}"
+                    sheet_data[cellref] = _template_cell(file_name, sheet.title, cellref, value)
+    if not sheet_data and datamap.coordinates(sheet.title):
+        sheet_data = _first_value(file_name, sheet, row_limit)
+    return sheet_data
+
+
+def read_template(
+    template_file,
+    row_limit: Union[int, str, None] = None,
+    timings: Optional[Timings] = None,
+    datamap: Optional[CompiledDatamap] = None,
+    streaming: bool = False,
+) -> TEMPLATE_DATA:
+    """Return the data in a populated template, keyed by the template's file name.
+
+    Only the first ``row_limit`` rows of each sheet are read (``Config.TEMPLATE_ROW_LIMIT``
+    by default). If ``datamap`` is given, only the cells it uses are read; otherwise
+    every cell is, as bcompiler-engine does.
+
+    If ``streaming`` is True, the template is opened read-only and only the rows of
+    each sheet needed by ``datamap`` are parsed, rather than the whole workbook
+    being loaded first.
+
+    If ``row_limit`` is ``AUTO_ROW_LIMIT``, each sheet is read as far as the last row
+    used by ``datamap``, and no further; the template is always streamed.
+    """
+    auto = row_limit == AUTO_ROW_LIMIT
+    if auto:
+        streaming = True
+    if streaming and datamap is None:
+        raise ValueError("A datamap is needed to stream a template.")
+    logger.info(f"Starting import of {template_file}.")
+    f_path = Path(template_file)
+    # with AUTO_ROW_LIMIT each sheet has its own limit, set below
+    limit = int(Config.TEMPLATE_ROW_LIMIT if row_limit is None or auto else row_limit)
+    file_name = template_file.as_posix() if isinstance(template_file, Path) else template_file
+    with _stage(timings, "workbook_open", f_path.name):
+        workbook = _open_template(template_file, read_only=streaming)
+    with _stage(timings, "cell_extraction", f_path.name):
+        data: Dict[str, Dict[str, Dict[str, str]]] = {}
+        try:
+            for sheet in workbook.worksheets:
+                if datamap is None:
+                    data[sheet.title] = _sheet_data(file_name, sheet, limit)
+                elif streaming:
+                    if auto:
+                        # rows up to row_limit + 1 are read, as bcompiler-engine does
+                        sheet_limit = datamap.max_row(sheet.title) - 1
+                    else:
+                        sheet_limit = limit
+                    data[sheet.title] = _streamed_sheet_data(file_name, sheet, sheet_limit, datamap)
+                else:
+                    data[sheet.title] = _datamap_sheet_data(file_name, sheet, limit, datamap)
+        finally:
+            workbook.close()
+        checksum = hash_file(f_path)
+    logger.info(f"Compiled data from {f_path.name}")
+    return {f_path.name: {"data": data, "checksum": checksum}}
+
+
+def _read_template_timed(
+    template_file, row_limit: Union[int, str], datamap: Optional[CompiledDatamap], streaming: bool
+):
+    """Used in worker processes, which cannot share the parent's Timings."""
+    timings = Timings()
+    data = read_template(template_file, row_limit, timings, datamap, streaming)
+    timings.stop()
+    return data, [tuple(r) for r in timings.records]
+
+
+def _reader(
+    row_limit: Union[int, str],
+    timings: Optional[Timings],
+    datamap: Optional[CompiledDatamap],
+    streaming: bool,
+    checkpoint: Optional[Checkpoint] = None,
+    resume: bool = False,
+):
+    """Return the function used to read each template in a worker process."""
+    reader: Callable
+    if timings is None:
+        reader = partial(read_template, row_limit=row_limit, datamap=datamap, streaming=streaming)
+    else:
+        reader = partial(
+            _read_template_timed, row_limit=row_limit, datamap=datamap, streaming=streaming
+        )
+    if checkpoint is not None:
+        reader = checkpoint.wrap(reader, resume, timed=timings is not None)
+    return reader
+
+
+def extract(
+    template_files: List[Path],
+    row_limit: Union[int, str],
+    timings: Optional[Timings] = None,
+    datamap: Optional[CompiledDatamap] = None,
+    streaming: bool = False,
+    checkpoint: Optional[Checkpoint] = None,
+    resume: bool = False,
+) -> TEMPLATE_DATA:
+    """Extract the data from each template, using a process per CPU.
+
+    If ``datamap`` is given, only the cells it uses are extracted. See
+    :py:func:`read_template` for ``streaming``. If ``checkpoint`` is given, the data
+    from each template is saved to it as it is read (see
+    :py:class:`datamaps.process.checkpoint.Checkpoint` for ``resume``).
+    """
+    data: TEMPLATE_DATA = {}
+    reader = _reader(row_limit, timings, datamap, streaming, checkpoint, resume)
+    with futures.ProcessPoolExecutor() as pool:
+        if timings is None:
+            for file in pool.map(reader, template_files):
+                data.update(file)
+        else:
+            for file, records in pool.map(reader, template_files):
+                data.update(file)
+                timings.extend(records)
+    return data
+
+
+def extract_isolated(
+    template_files: List[Path],
+    row_limit: Union[int, str],
+    timings: Optional[Timings] = None,
+    datamap: Optional[CompiledDatamap] = None,
+    streaming: bool = False,
+    max_memory: Optional[int] = None,
+    timeout: Optional[float] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    resume: bool = False,
+) -> Tuple[TEMPLATE_DATA, Dict[str, str]]:
+    """Extract the data from each template as :py:func:`extract` does, but with each
+    template read in a new process, which is stopped if it uses more than ``max_memory``
+    MB or takes more than ``timeout`` seconds (see :py:func:`datamaps.process.sandbox.run_isolated`).
+
+    Returns the data, and why each template which could not be read failed, by file name.
+    """
+    reader = _reader(row_limit, timings, datamap, streaming, checkpoint, resume)
+    data: TEMPLATE_DATA = {}
+    failures: Dict[str, str] = {}
+    for template_file, result, error in run_isolated(
+        reader, template_files, max_memory=max_memory, timeout=timeout
+    ):
+        if error is not None:
+            name = Path(template_file).name
+            logger.warning(f"Not importing {name}. {error}")
+            failures[name] = error
+        elif timings is None:
+            data.update(result)
+        else:
+            file, records = result
+            data.update(file)
+            timings.extend(records)
+    return data, failures
+
+
+def failure_checks(failures: Dict[str, str]) -> List[ValidationCheck]:
+    """Return a failed validation check for each template which could not be read,
+    so that it is listed in the validation report."""
+    return [
+        ValidationCheck(
+            passes="FAIL",
+            filename=name,
+            key="",
+            value=f"Not imported. {error}",
+            cellref="",
+            sheetname="",
+            wanted="",
+            got="",
+        )
+        for name, error in failures.items()
+    ]
+
+
+def _first_of_each(keys: Dict[str, str]) -> Dict[str, str]:
+    """Return, for each name whose key is the same as that of a name before it (in name
+    order), the first of those names."""
+    first: Dict[str, str] = {}
+    for name in sorted(keys):
+        first.setdefault(keys[name], name)
+    return {name: first[key] for name, key in keys.items() if first[key] != name}
+
+
+def drop_duplicate_files(template_files: List[Path]) -> Tuple[List[Path], Dict[str, str]]:
+    """Return ``template_files`` without any which are byte for byte the same as another,
+    and, by file name, which file each one left out is the same as. Of each set of
+    identical files, the first by name is kept."""
+    same = _first_of_each({Path(f).name: hash_file(f) for f in template_files})
+    duplicates = {name: f"Same file as {original}." for name, original in same.items()}
+    for name, message in duplicates.items():
+        logger.warning(f"Not importing {name}. {message}")
+    return [f for f in template_files if Path(f).name not in same], duplicates
+
+
+def fingerprint(datamap: CompiledDatamap, template_data: Dict[str, Any]) -> str:
+    """Return a checksum of the values of the cells in ``datamap`` for one template's data
+    (``{"data": {sheet: {cellref: cell}}}``)."""
+    h = hashlib.md5()
+    sheets = template_data["data"]
+    for line in datamap.lines:
+        cell = sheets.get(line.sheet, {}).get(line.cellref)
+        h.update(repr(None if cell is None else cell["value"]).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def drop_duplicate_templates(
+    template_data: TEMPLATE_DATA, datamap: CompiledDatamap
+) -> Tuple[TEMPLATE_DATA, Dict[str, str]]:
+    """Return ``template_data`` without any template whose datamap cells all have the same
+    values as another's, and, by file name, which template each one left out is the same
+    as. Of each set of the same templates, the first by name is kept."""
+    same = _first_of_each({name: fingerprint(datamap, data) for name, data in template_data.items()})
+    duplicates = {name: f"Same data as {original}." for name, original in same.items()}
+    for name, message in duplicates.items():
+        logger.warning(f"Not importing {name}. {message}")
+    return {k: v for k, v in template_data.items() if k not in same}, duplicates
+
+
+def screen_templates(
+    template_files: List[Path], datamap: CompiledDatamap
+) -> Tuple[List[Path], Dict[str, str]]:
+    """Return the templates whose sheets used by ``datamap`` are of a plausible size,
+    and, by file name, why each of the rest is left out.
+
+    The size of each sheet is read from the file without loading it (see
+    :py:mod:`datamaps.process.sniff`).
+    """
+    output = []
+    left_out: Dict[str, str] = {}
+    for template_file in template_files:
+        try:
+            problems = oversized_sheets(template_file, datamap.sheets)
+        except (BadZipFile, KeyError, ElementTree.ParseError):
+            # let opening the file report the problem
+            problems = []
+        if problems:
+            name = Path(template_file).name
+            left_out[name] = " ".join(problems)
+            logger.warning(f"Not importing {name}. {left_out[name]}")
+        else:
+            output.append(template_file)
+    return output, left_out
+
+
+def format_data_for_master(datamap_data: DATAMAP_DATA, template_data: TEMPLATE_DATA) -> MASTER_DATA:
+    """Return a (key, value) column for each template, in datamap order.
+
+    Where a datamap key appears more than once for a sheet, the first cell
+    reference is used.
+    """
+    cellrefs: Dict[Tuple[Optional[str], Optional[str]], Optional[str]] = {}
+    for dml in datamap_data:
+        cellrefs.setdefault((dml["key"], dml["sheet"]), dml["cellref"])
+    output = []
+    for file_name, file_data in template_data.items():
+        col = []
+        for dml in datamap_data:
+            sheet_data = file_data["data"][dml["sheet"]]
+            cell = sheet_data.get(cellrefs[(dml["key"], dml["sheet"])])
+            # keys are never None; only data_type is optional
+            col.append((cast(str, dml["key"]), cell["value"] if cell is not None else ""))
+        output.append({file_name: col})
+    return output
+
+
+def checkpoint_dir(source) -> Path:
+    """Return the directory in which the data read from the templates in ``source``, an
+    input directory or zip file, is kept; each source has its own, so that imports from
+    different places, even at the same time, do not share it."""
+    key = hashlib.md5(str(Path(source).resolve()).encode()).hexdigest()
+    return Path(Config.DATAMAPS_LIBRARY_DATA_DIR) / "checkpoint" / key
+
+
+def import_and_create_master(echo_funcs, datamap=None, timings: Optional[Timings] = None, **kwargs):
+    """Import all spreadsheet files from input directory and process with datamap.
+
+    Takes the same arguments as ``engine.adapters.cli.import_and_create_master``. If
+    ``timings`` is given, the duration of each stage is recorded in it. If ``pipeline``
+    is True, the import is run by :py:func:`datamaps.process.pipeline.import_pipelined`.
+
+    Returns the data for the master, as :py:func:`format_data_for_master` does. If
+    ``savemaster`` is False, the master is not written (but, unlike with
+    ``validationonly``, the datamap need not have types). ``echo_funcs`` may be None
+    to leave bcompiler-engine's output as it is.
+
+    If ``checkpoint`` is True, the data read from each template is kept (see
+    :py:class:`datamaps.process.checkpoint.Checkpoint`, in :py:func:`checkpoint_dir`)
+    until the import has finished. If ``resume`` is True, which implies ``checkpoint``,
+    data kept from an import which did not finish is used rather than reading those
+    templates again.
+
+    If ``dedupe`` is :py:data:`DEDUPE_FILES`, templates which are the same file as another
+    are not read; if it is :py:data:`DEDUPE_CELLS`, templates whose datamap cells have
+    the same values as another's are also left out of the validation and master. Both
+    are listed in the validation report.
+
+    ``format`` is ``"xlsx"`` (the default), ``"csv"`` or ``"both"``: a CSV master is
+    written a row at a time, without building a workbook, next to where the xlsx master
+    would go.
+
+    If ``watch`` is True, the input directory is watched for new and changed templates
+    by a :py:class:`datamaps.process.watch.Watcher`, checking every ``interval`` seconds.
+    """
+
+    if echo_funcs is not None:
+        for colour in ["GREEN", "RED", "YELLOW", "WHITE"]:
+            setattr(
+                engine.use_cases.parsing,
+                f"ECHO_FUNC_{colour}",
+                echo_funcs[f"click_echo_{colour.lower()}"],
+            )
+
+    master_fn = Config.config_parser["DEFAULT"]["master file name"]
+    auto_row_limit = kwargs.get("rowlimit") == AUTO_ROW_LIMIT
+    if kwargs.get("rowlimit") and not auto_row_limit:
+        Config.TEMPLATE_ROW_LIMIT = kwargs.get("rowlimit")
+
+    if kwargs.get("validationonly") or kwargs.get("savemaster") is False:
+        output_repo = ValidationOnlyRepository
+        master_fn = ""
+    else:
+        output_repo = MasterOutputRepository
+
+    zipinput = kwargs.get("zipinput")
+    if zipinput:
+        source = zipinput
+    elif kwargs.get("inputdir"):
+        source = kwargs.get("inputdir")
+    else:
+        source = Config.PLATFORM_DOCS_DIR / "input"
+
+    if auto_row_limit:
+        row_limit: Union[int, str] = AUTO_ROW_LIMIT
+        logger.info("Row limit is set by the datamap.")
+    else:
+        row_limit = int(Config.TEMPLATE_ROW_LIMIT)
+        if row_limit < 50:
+            logger.warning(
+                f"Row limit is set to {Config.TEMPLATE_ROW_LIMIT} (default is 500). This may be "
+                f"unintentionally low. Check datamaps import templates --help"
+            )
+        else:
+            logger.info(f"Row limit is set to {Config.TEMPLATE_ROW_LIMIT}.")
+
+    if datamap:
+        dm_fn = datamap
+    else:
+        dm_fn = Config.config_parser["DEFAULT"]["datamap file name"]
+    dm = Path(source) / dm_fn
+    with _stage(timings, "datamap_parse"):
+        compiled = compile_datamap(dm)
+        datamap_data = compiled.to_dicts()
+    if not compiled.is_typed and kwargs.get("validationonly"):
+        logger.critical("Cannot validate data. The datamap needs to have a 'type' column.")
+        sys.exit(1)
+
+    streaming = kwargs.get("streaming", False)
+    output_format = kwargs.get("format") or "xlsx"
+    if output_repo == MasterOutputRepository:
+        master_path: Optional[Path] = Path(Config.PLATFORM_DOCS_DIR) / "output" / master_fn
+    else:
+        master_path = None
+    if kwargs.get("watch"):
+        from .watch import Watcher
+
+        interval = kwargs.get("interval") or 2.0
+        watcher = Watcher(
+            Path(source),
+            dm,
+            row_limit,
+            master_path,
+            compiled,
+            streaming,
+            kwargs.get("maxmemory"),
+            kwargs.get("timeout"),
+            settle=interval,
+            output_format=output_format,
+        )
+        return watcher.run(interval)
+
+    resume = kwargs.get("resume", False)
+    dedupe = kwargs.get("dedupe")
+    checkpoint: Optional[Checkpoint] = None
+    if resume or kwargs.get("checkpoint"):
+        checkpoint = Checkpoint(checkpoint_dir(source), compiled.checksum, row_limit, streaming)
+        if not resume:
+            checkpoint.clear()
+    tmp_dir = None
+    with _stage(timings, "extraction"):
+        if zipinput:
+            tmp_dir, template_files = extract_zip_file_to_tmpdir(zipinput)
+        else:
+            template_files = get_xlsx_files(Path(source))
+        try:
+            # templates left out before they are read, with why, for the validation report
+            left_out: Dict[str, str] = {}
+            if auto_row_limit:
+                template_files, left_out = screen_templates(template_files, compiled)
+            duplicates: Dict[str, str] = {}
+            if dedupe:
+                # so that the first of each set of duplicates is kept, however they are read
+                template_files = sorted(template_files, key=lambda f: Path(f).name)
+                template_files, duplicates = drop_duplicate_files(template_files)
+            left_out.update(duplicates)
+            if kwargs.get("pipeline"):
+                from .pipeline import import_pipelined
+
+                data_for_master = import_pipelined(
+                    template_files,
+                    compiled,
+                    row_limit,
+                    master_path,
+                    timings,
+                    streaming,
+                    kwargs.get("isolate", False),
+                    kwargs.get("maxmemory"),
+                    kwargs.get("timeout"),
+                    checkpoint,
+                    resume,
+                    left_out,
+                    dedupe == DEDUPE_CELLS,
+                    output_format,
+                )
+                if checkpoint is not None:
+                    checkpoint.clear()
+                return data_for_master
+            if kwargs.get("isolate"):
+                template_data, failures = extract_isolated(
+                    template_files,
+                    row_limit,
+                    timings,
+                    compiled,
+                    streaming,
+                    kwargs.get("maxmemory"),
+                    kwargs.get("timeout"),
+                    checkpoint,
+                    resume,
+                )
+            else:
+                template_data = extract(
+                    template_files, row_limit, timings, compiled, streaming, checkpoint, resume
+                )
+                failures = {}
+            if dedupe == DEDUPE_CELLS:
+                template_data, same_data = drop_duplicate_templates(template_data, compiled)
+                left_out.update(same_data)
+        finally:
+            if tmp_dir is not None:
+                logger.info(f"Removing temporary directory {tmp_dir}.")
+                shutil.rmtree(tmp_dir)
+
+    if compiled.is_typed:
+        with _stage(timings, "validation"):
+            validation_checks = validation_checker(datamap_data, template_data)
+            validation_checks.extend(failure_checks(failures))
+            validation_checks.extend(failure_checks(left_out))
+    logger.info("Checking template data.")
+    checks = check_datamap_sheets(datamap_data, template_data)
+    template_data = remove_failing_files(checks, template_data)
+    data_for_master = format_data_for_master(datamap_data, template_data)
+    if compiled.is_typed:
+        with _stage(timings, "validation_report"):
+            # default is to filter out dmls that do not have type declared in dm
+            pth = ValidationReportCSV([x for x in validation_checks if x.wanted is not None]).write()
+        logger.info(f"Validation report written to {pth}.")
+
+    with _stage(timings, "master_write"):
+        if master_path is None or output_format in ("xlsx", "both"):
+            output_repo(data_for_master, master_fn).save()
+        if master_path is not None and output_format in ("csv", "both"):
+            from .pipeline import write_master_csv
+
+            names = [next(iter(column)) for column in data_for_master]
+            columns = [[value for _, value in column[name]] for column, name in zip(data_for_master, names)]
+            csv_path = master_path.with_suffix(".csv")
+            write_master_csv(csv_path, [line.key for line in compiled.lines], names, columns)
+            logger.info(f"{csv_path.name} successfully created in {csv_path.parent}\n")
+    if checkpoint is not None:
+        checkpoint.clear()
+    return data_for_master
@@ -0,0 +1,292 @@
+"""
+Importing templates as a pipeline.
+
+:py:func:`datamaps.process.importer.import_and_create_master` reads every
+template, then validates them all, then builds and writes the master, so the
+data from every template is in memory at once. Here the templates are read by
+worker processes while, in this process, each template's data is dealt with
+as soon as it arrives: it is validated, its checks are written to the
+validation report, and it is reduced to the column of values it adds to the
+master, after which it is discarded. Only a few templates are read ahead of
+the one being dealt with, so memory use does not grow with the size of the
+batch.
+
+A master has a column for each template, but a write-only openpyxl worksheet
+has to be written a row at a time, so the columns of values are kept until
+the last template has been read and the master is then written row by row.
+"""
+import csv
+import datetime
+import logging
+import os
+from collections import deque
+from concurrent import futures
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from engine.config import Config
+from engine.exceptions import NoApplicableSheetsInTemplateFiles
+from engine.utils.extraction import CheckType, check_datamap_sheets
+from engine.utils.validation import ValidationCheck, validation_checker
+from openpyxl import Workbook
+
+from .checkpoint import Checkpoint
+from .datamap import CompiledDatamap
+from .importer import (DATAMAP_DATA, MASTER_DATA, TEMPLATE_DATA, _reader, _stage,
+                       failure_checks, fingerprint, format_data_for_master)
+from .sandbox import Outcome, iter_isolated
+from .timings import Timings
+
+logger = logging.getLogger(__name__)
+
+MASTER_XLSX = "xlsx"
+MASTER_CSV = "csv"
+MASTER_BOTH = "both"
+
+
+def iter_in_pool(
+    func: Callable, items: Sequence, jobs: Optional[int] = None, ahead: Optional[int] = None
+) -> Iterator[Tuple[Any, Any]]:
+    """Yield ``(item, func(item))`` for each of ``items``, in order, using a process pool.
+
+    No more than ``ahead`` items (twice the number of processes by default) are
+    worked on, or waiting to be yielded, at once.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if ahead is None:
+        ahead = jobs * 2
+    with futures.ProcessPoolExecutor(jobs) as pool:
+        queued: Deque[Tuple[Any, futures.Future]] = deque()
+        todo = iter(items)
+        for item in todo:
+            queued.append((item, pool.submit(func, item)))
+            if len(queued) >= ahead:
+                break
+        while queued:
+            item, future = queued.popleft()
+            result = future.result()
+            for next_item in todo:
+                queued.append((next_item, pool.submit(func, next_item)))
+                break
+            yield item, result
+
+
+def validation_report_path() -> Path:
+    """Return the path for a new validation report, named as the engine names them."""
+    timestamp = (
+        datetime.datetime.today()
+        .isoformat(timespec="seconds")
+        .replace(":", "_")
+        .replace("-", "_")
+    )
+    return Path(Config.FULL_PATH_OUTPUT) / f"validation_report_{timestamp}.csv"
+
+
+class ValidationReportStream:
+    """Writes validation checks to a CSV file as they are made, in the same format as
+    ``engine.reports.validation.ValidationReportCSV``.
+
+    The file is ``path``, or a new timestamped report in the output directory.
+    """
+
+    FIELDNAMES = [
+        "Pass Status",
+        "Filename",
+        "Key",
+        "Value",
+        "Cell Reference",
+        "Sheet Name",
+        "Expected Type",
+        "Got Type",
+    ]
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = validation_report_path() if path is None else path
+        self._f = open(self.path, "w", newline="")
+        self._writer = csv.writer(self._f)
+        self._writer.writerow(self.FIELDNAMES)
+
+    def write(self, checks: List[ValidationCheck]) -> None:
+        for item in checks:
+            # default is to filter out dmls that do not have type declared in dm
+            if item.wanted is None:
+                continue
+            value = item.value
+            if isinstance(value, str):
+                value = value.replace(";", "").replace(",", " ")
+            self._writer.writerow(
+                [
+                    item.passes,
+                    item.filename,
+                    item.key,
+                    value,
+                    item.cellref,
+                    item.sheetname,
+                    item.wanted,
+                    item.got,
+                ]
+            )
+
+    def close(self) -> Path:
+        self._f.close()
+        return self.path
+
+
+def master_column(datamap_data: DATAMAP_DATA, template_data: TEMPLATE_DATA) -> Optional[List[Any]]:
+    """Return the values the template in ``template_data`` adds to the master, in datamap
+    order, or None (with warnings logged) if it does not have the sheets the datamap needs."""
+    name = next(iter(template_data))
+    checks = check_datamap_sheets(datamap_data, template_data)
+    missing = sorted({c.sheet for c in checks if c.state == CheckType.FAIL})
+    if missing:
+        for sheet in missing:
+            logger.warning(f"{sheet} sheet missing from {name} - it is required by the datamap.")
+        logger.warning(f"{name} skipped due to not having requisite sheets named in datamap.")
+        return None
+    return [value for _, value in format_data_for_master(datamap_data, template_data)[0][name]]
+
+
+def write_master(
+    path: Path, keys: List[str], names: List[str], columns: List[List[Any]]
+) -> None:
+    """Write a master, with ``keys`` in column A and a column of values for each of
+    ``names``, as ``engine.repository.master.MasterOutputRepository`` does, using a
+    write-only workbook."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Master")
+    ws.append(
+        [Config.config_parser["DEFAULT"]["return reference name"]]
+        + [name.split(".")[0] for name in names]
+    )
+    for i, key in enumerate(keys):
+        ws.append([key] + [column[i] for column in columns])
+    wb.save(path)
+
+
+def write_master_csv(
+    path: Path, keys: List[str], names: List[str], columns: List[List[Any]]
+) -> None:
+    """Write a master as :py:func:`write_master` does, but as a CSV file, a row at a time.
+
+    Empty cells are left blank, and other values are written as ``str()`` gives them.
+    """
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [Config.config_parser["DEFAULT"]["return reference name"]]
+            + [name.split(".")[0] for name in names]
+        )
+        for i, key in enumerate(keys):
+            writer.writerow([key] + [column[i] for column in columns])
+
+
+def save_master(
+    path: Path,
+    keys: List[str],
+    names: List[str],
+    columns: List[List[Any]],
+    output_format: str = MASTER_XLSX,
+) -> List[Path]:
+    """Write a master to ``path`` as xlsx, or as CSV with the suffix changed to .csv, or
+    both (``output_format`` is ``"xlsx"``, ``"csv"`` or ``"both"``). Returns the paths
+    written."""
+    paths = []
+    if output_format in (MASTER_XLSX, MASTER_BOTH):
+        write_master(path, keys, names, columns)
+        paths.append(path)
+    if output_format in (MASTER_CSV, MASTER_BOTH):
+        csv_path = Path(path).with_suffix(".csv")
+        write_master_csv(csv_path, keys, names, columns)
+        paths.append(csv_path)
+    return paths
+
+
+def import_pipelined(
+    template_files: List[Path],
+    datamap: CompiledDatamap,
+    row_limit: Union[int, str],
+    master_path: Optional[Path],
+    timings: Optional[Timings] = None,
+    streaming: bool = False,
+    isolate: bool = False,
+    max_memory: Optional[int] = None,
+    timeout: Optional[float] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    resume: bool = False,
+    left_out: Optional[Dict[str, str]] = None,
+    dedupe_cells: bool = False,
+    output_format: str = MASTER_XLSX,
+) -> MASTER_DATA:
+    """Import ``template_files``, writing the validation report as each template is read,
+    and then the master to ``master_path`` (if it is given).
+
+    The options are as for :py:func:`datamaps.process.importer.extract` and
+    :py:func:`datamaps.process.importer.extract_isolated`. ``left_out`` says, by file
+    name, why each template already left out (as a duplicate, or by
+    :py:func:`datamaps.process.importer.screen_templates`) was, for the validation report.
+    If ``dedupe_cells`` is True, a template whose datamap cells have the same values as
+    those of a template already read is left out too. See :py:func:`save_master` for
+    ``output_format``.
+
+    Returns the data for the master, as
+    :py:func:`datamaps.process.importer.format_data_for_master` does.
+    """
+    reader = _reader(row_limit, timings, datamap, streaming, checkpoint, resume)
+    if isolate:
+        results = iter_isolated(reader, template_files, max_memory=max_memory, timeout=timeout)
+    else:
+        results = (
+            Outcome(item, result, None) for item, result in iter_in_pool(reader, template_files)
+        )
+
+    datamap_data = datamap.to_dicts()
+    report = ValidationReportStream() if datamap.is_typed else None
+    names: List[str] = []
+    columns: List[List[Any]] = []
+    fingerprints: Dict[str, str] = {}
+    try:
+        if report is not None and left_out:
+            report.write(failure_checks(left_out))
+        for template_file, result, error in results:
+            if error is not None:
+                name = Path(template_file).name
+                logger.warning(f"Not importing {name}. {error}")
+                if report is not None:
+                    report.write(failure_checks({name: error}))
+                continue
+            if timings is not None:
+                result, records = result
+                timings.extend(records)
+            name = next(iter(result))
+            if dedupe_cells:
+                key = fingerprint(datamap, result[name])
+                if key in fingerprints:
+                    error = f"Same data as {fingerprints[key]}."
+                    logger.warning(f"Not importing {name}. {error}")
+                    if report is not None:
+                        report.write(failure_checks({name: error}))
+                    continue
+                fingerprints[key] = name
+            if report is not None:
+                report.write(validation_checker(datamap_data, result))
+            column = master_column(datamap_data, result)
+            if column is not None:
+                names.append(name)
+                columns.append(column)
+    finally:
+        if report is not None:
+            logger.info(f"Validation report written to {report.close()}.")
+    if not names:
+        msg = "There are no files containing sheets declared in datamap. Quitting."
+        logger.critical(msg)
+        raise NoApplicableSheetsInTemplateFiles(msg)
+
+    keys = [line.key for line in datamap.lines]
+    with _stage(timings, "master_write"):
+        if master_path is None:
+            logger.info("No output file produced as not requested.")
+        else:
+            for path in save_master(master_path, keys, names, columns, output_format):
+                logger.info(f"{path.name} successfully created in {path.parent}\n")
+    return [{name: list(zip(keys, column))} for name, column in zip(names, columns)]
@@ -0,0 +1,141 @@
+"""
+Running a function on each of a batch of items, each in a process of its own.
+
+A badly formed spreadsheet can make openpyxl use all the memory there is, or
+take forever, and when that happens in a process pool the whole batch is lost.
+Here each item gets a new process, which is killed if it uses more memory or
+takes longer than allowed, so that item fails on its own and the rest carry
+on. As no process handles more than one item, memory leaked by one item
+cannot build up and cause a later one to fail.
+"""
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from typing import (Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence,
+                    Tuple, cast)
+
+logger = logging.getLogger(__name__)
+
+# how often, in seconds, each process's memory use and running time are checked
+POLL_INTERVAL = 0.1
+
+
+class Outcome(NamedTuple):
+    item: Any
+    result: Any
+    error: Optional[str]
+
+
+def _run(conn, func: Callable, item: Any) -> None:
+    result: Tuple[Any, Optional[str]]
+    try:
+        result = (func(item), None)
+    except Exception as e:
+        result = (None, f"{type(e).__name__}: {e}")
+    try:
+        conn.send(result)
+    except Exception as e:  # the result could not be pickled
+        conn.send((None, f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def memory_use(pid: int) -> Optional[int]:
+    """Return the resident memory of process ``pid`` in bytes, or None if it cannot be found."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _over(process: multiprocessing.Process, max_memory: int) -> bool:
+    """Whether ``process`` is using more than ``max_memory`` MB."""
+    used = memory_use(process.pid) if process.pid is not None else None
+    return (used or 0) > max_memory * 1024 * 1024
+
+
+def iter_isolated(
+    func: Callable,
+    items: Sequence,
+    jobs: Optional[int] = None,
+    max_memory: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[Outcome]:
+    """Yield the outcome of ``func(item)`` for each of ``items``, in order, as soon as it
+    is known. See :py:func:`run_isolated`."""
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if max_memory is not None and memory_use(os.getpid()) is None:
+        logger.warning("Memory use cannot be limited on this platform.")
+        max_memory = None
+    outcomes: Dict[int, Outcome] = {}
+    pending = deque(enumerate(items))
+    running: Dict[Connection, Tuple[int, multiprocessing.Process, float]] = {}
+    next_i = 0
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                i, item = pending.popleft()
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=_run, args=(sender, func, item), daemon=True)
+                process.start()
+                sender.close()
+                running[receiver] = (i, process, time.monotonic())
+
+            # wait() returns the connections it is given
+            for conn in cast(List[Connection], wait(list(running), timeout=POLL_INTERVAL)):
+                i, process, _ = running.pop(conn)
+                try:
+                    result, error = conn.recv()
+                except EOFError:
+                    process.join()
+                    result, error = None, f"Process stopped unexpectedly (exit code {process.exitcode})."
+                conn.close()
+                process.join()
+                outcomes[i] = Outcome(items[i], result, error)
+
+            now = time.monotonic()
+            for conn, (i, process, started) in list(running.items()):
+                if timeout is not None and now - started > timeout:
+                    error = f"Took longer than {timeout:g} seconds."
+                elif max_memory is not None and _over(process, max_memory):
+                    error = f"Used more than {max_memory}MB of memory."
+                else:
+                    continue
+                process.kill()
+                process.join()
+                conn.close()
+                del running[conn]
+                outcomes[i] = Outcome(items[i], None, error)
+
+            while next_i in outcomes:
+                yield outcomes.pop(next_i)
+                next_i += 1
+    finally:
+        for conn, (_, process, _) in running.items():
+            process.kill()
+            process.join()
+            conn.close()
+
+
+def run_isolated(
+    func: Callable,
+    items: Sequence,
+    jobs: Optional[int] = None,
+    max_memory: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> List[Outcome]:
+    """Return ``func(item)`` for each of ``items``, in order, each run in a new process.
+
+    Up to ``jobs`` processes (one per CPU by default) are run at once. A process
+    using more than ``max_memory`` MB, or running for more than ``timeout``
+    seconds, is killed. For an item which fails in either of these ways, or
+    whose process raises or dies, ``result`` is None and ``error`` says why.
+
+    Memory use can only be checked where ``/proc`` is available (i.e. on Linux).
+    """
+    return list(iter_isolated(func, items, jobs, max_memory, timeout))
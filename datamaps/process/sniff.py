@@ -0,0 +1,106 @@
+"""
+Finding the size of each sheet in a spreadsheet without loading it.
+
+An xlsx/xlsm file is a zip of XML files, one per sheet. Each sheet's XML
+starts with a ``<dimension>`` element giving the range of cells in use, and
+the zip records how large each sheet's XML is, so both can be read without
+parsing any cells. Templates which have been copied, pasted and restyled for
+years can claim to use hundreds of thousands of rows; these are found here
+before any attempt is made to load them.
+"""
+import logging
+import posixpath
+import re
+import zipfile
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+from xml.etree import ElementTree
+
+from openpyxl.utils.cell import range_boundaries
+
+logger = logging.getLogger(__name__)
+
+# a sheet claiming more rows than this is not a template
+MAX_SHEET_ROWS = 100_000
+# nor is one whose XML is larger than this
+MAX_SHEET_XML_SIZE = 256 * 1024 * 1024
+
+# the <dimension> element comes before the sheet data, so is near the start
+_HEAD_SIZE = 64 * 1024
+_DIMENSION = re.compile(rb'<(?:\w+:)?dimension\s+ref="([^"]+)"')
+_NS = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+
+
+class SheetSize(NamedTuple):
+    sheet: str
+    max_row: Optional[int]
+    max_column: Optional[int]
+    xml_size: int
+
+
+def sheet_paths(zf: zipfile.ZipFile) -> Dict[str, str]:
+    """Return the path in the zip of each sheet's XML, by sheet name."""
+    workbook = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+    rels = ElementTree.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.findall("rel:Relationship", _NS)}
+    output = {}
+    for sheet in workbook.iterfind("main:sheets/main:sheet", _NS):
+        name = sheet.get("name")
+        target = targets.get(sheet.get(f"{{{_NS['r']}}}id"))
+        if name is None or target is None:
+            continue
+        if target.startswith("/"):
+            output[name] = target.lstrip("/")
+        else:
+            output[name] = posixpath.normpath(posixpath.join("xl", target))
+    return output
+
+
+def sheet_sizes(path: Path) -> List[SheetSize]:
+    """Return the size of each sheet in the spreadsheet at ``path``.
+
+    ``max_row`` and ``max_column`` are None if the sheet does not say what range it uses.
+    """
+    output = []
+    with zipfile.ZipFile(path) as zf:
+        for sheet, sheet_path in sheet_paths(zf).items():
+            try:
+                info = zf.getinfo(sheet_path)
+            except KeyError:
+                continue
+            with zf.open(info) as f:
+                head = f.read(_HEAD_SIZE)
+            max_row = max_column = None
+            match = _DIMENSION.search(head)
+            if match:
+                try:
+                    _, _, max_column, max_row = range_boundaries(match.group(1).decode())
+                except ValueError:
+                    pass
+            output.append(SheetSize(sheet, max_row, max_column, info.file_size))
+    return output
+
+
+def oversized_sheets(
+    path: Path,
+    sheets=None,
+    max_rows: int = MAX_SHEET_ROWS,
+    max_xml_size: int = MAX_SHEET_XML_SIZE,
+) -> List[str]:
+    """Return a description of each sheet in the spreadsheet at ``path`` which is too big to
+    be a template. Only the sheets named in ``sheets`` are checked, if it is given."""
+    problems = []
+    for size in sheet_sizes(path):
+        if sheets is not None and size.sheet not in sheets:
+            continue
+        if size.max_row is not None and size.max_row > max_rows:
+            problems.append(f'Sheet "{size.sheet}" claims to use {size.max_row} rows.')
+        elif size.xml_size > max_xml_size:
+            problems.append(
+                f'Sheet "{size.sheet}" is {size.xml_size // (1024 * 1024)}MB uncompressed.'
+            )
+    return problems
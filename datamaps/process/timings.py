@@ -0,0 +1,117 @@
+import csv
+import datetime
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+
+class StageTiming(NamedTuple):
+    """How long a single stage of an import took, and its peak (traced) memory."""
+
+    template: str
+    stage: str
+    seconds: float
+    peak_memory: int
+
+
+def _reset_peak() -> None:
+    # tracemalloc.reset_peak() only exists on Python 3.9+. On older versions
+    # the peak reported is the highest seen since tracing started.
+    reset = getattr(tracemalloc, "reset_peak", None)
+    if reset is not None:
+        reset()
+
+
+class Timings:
+    """Collects per-template and per-stage durations during an import.
+
+    Wrap each stage in :py:meth:`stage`::
+
+        timings = Timings()
+        with timings.stage("datamap_parse"):
+            ...
+        timings.write(output_dir)
+
+    Memory is measured using :py:mod:`tracemalloc`, which only sees memory
+    allocated by Python and makes the import itself noticeably slower; it
+    is intended for finding pathological templates rather than for routine use.
+    """
+
+    def __init__(self, trace_memory: bool = True) -> None:
+        self.trace_memory = trace_memory
+        self.records: List[StageTiming] = []
+        self._start = time.perf_counter()
+        self._started_at = datetime.datetime.today()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, stage: str, template: str = ""):
+        """Time the enclosed block as ``stage`` (optionally for ``template``)."""
+        if self.trace_memory:
+            _reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else 0
+            self.records.append(StageTiming(template, stage, seconds, peak))
+
+    def extend(self, records: Iterable[Tuple]) -> None:
+        """Add records collected elsewhere, e.g. in a worker process."""
+        self.records.extend(StageTiming(*r) for r in records)
+
+    @property
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self._start
+
+    @property
+    def peak_memory(self) -> int:
+        return max((r.peak_memory for r in self.records), default=0)
+
+    def per_template(self) -> List[Tuple[str, float]]:
+        """Total seconds spent on each template, slowest first."""
+        totals: dict = {}
+        for r in self.records:
+            if r.template:
+                totals[r.template] = totals.get(r.template, 0.0) + r.seconds
+        return sorted(totals.items(), key=lambda x: x[1], reverse=True)
+
+    def stop(self) -> None:
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def write(self, output_dir: Path, timestamp: Optional[str] = None) -> Tuple[Path, Path]:
+        """Write the timings to a JSON and a CSV file in ``output_dir``.
+
+        Returns the paths of the two files written.
+        """
+        if timestamp is None:
+            timestamp = (
+                datetime.datetime.today()
+                .isoformat(timespec="seconds")
+                .replace(":", "_")
+                .replace("-", "_")
+            )
+        output_dir = Path(output_dir)
+        json_file = output_dir / f"timings_report_{timestamp}.json"
+        csv_file = output_dir / f"timings_report_{timestamp}.csv"
+        summary = dict(
+            started=self._started_at.isoformat(timespec="seconds"),
+            total_seconds=self.total_seconds,
+            peak_memory=self.peak_memory,
+            templates=[dict(template=t, seconds=s) for t, s in self.per_template()],
+            stages=[r._asdict() for r in self.records],
+        )
+        with open(json_file, "w") as f:
+            json.dump(summary, f, indent=2)
+        with open(csv_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Template", "Stage", "Seconds", "Peak Memory"])
+            for r in self.records:
+                writer.writerow([r.template, r.stage, f"{r.seconds:.6f}", r.peak_memory])
+        return json_file, csv_file
@@ -0,0 +1,229 @@
+"""
+Keeping a master up to date as templates arrive.
+
+During a return period templates are added to the input directory a few at a
+time, and corrected versions replace earlier ones. Rather than importing the
+whole batch again each time, :py:class:`Watcher` polls the input directory
+and reads only the templates which are new or have changed since it last
+looked. The validation checks and master values of every template are kept
+in memory, along with the compiled datamap, so after each change the
+validation report and master are rewritten without reading any other
+template.
+
+Polling is used, rather than a notifier specific to an operating system, so
+that it works the same everywhere, including on network drives.
+"""
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from engine.utils.extraction import get_xlsx_files
+from engine.utils.validation import ValidationCheck, validation_checker
+
+from .datamap import CompiledDatamap, compile_datamap
+from .importer import AUTO_ROW_LIMIT, _reader, failure_checks, screen_templates
+from .pipeline import (MASTER_XLSX, ValidationReportStream, master_column, save_master,
+                       validation_report_path)
+from .sandbox import iter_isolated
+
+logger = logging.getLogger(__name__)
+
+# (modification time in ns, size in bytes)
+FileState = Tuple[int, int]
+
+
+class _Template(NamedTuple):
+    state: FileState
+    checks: List[ValidationCheck]
+    # None if the template is not in the master
+    column: Optional[List[Any]]
+
+
+def scan(directory: Path) -> Dict[Path, FileState]:
+    """Return the state of each template in ``directory``."""
+    output = {}
+    for path in get_xlsx_files(Path(directory)):
+        # Excel's lock files for open workbooks
+        if path.name.startswith("~$"):
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        output[path] = (stat.st_mtime_ns, stat.st_size)
+    return output
+
+
+class Watcher:
+    """Imports the templates in ``directory`` whenever they change.
+
+    Args:
+        directory: the input directory
+        datamap_file: the datamap; if it changes, every template is read again
+        row_limit: as for :py:func:`datamaps.process.importer.read_template`
+        master_path: where the master is written, or None for validation only
+        datamap: ``datamap_file``, already compiled
+        streaming: as for :py:func:`datamaps.process.importer.read_template`
+        max_memory, timeout: as for :py:func:`datamaps.process.sandbox.run_isolated`
+        settle: how long, in seconds, the directory must be unchanged before a change
+            is acted on, so that templates which are still being copied are not read
+        output_format: as for :py:func:`datamaps.process.pipeline.save_master`
+
+    Each template is read in a process of its own, so that one which cannot be
+    read is reported and does not stop the watching.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        datamap_file: Path,
+        row_limit: Union[int, str],
+        master_path: Optional[Path],
+        datamap: Optional[CompiledDatamap] = None,
+        streaming: bool = False,
+        max_memory: Optional[int] = None,
+        timeout: Optional[float] = None,
+        settle: float = 2.0,
+        output_format: str = MASTER_XLSX,
+    ) -> None:
+        self.directory = Path(directory)
+        self.datamap_file = Path(datamap_file)
+        self.row_limit = row_limit
+        self.master_path = master_path
+        self.streaming = streaming
+        self.max_memory = max_memory
+        self.timeout = timeout
+        self.settle = settle
+        self.output_format = output_format
+        self.report_path = validation_report_path()
+        self._datamap = datamap or compile_datamap(self.datamap_file)
+        self._datamap_data = self._datamap.to_dicts()
+        self._datamap_state = self._state(self.datamap_file)
+        self._templates: Dict[Path, _Template] = {}
+        self._seen: Optional[Dict[Path, FileState]] = None
+        self._changed_at = 0.0
+
+    @staticmethod
+    def _state(path: Path) -> Optional[FileState]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _snapshot(self) -> Dict[Path, FileState]:
+        snapshot = scan(self.directory)
+        state = self._state(self.datamap_file)
+        if state is not None:
+            snapshot[self.datamap_file] = state
+        return snapshot
+
+    def poll(self, now: Optional[float] = None) -> bool:
+        """Look for changes, and update if the directory has settled since the last
+        change. Returns True if an update was made."""
+        now = time.monotonic() if now is None else now
+        snapshot = self._snapshot()
+        if snapshot != self._seen:
+            self._seen = snapshot
+            self._changed_at = now
+            return False
+        if now - self._changed_at < self.settle or not self._pending(snapshot):
+            return False
+        self.update(snapshot)
+        return True
+
+    def _pending(self, snapshot: Dict[Path, FileState]) -> bool:
+        templates = {p: s for p, s in snapshot.items() if p != self.datamap_file}
+        if snapshot.get(self.datamap_file) != self._datamap_state:
+            return True
+        return {p: t.state for p, t in self._templates.items()} != templates
+
+    def update(self, snapshot: Optional[Dict[Path, FileState]] = None) -> None:
+        """Read the templates which are new or have changed, then write the validation
+        report and master."""
+        if snapshot is None:
+            snapshot = self._snapshot()
+        datamap_state = snapshot.get(self.datamap_file)
+        if datamap_state != self._datamap_state:
+            try:
+                datamap = compile_datamap(self.datamap_file)
+            except Exception as e:
+                logger.error(f"Cannot read datamap {self.datamap_file}, so keeping the last one. {e}")
+            else:
+                logger.info(f"{self.datamap_file.name} has changed. Reading every template again.")
+                self._datamap = datamap
+                self._datamap_data = datamap.to_dicts()
+                self._templates.clear()
+            self._datamap_state = datamap_state
+
+        templates = {p: s for p, s in snapshot.items() if p != self.datamap_file}
+        removed = [p for p in self._templates if p not in templates]
+        for path in removed:
+            logger.info(f"{path.name} has been removed.")
+            del self._templates[path]
+        changed = sorted(
+            p for p, s in templates.items() if p not in self._templates or self._templates[p].state != s
+        )
+        to_read = changed
+        if self.row_limit == AUTO_ROW_LIMIT:
+            to_read, left_out = screen_templates(changed, self._datamap)
+            for path in set(changed) - set(to_read):
+                self._templates[path] = _Template(
+                    templates[path], failure_checks({path.name: left_out[path.name]}), None
+                )
+
+        reader = _reader(self.row_limit, None, self._datamap, self.streaming)
+        outcomes = iter_isolated(reader, to_read, max_memory=self.max_memory, timeout=self.timeout)
+        for path, result, error in outcomes:
+            if error is not None:
+                logger.warning(f"Not importing {path.name}. {error}")
+                self._templates[path] = _Template(templates[path], failure_checks({path.name: error}), None)
+                continue
+            logger.info(f"Read {path.name}.")
+            checks = validation_checker(self._datamap_data, result) if self._datamap.is_typed else []
+            self._templates[path] = _Template(
+                templates[path], checks, master_column(self._datamap_data, result)
+            )
+        if changed or removed:
+            self.write()
+
+    def write(self) -> None:
+        """Write the validation report and master from the templates read so far."""
+        paths = sorted(self._templates, key=lambda p: p.name)
+        if self._datamap.is_typed:
+            report = ValidationReportStream(self.report_path)
+            try:
+                for path in paths:
+                    report.write(self._templates[path].checks)
+            finally:
+                logger.info(f"Validation report written to {report.close()}.")
+        if self.master_path is None:
+            return
+        names: List[str] = []
+        columns: List[List[Any]] = []
+        for p in paths:
+            column = self._templates[p].column
+            if column is not None:
+                names.append(p.name)
+                columns.append(column)
+        if not names:
+            logger.warning("There are no files containing sheets declared in datamap. Master not written.")
+            return
+        keys = [line.key for line in self._datamap.lines]
+        for path in save_master(self.master_path, keys, names, columns, self.output_format):
+            logger.info(f"{path.name} updated with {len(names)} templates.")
+
+    def run(self, interval: float = 2.0) -> None:
+        """Import the templates, then check for changes every ``interval`` seconds until
+        interrupted."""
+        logger.info(f"Watching {self.directory} for changes. Press Ctrl-C to stop.")
+        self._seen = self._snapshot()
+        self._changed_at = time.monotonic()
+        self.update(self._seen)
+        try:
+            while True:
+                time.sleep(interval)
+                self.poll()
+        except KeyboardInterrupt:
+            logger.info(f"Stopped watching {self.directory}.")
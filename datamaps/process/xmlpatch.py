@@ -0,0 +1,446 @@
+"""
+Writing populated templates by patching the blank template's XML.
+
+Populating a template with openpyxl means loading every sheet and style of
+the blank template, which can take seconds for a large one, then writing all
+of it out again, for every project in the master. Only the cells in the
+datamap change, though. :py:class:`TemplatePatcher` works out, once per blank
+template, where in each sheet's XML each datamap cell is (or where it would
+go, if the blank template does not have it), and splits the XML around those
+places. Every other file in the blank template's zip is compressed once, too.
+A populated template is then that zip with the sheets added, each made by
+joining the pieces of its XML with the new XML for the datamap cells, so
+only the datamap's sheets are compressed again for each project.
+
+The cells are written as openpyxl would write them: strings inline, dates as
+numbers in the cell's style or, if that is not a date format, a copy of it
+with openpyxl's date format. Sheets with something which cannot be patched
+like this, such as a datamap cell holding a formula which other cells share,
+raise :py:class:`UnsupportedTemplate` so that the caller can use openpyxl
+instead.
+"""
+import io
+import logging
+import re
+import zipfile
+from typing import Any, Dict, List, Optional, Set, Tuple, Type, Union
+from xml.sax.saxutils import escape, unescape
+
+from openpyxl.cell.cell import ERROR_CODES, ILLEGAL_CHARACTERS_RE, NUMERIC_TYPES, TIME_FORMATS
+from openpyxl.compat import safe_string
+from openpyxl.styles.numbers import BUILTIN_FORMATS_REVERSE, builtin_format_code, is_date_format
+from openpyxl.utils.cell import column_index_from_string, get_column_letter, range_boundaries
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH, to_excel
+from openpyxl.utils.exceptions import IllegalCharacterError
+
+from .datamap import CompiledDatamap
+from .sniff import sheet_paths
+
+logger = logging.getLogger(__name__)
+
+_ATTRS = re.compile(r'([\w:]+)\s*=\s*"([^"]*)"')
+_ENCODING = re.compile(r'<\?xml[^>]*encoding="([^"]+)"')
+_SHEET_DATA = re.compile(r"<sheetData\s*/>|<sheetData\b[^>]*>(.*?)</sheetData>", re.S)
+_ROW = re.compile(r"<row\b([^>]*?)(?:/>|>(.*?)</row>)", re.S)
+_CELL = re.compile(r"<c\b([^>]*?)(?:/>|>(.*?)</c>)", re.S)
+_SPANS = re.compile(r'\s+spans="[^"]*"')
+_FORMULA = re.compile(r"<f\b([^>]*)")
+_DIMENSION = re.compile(r'<dimension\s+ref="([^"]*)"\s*/>')
+_MERGE_CELL = re.compile(r'<mergeCell\s+ref="([^"]*)"')
+_NUM_FMTS = re.compile(r"<numFmts\b[^>]*?(?:/>|>(.*?)</numFmts>)", re.S)
+_NUM_FMT = re.compile(r"<numFmt\b([^>]*?)/>")
+_CELL_XFS = re.compile(r"<cellXfs\b[^>]*?(?:/>|>(.*?)</cellXfs>)", re.S)
+_XF = re.compile(r"<xf\b([^>]*?)(?:/>|>.*?</xf>)", re.S)
+_STYLE_SHEET = re.compile(r"<styleSheet\b[^>]*>")
+_DATE_1904 = re.compile(r'<workbookPr\b[^>]*\bdate1904="(?:1|true)"')
+_CALC_PR = re.compile(r"<calcPr\b([^>]*?)\s*/>")
+# elements which come after <calcPr> in workbook.xml
+_AFTER_CALC_PR = re.compile(
+    r"<(?:oleSize|customWorkbookViews|pivotCaches|smartTagPr|smartTagTypes|webPublishing"
+    r"|fileRecoveryPr|webPublishObjects|extLst)\b|</workbook>"
+)
+_CALC_CHAIN = "xl/calcChain.xml"
+_CALC_CHAIN_OVERRIDE = re.compile(r'<Override\b[^>]*PartName="/xl/calcChain\.xml"[^>]*/>')
+_CALC_CHAIN_REL = re.compile(r'<Relationship\b[^>]*Target="[^"]*calcChain\.xml"[^>]*/>')
+_DIGITS = "0123456789"
+_FIRST_CUSTOM_FORMAT = 164
+
+
+class UnsupportedTemplate(Exception):
+    """The blank template has something in it which cannot be patched as openpyxl would write it."""
+
+
+def _attrs(text: str) -> Dict[str, str]:
+    return dict(_ATTRS.findall(text))
+
+
+def _coordinate(ref: str) -> Tuple[int, int]:
+    letters = ref.rstrip(_DIGITS)
+    return int(ref[len(letters):]), column_index_from_string(letters)
+
+
+class _Slot:
+    """A datamap cell in a sheet's XML: what is there in the blank template, and its style."""
+
+    __slots__ = ("ref", "style", "original", "merged")
+
+    def __init__(self, ref: str, style: Optional[str] = None, original: str = "") -> None:
+        self.ref = ref
+        self.style = style
+        self.original = original
+        # a cell within a merged range, other than its top left
+        self.merged = False
+
+
+class _Sheet:
+    """The XML of a sheet, as pieces of text and the indexes of the slots between them."""
+
+    def __init__(self, path: str, info: zipfile.ZipInfo) -> None:
+        self.path = path
+        self.info = info
+        self.parts: List[Union[str, int]] = []
+        self.slots: List[_Slot] = []
+        self.cells: Dict[Tuple[int, int], int] = {}
+
+
+def _rows(cells: Set[Tuple[int, int]]) -> Dict[int, List[int]]:
+    rows: Dict[int, List[int]] = {}
+    for row, column in sorted(cells):
+        rows.setdefault(row, []).append(column)
+    return rows
+
+
+def _plan_sheet(sheet: _Sheet, xml: bytes, cells: Set[Tuple[int, int]]) -> None:
+    """Split the XML of ``sheet`` at ``cells``, adding any which are not already there."""
+    head = xml[:100].decode("ascii", "replace")
+    match = _ENCODING.match(head)
+    if match and match.group(1).lower() not in ("utf-8", "utf8"):
+        raise UnsupportedTemplate(f"{sheet.path} is encoded as {match.group(1)}.")
+    try:
+        text = xml.decode("utf-8")
+    except UnicodeDecodeError:
+        raise UnsupportedTemplate(f"{sheet.path} is not UTF-8.")
+    match = _SHEET_DATA.search(text)
+    if match is None:
+        raise UnsupportedTemplate(f"Cannot find the cells in {sheet.path}.")
+    if match.group(1) is None:
+        before, body, after = text[: match.start()] + "<sheetData>", "", "</sheetData>" + text[match.end():]
+    else:
+        before, body, after = text[: match.start(1)], match.group(1), text[match.end(1):]
+
+    # the range the sheet says it uses has to include the new cells
+    dimension = _DIMENSION.search(before)
+    if dimension is not None:
+        try:
+            min_col, min_row, max_col, max_row = range_boundaries(dimension.group(1))
+        except (TypeError, ValueError):
+            raise UnsupportedTemplate(f"Cannot read the dimension of {sheet.path}.")
+        min_row = min([min_row or 1] + [r for r, _ in cells])
+        min_col = min([min_col or 1] + [c for _, c in cells])
+        max_row = max([max_row or 1] + [r for r, _ in cells])
+        max_col = max([max_col or 1] + [c for _, c in cells])
+        ref = f"{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}"
+        before = f'{before[: dimension.start()]}<dimension ref="{ref}"/>{before[dimension.end():]}'
+
+    parts = sheet.parts
+    parts.append(before)
+    rows = _rows(cells)
+    pending = sorted(rows)
+    pos = 0
+    for row_match in _ROW.finditer(body):
+        attrs = _attrs(row_match.group(1))
+        if "r" not in attrs:
+            raise UnsupportedTemplate(f"A row in {sheet.path} has no number.")
+        row = int(attrs["r"])
+        parts.append(body[pos: row_match.start()])
+        while pending and pending[0] < row:
+            _new_row(sheet, pending.pop(0), rows)
+        if pending and pending[0] == row:
+            pending.pop(0)
+            _patch_row(sheet, row_match, row, rows[row])
+        else:
+            parts.append(row_match.group(0))
+        pos = row_match.end()
+    parts.append(body[pos:])
+    while pending:
+        _new_row(sheet, pending.pop(0), rows)
+    parts.append(after)
+
+    for merged in _MERGE_CELL.findall(after):
+        min_col, min_row, max_col, max_row = range_boundaries(merged)
+        for (row, column), slot in sheet.cells.items():
+            if min_row <= row <= max_row and min_col <= column <= max_col:
+                if (row, column) != (min_row, min_col):
+                    sheet.slots[slot].merged = True
+
+
+def _add_slot(sheet: _Sheet, row: int, column: int, slot: _Slot) -> None:
+    sheet.cells[(row, column)] = len(sheet.slots)
+    sheet.parts.append(len(sheet.slots))
+    sheet.slots.append(slot)
+
+
+def _new_row(sheet: _Sheet, row: int, rows: Dict[int, List[int]]) -> None:
+    sheet.parts.append(f'<row r="{row}">')
+    for column in rows[row]:
+        _add_slot(sheet, row, column, _Slot(f"{get_column_letter(column)}{row}"))
+    sheet.parts.append("</row>")
+
+
+def _patch_row(sheet: _Sheet, row_match, row: int, columns: List[int]) -> None:
+    # the spans, if given, may not include the new cells
+    sheet.parts.append(f"<row{_SPANS.sub('', row_match.group(1))}>")
+    content = row_match.group(2) or ""
+    pending = list(columns)
+    pos = 0
+    for cell_match in _CELL.finditer(content):
+        attrs = _attrs(cell_match.group(1))
+        if "r" not in attrs:
+            raise UnsupportedTemplate(f"A cell in row {row} of {sheet.path} has no reference.")
+        _, column = _coordinate(attrs["r"])
+        sheet.parts.append(content[pos: cell_match.start()])
+        while pending and pending[0] < column:
+            new = pending.pop(0)
+            _add_slot(sheet, row, new, _Slot(f"{get_column_letter(new)}{row}"))
+        if pending and pending[0] == column:
+            pending.pop(0)
+            formula = _FORMULA.search(cell_match.group(2) or "")
+            if formula is not None and "ref=" in formula.group(1):
+                raise UnsupportedTemplate(
+                    f"Cell {attrs['r']} of {sheet.path} has a formula which other cells use."
+                )
+            _add_slot(sheet, row, column, _Slot(attrs["r"], attrs.get("s"), cell_match.group(0)))
+        else:
+            sheet.parts.append(cell_match.group(0))
+        pos = cell_match.end()
+    sheet.parts.append(content[pos:])
+    for new in pending:
+        _add_slot(sheet, row, new, _Slot(f"{get_column_letter(new)}{row}"))
+    sheet.parts.append("</row>")
+
+
+def _date_styles(styles: str, bases: Set[int]) -> Tuple[str, Dict[Tuple[int, Type], int]]:
+    """Return ``styles`` with the cell styles needed for dates added, and the style to use for
+    each type of date in a cell of each of the ``bases`` styles.
+
+    As openpyxl does, a date keeps its cell's style if that has a date format, and otherwise
+    gets the style with openpyxl's format for its type.
+    """
+    cell_xfs = _CELL_XFS.search(styles)
+    if cell_xfs is None:
+        raise UnsupportedTemplate("Cannot find the cell styles in the blank template.")
+    xfs = [(m.group(0), m.group(1)) for m in _XF.finditer(cell_xfs.group(1) or "")]
+    num_fmts = _NUM_FMTS.search(styles)
+    custom: Dict[int, str] = {}
+    if num_fmts is not None:
+        for m in _NUM_FMT.finditer(num_fmts.group(1) or ""):
+            fmt_attrs = _attrs(m.group(1))
+            custom[int(fmt_attrs["numFmtId"])] = unescape(
+                fmt_attrs.get("formatCode", ""), {"&quot;": '"'}
+            )
+    format_ids = {code: fmt_id for fmt_id, code in custom.items()}
+
+    new_fmts: List[str] = []
+    new_xfs: List[str] = []
+    output: Dict[Tuple[int, Type], int] = {}
+    for base in sorted(bases):
+        if base >= len(xfs):
+            raise UnsupportedTemplate(f"Cell style {base} is not in the blank template.")
+        xf, attrs = xfs[base]
+        fmt_id = int(_attrs(attrs).get("numFmtId", 0))
+        code = custom[fmt_id] if fmt_id in custom else builtin_format_code(fmt_id)
+        for date_type, date_format in TIME_FORMATS.items():
+            if code is not None and is_date_format(code):
+                output[(base, date_type)] = base
+                continue
+            if date_format in BUILTIN_FORMATS_REVERSE:
+                new_id = BUILTIN_FORMATS_REVERSE[date_format]
+            elif date_format in format_ids:
+                new_id = format_ids[date_format]
+            else:
+                new_id = max(list(custom) + [_FIRST_CUSTOM_FORMAT - 1]) + 1
+                custom[new_id] = date_format
+                format_ids[date_format] = new_id
+                new_fmts.append(f'<numFmt numFmtId="{new_id}" formatCode="{escape(date_format)}"/>')
+            # "/>", or ">" and the child elements
+            rest = xf[len("<xf") + len(attrs):]
+            kept = re.sub(r'\s+(?:numFmtId|applyNumberFormat)="[^"]*"', "", attrs).rstrip()
+            new_xfs.append(f'<xf{kept} numFmtId="{new_id}" applyNumberFormat="1"{rest}')
+            output[(base, date_type)] = len(xfs) + len(new_xfs) - 1
+
+    if new_xfs:
+        xml = f'<cellXfs count="{len(xfs) + len(new_xfs)}">{cell_xfs.group(1) or ""}{"".join(new_xfs)}</cellXfs>'
+        styles = styles[: cell_xfs.start()] + xml + styles[cell_xfs.end():]
+    if new_fmts:
+        num_fmts = _NUM_FMTS.search(styles)
+        existing = (num_fmts.group(1) or "") if num_fmts is not None else ""
+        count = len(_NUM_FMT.findall(existing)) + len(new_fmts)
+        xml = f'<numFmts count="{count}">{existing}{"".join(new_fmts)}</numFmts>'
+        if num_fmts is not None:
+            styles = styles[: num_fmts.start()] + xml + styles[num_fmts.end():]
+        else:
+            # the number formats come first in the stylesheet
+            opening = _STYLE_SHEET.search(styles)
+            if opening is None:
+                raise UnsupportedTemplate("Cannot find the styles in the blank template.")
+            styles = styles[: opening.end()] + xml + styles[opening.end():]
+    return styles, output
+
+
+def _full_calc_on_load(workbook: str) -> str:
+    """Have Excel calculate the workbook when it is opened, so that formulae using the
+    datamap cells are up to date, as openpyxl does."""
+    calc_pr = _CALC_PR.search(workbook)
+    if calc_pr is not None:
+        attrs = re.sub(r'\s+fullCalcOnLoad="[^"]*"', "", calc_pr.group(1))
+        return f'{workbook[: calc_pr.start()]}<calcPr{attrs} fullCalcOnLoad="1"/>{workbook[calc_pr.end():]}'
+    after = _AFTER_CALC_PR.search(workbook)
+    if after is None:
+        raise UnsupportedTemplate("Cannot read the blank template's workbook.xml.")
+    return f'{workbook[: after.start()]}<calcPr fullCalcOnLoad="1"/>{workbook[after.start():]}'
+
+
+class TemplatePatcher:
+    """Populates copies of a blank template (given as the contents of the file) with values
+    for the cells in ``datamap``, by patching the XML of the blank template.
+
+    Raises :py:class:`UnsupportedTemplate` if the blank template cannot be patched.
+    """
+
+    def __init__(self, blank: bytes, datamap: CompiledDatamap) -> None:
+        self.datamap = datamap
+        with zipfile.ZipFile(io.BytesIO(blank)) as zf:
+            try:
+                paths = sheet_paths(zf)
+                workbook = zf.read("xl/workbook.xml").decode("utf-8")
+                styles = zf.read("xl/styles.xml").decode("utf-8")
+            except (KeyError, UnicodeDecodeError) as e:
+                raise UnsupportedTemplate(f"Cannot read the blank template. {e}")
+            self._sheet_names = set(paths)
+            self._epoch = MAC_EPOCH if _DATE_1904.search(workbook) else WINDOWS_EPOCH
+
+            cells: Dict[str, Set[Tuple[int, int]]] = {}
+            for line in datamap.lines:
+                if line.sheet in paths and line.row:
+                    cells.setdefault(paths[line.sheet], set()).add((line.row, line.column))
+            self._sheets: Dict[str, _Sheet] = {}
+            for path, sheet_cells in cells.items():
+                try:
+                    info = zf.getinfo(path)
+                except KeyError:
+                    raise UnsupportedTemplate(f"{path} is not in the blank template.")
+                sheet = _Sheet(path, info)
+                _plan_sheet(sheet, zf.read(info), sheet_cells)
+                self._sheets[path] = sheet
+
+            # where each datamap line's value goes, as (sheet, slot)
+            self._targets: List[Optional[Tuple[_Sheet, int]]] = []
+            for line in datamap.lines:
+                if line.sheet in paths and line.row:
+                    sheet = self._sheets[paths[line.sheet]]
+                    self._targets.append((sheet, sheet.cells[(line.row, line.column)]))
+                else:
+                    self._targets.append(None)
+
+            bases = {
+                int(slot.style or 0) for sheet in self._sheets.values() for slot in sheet.slots
+            }
+            styles, self._styles = _date_styles(styles, bases)
+            changed = {
+                "xl/styles.xml": styles.encode("utf-8"),
+                "xl/workbook.xml": _full_calc_on_load(workbook).encode("utf-8"),
+            }
+            # openpyxl leaves out the calculation chain, as it lists the cells with
+            # formulae; Excel makes it again
+            for name, pattern in (
+                ("[Content_Types].xml", _CALC_CHAIN_OVERRIDE),
+                ("xl/_rels/workbook.xml.rels", _CALC_CHAIN_REL),
+            ):
+                try:
+                    changed[name] = pattern.sub("", zf.read(name).decode("utf-8")).encode("utf-8")
+                except KeyError:
+                    pass
+
+            base = io.BytesIO()
+            with zipfile.ZipFile(base, "w", zipfile.ZIP_DEFLATED) as out:
+                for info in zf.infolist():
+                    if info.filename in self._sheets or info.filename == _CALC_CHAIN:
+                        continue
+                    data = changed.get(info.filename)
+                    out.writestr(info, zf.read(info) if data is None else data)
+        self._base = base.getvalue()
+
+    def _cell(self, slot: _Slot, value: Any) -> str:
+        """Return the XML for the cell of ``slot`` holding ``value``, as openpyxl would write it."""
+        style = slot.style
+        if value is None:
+            attrs, content = "", ""
+        elif isinstance(value, bool):
+            attrs, content = ' t="b"', f"<v>{int(value)}</v>"
+        elif isinstance(value, NUMERIC_TYPES):
+            attrs, content = ' t="n"', f"<v>{safe_string(value)}</v>"
+        elif isinstance(value, str):
+            value = value[:32767]
+            if next(ILLEGAL_CHARACTERS_RE.finditer(value), None):
+                raise IllegalCharacterError(f"{value} cannot be used in worksheets.")
+            if len(value) > 1 and value.startswith("="):
+                attrs, content = "", f"<f>{escape(value[1:])}</f><v></v>"
+            elif value in ERROR_CODES:
+                attrs, content = ' t="e"', f"<v>{escape(value)}</v>"
+            elif value == "":
+                attrs, content = ' t="inlineStr"', ""
+            else:
+                attrs = ' t="inlineStr"'
+                content = f'<is><t xml:space="preserve">{escape(value)}</t></is>'
+        elif isinstance(value, tuple(TIME_FORMATS)):
+            if getattr(value, "tzinfo", None) is not None:
+                raise TypeError(
+                    "Excel does not support timezones in datetimes. "
+                    "The tzinfo in the datetime/time object must be set to None."
+                )
+            date_type = next(t for t in TIME_FORMATS if isinstance(value, t))
+            style = str(self._styles[(int(style or 0), date_type)])
+            attrs, content = ' t="n"', f"<v>{safe_string(to_excel(value, self._epoch))}</v>"
+        else:
+            raise ValueError(f"Cannot convert {value!r} to Excel")
+        if style and style != "0":
+            attrs = f' s="{style}"{attrs}'
+        if not content:
+            return f'<c r="{slot.ref}"{attrs}/>'
+        return f'<c r="{slot.ref}"{attrs}>{content}</c>'
+
+    def populate(self, values: List[Tuple[int, Any]]) -> bytes:
+        """Return the contents of the blank template populated with ``values``, as
+        (datamap line number, value) pairs."""
+        cells: Dict[int, Dict[int, str]] = {id(sheet): {} for sheet in self._sheets.values()}
+        for i, value in values:
+            line = self.datamap.lines[i]
+            if line.sheet not in self._sheet_names:
+                logger.warning(
+                    f"Key: {line.key} missing a 'sheet' value in datamap. Check your datamap. "
+                    "Data MAY not export."
+                )
+                continue
+            target = self._targets[i]
+            if target is None:
+                logger.warning(f"No cellref in datamap for key: {line.key}. Cannot export this cell.")
+                continue
+            sheet, slot = target
+            if sheet.slots[slot].merged:
+                raise AttributeError(f"PROBLEM: Key->{line.key} Current Val->None Attempted Val->{value}")
+            cells[id(sheet)][slot] = self._cell(sheet.slots[slot], value)
+
+        output = io.BytesIO(self._base)
+        output.seek(0, io.SEEK_END)
+        with zipfile.ZipFile(output, "a", zipfile.ZIP_DEFLATED) as zf:
+            for sheet in self._sheets.values():
+                patched = cells[id(sheet)]
+                xml = "".join(
+                    part if isinstance(part, str) else patched.get(part, sheet.slots[part].original)
+                    for part in sheet.parts
+                )
+                info = zipfile.ZipInfo(sheet.path, sheet.info.date_time)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = sheet.info.external_attr
+                zf.writestr(info, xml.encode("utf-8"))
+        return output.getvalue()
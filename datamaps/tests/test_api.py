@@ -1,6 +1,10 @@
 import datetime
+import shutil
+from pathlib import Path
 
-from ..api import project_data_from_master, project_data_from_master_month
+import pytest
+
+from ..api import import_master, project_data_from_master, project_data_from_master_month
 from ..core.temporal import Month
 
 
@@ -46,3 +50,67 @@ def test_get_project_data_using_month(master):
     assert m2.year == 2021
     assert m3.year == 2021
     assert m5.year == 2021
+
+
+def test_pull_keys_with_slash_date_string():
+    from ..plugins.dft.master import ProjectData
+
+    p = ProjectData({"Start date": "20/08/2011", "Name": "Bridge"})
+    assert p.pull_keys(["Start date", "Name"]) == [("Start date", "20/08/2011"), ("Name", "Bridge")]
+
+
+def test_master_with_typed_values(tmp_path):
+    from openpyxl import Workbook
+
+    from ..plugins.dft.metrics import InMemoryMetrics
+    from ..plugins.dft.master import Master
+    from ..core import Quarter
+
+    wb = Workbook()
+    ws = wb.active
+    for row in [
+        ["file name", "Project A", "Project B"],
+        ["Budget", "£1000.50", "£1000.50"],
+        ["Complete", "50%", 0.25],
+        ["Start", "25/01/2021", datetime.datetime(2021, 1, 25)],
+        ["Name", "Bridge", "Tunnel"],
+    ]:
+        ws.append(row)
+    wb.save(tmp_path / "master.xlsx")
+    metrics = InMemoryMetrics()
+    m = Master(Quarter(1, 2021), str(tmp_path / "master.xlsx"), metrics=metrics, type_values=True)
+    assert m["Project A"]["Budget"] == 1000.5
+    assert m["Project A"]["Complete"] == 0.5
+    assert m["Project A"]["Start"] == datetime.date(2021, 1, 25)
+    assert m["Project B"]["Start"] == datetime.date(2021, 1, 25)
+    assert m["Project A"]["Name"] == "Bridge"
+    assert metrics.counts["master.value_cache_hits"] == 1
+
+    untyped = Master(Quarter(1, 2021), str(tmp_path / "master.xlsx"))
+    assert untyped["Project A"]["Budget"] == "£1000.50"
+
+
+@pytest.mark.parametrize("options", [{}, {"pipeline": True}])
+def test_import_master(mock_config, resource_dir, tmp_path, monkeypatch, options):
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    for name in ("datamap.csv", "dft1_tmp.xlsm"):
+        shutil.copy(resource_dir / name, tmp_path / name)
+    master_file = Path(mock_config.PLATFORM_DOCS_DIR) / "output" / "master.xlsx"
+    if master_file.exists():
+        master_file.unlink()
+
+    m = import_master(1, 2021, input_dir=tmp_path, row_limit=500, **options)
+    assert not master_file.exists()
+    assert m.quarter.quarter == 1 and m.quarter.year == 2021
+    assert m.projects == ["dft1_tmp"]
+
+    saved = import_master(1, 2021, input_dir=tmp_path, row_limit=500, save=True, **options)
+    assert saved.path == str(master_file)
+    assert m.data == saved.data == project_data_from_master(master_file, 1, 2021).data
+
+
+@pytest.mark.parametrize("option", ["watch", "validationonly"])
+def test_import_master_rejects_options_without_a_master(option):
+    with pytest.raises(ValueError, match=option):
+        import_master(1, 2021, **{option: True})
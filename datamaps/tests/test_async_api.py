@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ..api import async_api, load_master_async, load_masters_async
+from ..plugins.dft.master import Master
+
+
+def test_load_master_async(master):
+    m = asyncio.run(load_master_async(str(master), 1, 2019))
+    assert isinstance(m, Master)
+    assert m.projects == ["Chutney Bridge.xlsm"]
+    assert m.quarter.quarter == 1
+
+
+def test_load_masters_async_limit(master, monkeypatch):
+    lock = threading.Lock()
+    running = []
+    most = []
+
+    def load(master_file, quarter, year, **kwargs):
+        with lock:
+            running.append(quarter)
+            most.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(quarter)
+        return quarter
+
+    monkeypatch.setattr(async_api, "_load_master", load)
+
+    async def main():
+        with ThreadPoolExecutor(8) as executor:
+            return await load_masters_async(
+                [(str(master), q, 2019) for q in range(1, 9)], limit=2, executor=executor
+            )
+
+    assert asyncio.run(main()) == list(range(1, 9))
+    assert max(most) <= 2
+
+
+def test_load_masters_async_cancels_pending(master, monkeypatch):
+    started = []
+
+    def load(master_file, quarter, year, **kwargs):
+        started.append(quarter)
+        time.sleep(0.1)
+        return quarter
+
+    monkeypatch.setattr(async_api, "_load_master", load)
+
+    async def main():
+        task = asyncio.ensure_future(
+            load_masters_async([(str(master), q, 2019) for q in range(1, 5)], limit=1)
+        )
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.2)
+
+    asyncio.run(main())
+    assert started == [1]
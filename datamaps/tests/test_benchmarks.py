@@ -0,0 +1,26 @@
+import pytest
+
+from ..benchmarks import Benchmark, generators
+from ..benchmarks.scenarios import SCALES, SCENARIOS
+from ..plugins.dft.portfolio import project_data_from_master
+
+
+def test_generators_are_deterministic(tmp_path):
+    assert generators.messy_strings(50, seed=1) == generators.messy_strings(50, seed=1)
+    assert generators.datamap_lines(30) == generators.datamap_lines(30)
+    first = generators.write_master(tmp_path / "a.xlsx", 3, 20)
+    second = generators.write_master(tmp_path / "b.xlsx", 3, 20)
+    assert project_data_from_master(str(first)) == project_data_from_master(str(second))
+
+
+def test_generated_master_shape(tmp_path):
+    data = project_data_from_master(str(generators.write_master(tmp_path / "m.xlsx", 4, 25)))
+    assert list(data) == [f"Project {p}" for p in range(4)]
+    assert all(len(p) == 25 for p in data.values())
+
+
+@pytest.mark.parametrize("name", list(SCENARIOS))
+def test_scenarios_run(tmp_path, name):
+    bench = Benchmark(rounds=1)
+    SCENARIOS[name](bench, tmp_path, SCALES["tiny"])
+    assert len(bench.times) == 1
@@ -0,0 +1,72 @@
+import datetime
+import shutil
+
+import pytest
+
+from ..process.checkpoint import Checkpoint
+from ..process.datamap import compile_datamap
+from ..process.importer import extract
+
+
+def _read(template_file):
+    return {template_file.name: {"data": {"Sheet": {"A1": datetime.date(2020, 1, 1)}}}}
+
+
+def _fail(template_file):
+    raise AssertionError(f"{template_file.name} read again")
+
+
+def test_checkpoint_save_and_load(tmp_path):
+    template = tmp_path / "template.xlsm"
+    template.write_bytes(b"template")
+    checkpoint = Checkpoint(tmp_path / "checkpoint", "datamap", 500)
+    assert checkpoint.load(template) is None
+    checkpoint.save(template, _read(template))
+    assert checkpoint.load(template) == _read(template)
+    # a different datamap or row limit, or a changed template, does not use the saved data
+    assert Checkpoint(tmp_path / "checkpoint", "datamap", 100).load(template) is None
+    template.write_bytes(b"changed")
+    assert Checkpoint(tmp_path / "checkpoint", "datamap", 500).load(template) is None
+    checkpoint.clear()
+    assert not (tmp_path / "checkpoint").exists()
+
+
+def test_checkpoint_resume(tmp_path):
+    template = tmp_path / "template.xlsm"
+    template.write_bytes(b"template")
+    checkpoint = Checkpoint(tmp_path / "checkpoint", "datamap")
+    assert checkpoint.wrap(_read)(template) == _read(template)
+    assert checkpoint.wrap(_fail, resume=True)(template) == _read(template)
+    assert checkpoint.wrap(_fail, resume=True, timed=True)(template) == (_read(template), [])
+
+
+def test_copy_under_another_name_is_read(tmp_path):
+    template = tmp_path / "template.xlsm"
+    template.write_bytes(b"template")
+    copy = tmp_path / "copy.xlsm"
+    copy.write_bytes(b"template")
+    checkpoint = Checkpoint(tmp_path / "checkpoint", "datamap")
+    checkpoint.wrap(_read)(template)
+    with pytest.raises(AssertionError, match="copy.xlsm read again"):
+        checkpoint.wrap(_fail, resume=True)(copy)
+    assert checkpoint.wrap(_read, resume=True)(copy) == _read(copy)
+
+
+def test_extract_resumes(resource_dir, tmp_path):
+    for name in ("test_template.xlsm", "dft1_tmp.xlsm"):
+        shutil.copy(resource_dir / name, tmp_path / name)
+    templates = sorted(tmp_path.glob("*.xlsm"))
+    datamap = compile_datamap(resource_dir / "datamap.csv", cache_dir=tmp_path / "datamaps")
+    checkpoint = Checkpoint(tmp_path / "checkpoint", datamap.checksum, 500)
+    first = extract(templates[:1], 500, datamap=datamap, checkpoint=checkpoint)
+    assert len(list((tmp_path / "checkpoint").glob("*.pickle"))) == 1
+    assert extract(templates, 500, datamap=datamap, checkpoint=checkpoint, resume=True) == extract(
+        templates, 500, datamap=datamap
+    )
+    assert set(first) == {templates[0].name}
+    # a byte-identical copy under another name is imported as well, not as the original
+    shutil.copy(templates[0], tmp_path / "a_copy.xlsm")
+    copies = extract(
+        sorted(tmp_path.glob("*.xlsm")), 500, datamap=datamap, checkpoint=checkpoint, resume=True
+    )
+    assert set(copies) == {"a_copy.xlsm"} | {t.name for t in templates}
@@ -0,0 +1,48 @@
+from ..process.checks import ERROR, WARNING, CheckCache, Problem, check_files
+
+
+def test_check_reports_every_problem(resource_dir, tmp_path):
+    dm = tmp_path / "datamap.csv"
+    dm.write_text(
+        "cell_key,template_sheet,cellreference,type\n"
+        "Project/Programme Name,Introduction,C11,TEXT\n"
+        "No sheet,,C12,TEXT\n"
+        "Bad cellref,Introduction,C0,TEXT\n"
+        "Missing sheet,Not A Sheet,C13,TEXT\n"
+        "Project/Programme Name,Introduction,C14,TEXT\n"
+        "Far away,Introduction,ZZ9999,TEXT\n"
+    )
+    blank = resource_dir / "blank_template.xlsm"
+    problems, cached = check_files(dm, blank)
+    assert not cached
+    assert [(p.severity, p.line) for p in problems] == [
+        (ERROR, 3),
+        (ERROR, 4),
+        (ERROR, 5),
+        (WARNING, 6),
+        (WARNING, 7),
+    ]
+    assert str(problems[0]) == (
+        "Line 3 of datamap: Line whose key is No sheet is missing a sheet field. "
+        "Cannot proceed. Please fix datamap."
+    )
+    assert str(problems[2]) == 'Line 5 of datamap: Sheet "Not A Sheet" is not in blank_template.xlsm.'
+
+
+def test_check_cache(resource_dir, tmp_path, monkeypatch):
+    from ..process import checks
+
+    cache_file = tmp_path / "cache.json"
+    dm = resource_dir / "datamap_short.csv"
+    blank = resource_dir / "blank_template.xlsm"
+    problems, cached = check_files(dm, blank, CheckCache(cache_file))
+    assert not cached and problems
+
+    def fail(*args):
+        raise AssertionError("should not be checked again")
+
+    monkeypatch.setattr(checks, "check_datamap", fail)
+    again, cached = check_files(dm, blank, CheckCache(cache_file))
+    assert cached
+    assert again == problems
+    assert isinstance(again[0], Problem)
@@ -1,5 +1,8 @@
 import datetime
-from ..process.cleansers import Cleanser
+import json
+
+from ..plugins.dft.portfolio import project_data_from_master
+from ..process.cleansers import Cleanser, CleansingReport, ValueTyper
 
 
 def test_cleaning_dot_date():
@@ -39,3 +42,50 @@ def test_double_trailing_space():
     assert c.clean() == 'Pre 14-15 BL - Incoming both Revenue and Capital'
     c = Cleanser(contains_single_trailing)
     assert c.clean() == 'Pre 14-15 BL - Incoming both Revenue and Capital'
+
+
+def test_cleansing_report_accumulates_across_strings():
+    report = CleansingReport()
+    for s in ["Text, with, commas", "Trailing  ", "25/01/2072", "Clean"]:
+        Cleanser(s, report=report).clean()
+    assert report.strings == 4
+    assert report.cleaned == 3
+    assert report.counts["commas"] == 2
+    assert report.counts["trailing_space"] == 1
+    assert report.counts["date"] == 1
+
+
+def test_cleansing_report_from_master(master, tmp_path):
+    report = CleansingReport()
+    project_data_from_master(str(master), report=report)
+    assert report.strings > 0
+    other = CleansingReport()
+    other.update(report)
+    other.update(report)
+    assert other.strings == report.strings * 2
+    json_file = report.write(tmp_path / "report.json")
+    assert json.loads(json_file.read_text())["strings"] == report.strings
+    csv_file = report.write(tmp_path / "report.csv")
+    assert csv_file.read_text().splitlines()[0] == "Rule,Count"
+
+
+def test_value_typer():
+    report = CleansingReport()
+    typer = ValueTyper(report=report)
+    values = ["£1000.50", "-£12", "50%", "25/01/2072", "2072-01-25", "12", "1.5",
+              "Some text, with  spaces ", None, 4, datetime.date(2020, 1, 1), "12"]
+    assert [typer(v) for v in values] == [
+        1000.5, -12.0, 0.5, datetime.date(2072, 1, 25), datetime.date(2072, 1, 25), 12, 1.5,
+        "Some text, with  spaces ", None, 4, datetime.date(2020, 1, 1), 12,
+    ]
+    assert typer.hits == 1
+    assert typer.misses == 8
+    # a cached value is still counted in the report
+    assert report.strings == 9
+    assert report.counts["int"] == 2
+
+
+def test_value_typer_leaves_text_alone():
+    typer = ValueTyper()
+    assert typer("25/01/2072 or thereabouts") == "25/01/2072 or thereabouts"
+    assert typer("20A") == "20A"
@@ -1,3 +1,5 @@
+import csv
+import json
 import logging
 import os
 import shutil
@@ -6,7 +8,9 @@ from sys import platform
 
 import pytest
 from click.testing import CliRunner
-from datamaps.main import _import, export
+from openpyxl import Workbook, load_workbook
+from datamaps.main import _import, export, report
+from datamaps.process.importer import checkpoint_dir
 
 
 def _copy_resources_to_input(config, directory):
@@ -152,6 +156,18 @@ def test_export_with_flag_template(mock_config, resource_dir):
     assert output.is_file()
 
 
+def test_export_with_xml_engine(mock_config, resource_dir):
+    runner = CliRunner()
+    mock_config.initialise()
+    _copy_resources_to_input(mock_config, resource_dir)
+    _master_file = os.path.join(mock_config.PLATFORM_DOCS_DIR, "input", "master.xlsx")
+    _dm_file = os.path.join(mock_config.PLATFORM_DOCS_DIR, "input", "datamap_short.csv")
+    result = runner.invoke(export, ["master", _master_file, "-d", _dm_file, "--engine", "xml"])
+    assert result.exit_code == 0
+    output = mock_config.PLATFORM_DOCS_DIR / "output" / "Chutney Bridge.xlsm"
+    assert output.is_file()
+
+
 @pytest.mark.skip("TODO")
 def test_export_with_alternative_datamap_not_csv(mock_config, resource_dir, caplog):
     runner = CliRunner()
@@ -206,3 +222,247 @@ def test_no_expected_sheet_in_batch_import_to_master(mock_config, resource_dir):
     )
     # assert "Imported data from input/dft1_temp.xlsm to output/master.xlsx." in result.output
     # assert "Finished." in result.output
+
+
+def test_import_with_timings(mock_config, resource_dir, caplog, monkeypatch, tmp_path):
+    runner = CliRunner()
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    caplog.set_level(logging.INFO)
+    _copy_resources_to_input(mock_config, resource_dir)
+    result = runner.invoke(_import, ["templates", "-m", "--timings"])
+    assert result.exit_code == 0
+    json_reports = list(tmp_path.glob("timings_report_*.json"))
+    csv_reports = list(tmp_path.glob("timings_report_*.csv"))
+    assert len(json_reports) == 1
+    assert len(csv_reports) == 1
+    report = json.loads(json_reports[0].read_text())
+    stages = {(s["template"], s["stage"]) for s in report["stages"]}
+    for stage in ["datamap_parse", "validation", "master_write"]:
+        assert ("", stage) in stages
+    assert ("dft1_tmp.xlsm", "workbook_open") in stages
+    assert ("dft1_tmp.xlsm", "cell_extraction") in stages
+    assert report["peak_memory"] > 0
+
+
+def test_import_streaming(mock_config, resource_dir, caplog, monkeypatch, tmp_path):
+    runner = CliRunner()
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    caplog.set_level(logging.INFO)
+    _copy_resources_to_input(mock_config, resource_dir)
+    result = runner.invoke(_import, ["templates", "-m", "--streaming"])
+    assert result.exit_code == 0
+    assert (mock_config.PLATFORM_DOCS_DIR / "output" / "master.xlsx").is_file()
+
+
+def test_import_auto_row_limit(mock_config, resource_dir, caplog, monkeypatch, tmp_path):
+    runner = CliRunner()
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    caplog.set_level(logging.INFO)
+    _copy_resources_to_input(mock_config, resource_dir)
+    result = runner.invoke(_import, ["templates", "-m", "--rowlimit", "auto"])
+    assert result.exit_code == 0
+    assert "Row limit is set by the datamap." in [x[2] for x in caplog.record_tuples]
+    result = runner.invoke(_import, ["templates", "-m", "--rowlimit", "lots"])
+    assert result.exit_code == 2
+
+
+@pytest.mark.parametrize("pipeline", [[], ["--pipeline"]])
+def test_import_auto_row_limit_reports_screened_template(
+    mock_config, resource_dir, monkeypatch, tmp_path, pipeline
+):
+    runner = CliRunner()
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    _copy_resources_to_input(mock_config, resource_dir)
+    with open(resource_dir / "datamap.csv", newline="") as f:
+        sheet = next(csv.DictReader(f))["template_sheet"]
+    wb = Workbook()
+    wb.active.title = sheet
+    wb.active.cell(row=500_000, column=1, value="x")
+    wb.save(mock_config.PLATFORM_DOCS_DIR / "input" / "inflated.xlsx")
+    result = runner.invoke(_import, ["templates", "-m", "--rowlimit", "auto"] + pipeline)
+    assert result.exit_code == 0
+    with open(next(tmp_path.glob("validation_report_*.csv")), newline="") as f:
+        rows = [row for row in csv.reader(f) if "inflated.xlsx" in row]
+    assert len(rows) == 1
+    assert rows[0][:4] == [
+        "FAIL", "inflated.xlsx", "", f'Not imported. Sheet "{sheet}" claims to use 500000 rows.'
+    ]
+
+
+def test_import_isolated_reports_broken_template(
+    mock_config, resource_dir, caplog, monkeypatch, tmp_path
+):
+    runner = CliRunner()
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    caplog.set_level(logging.INFO)
+    _copy_resources_to_input(mock_config, resource_dir)
+    (mock_config.PLATFORM_DOCS_DIR / "input" / "broken.xlsx").write_text("not a spreadsheet")
+    result = runner.invoke(_import, ["templates", "-m", "--isolate"])
+    assert result.exit_code == 0
+    assert (mock_config.PLATFORM_DOCS_DIR / "output" / "master.xlsx").is_file()
+    report = next(tmp_path.glob("validation_report_*.csv")).read_text()
+    assert "FAIL,broken.xlsx,,Not imported." in report
+
+
+def test_import_pipelined_validation_only(mock_config, resource_dir, caplog, monkeypatch, tmp_path):
+    runner = CliRunner()
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    caplog.set_level(logging.INFO)
+    _copy_resources_to_input(mock_config, resource_dir)
+    result = runner.invoke(_import, ["templates", "-v", "--pipeline"])
+    assert result.exit_code == 0
+    assert "No output file produced as not requested." in [x[2] for x in caplog.record_tuples]
+    assert len(list(tmp_path.glob("validation_report_*.csv"))) == 1
+
+
+def test_cleansing_report(master, caplog, tmp_path):
+    runner = CliRunner()
+    caplog.set_level(logging.INFO)
+    out = tmp_path / "cleansing.csv"
+    result = runner.invoke(report, ["cleansing", str(master), str(master), "-o", str(out)])
+    assert result.exit_code == 0
+    assert out.is_file()
+    assert any("cells required cleaning." in x[2] for x in caplog.record_tuples)
+
+
+def test_diff_report(master, caplog, tmp_path):
+    runner = CliRunner()
+    caplog.set_level(logging.INFO)
+    out = tmp_path / "diff.csv"
+    result = runner.invoke(report, ["diff", str(master), str(master), "-o", str(out)])
+    assert result.exit_code == 0
+    assert out.read_text().splitlines() == ["Change,Project,Key,Old value,New value"]
+    assert ("datamaps.main", logging.INFO, "value changed: 0") in caplog.record_tuples
+
+
+def test_excel_validations_report(resource_dir, mock_config, caplog, tmp_path, monkeypatch):
+    runner = CliRunner()
+    data_dir = mock_config.DATAMAPS_LIBRARY_DATA_DIR
+    # the engine gives its directories as strings
+    monkeypatch.setattr(mock_config, "DATAMAPS_LIBRARY_DATA_DIR", str(data_dir))
+    caplog.set_level(logging.INFO)
+    out = tmp_path / "validations.csv"
+    result = runner.invoke(
+        report, ["excel-validations", str(resource_dir / "*.xlsm"), "-o", str(out), "-j", "1"]
+    )
+    assert result.exit_code == 0
+    # header plus the validations in blank_template.xlsm and dft1_tmp.xlsm
+    assert len(out.read_text().splitlines()) == 1 + 146 * 2
+    assert (data_dir / "excel_validations_cache.json").is_file()
+
+
+def test_check_reports_all_problems(mock_config, resource_dir, caplog, monkeypatch):
+    from datamaps.main import check
+
+    runner = CliRunner()
+    mock_config.initialise()
+    # the engine gives its directories as strings
+    monkeypatch.setattr(
+        mock_config, "DATAMAPS_LIBRARY_DATA_DIR", str(mock_config.DATAMAPS_LIBRARY_DATA_DIR)
+    )
+    caplog.set_level(logging.INFO)
+    _copy_resources_to_input(mock_config, resource_dir)
+    result = runner.invoke(check, [])
+    assert result.exit_code == 0
+    assert "Datamap file passes tests. Check any WARNING messages. Ok to proceed." in [
+        x[2] for x in caplog.record_tuples
+    ]
+    result = runner.invoke(check, [])
+    assert "Datamap and blank template unchanged since last checked." in [
+        x[2] for x in caplog.record_tuples
+    ]
+
+    shutil.copy(
+        resource_dir / "datamap_short.csv", mock_config.PLATFORM_DOCS_DIR / "input" / "datamap.csv"
+    )
+    result = runner.invoke(check, ["--no-cache"])
+    assert result.exit_code == 1
+    assert "Datamap tests failed with 1 error(s)." in [x[2] for x in caplog.record_tuples]
+
+
+def test_import_resume(mock_config, resource_dir, caplog, monkeypatch, tmp_path):
+    runner = CliRunner()
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    monkeypatch.setattr(mock_config, "DATAMAPS_LIBRARY_DATA_DIR", tmp_path)
+    caplog.set_level(logging.INFO)
+    _copy_resources_to_input(mock_config, resource_dir)
+    checkpoint = checkpoint_dir(mock_config.PLATFORM_DOCS_DIR / "input")
+    other = checkpoint_dir(tmp_path / "elsewhere")
+    for directory in (checkpoint, other):
+        directory.mkdir(parents=True)
+        (directory / "stale.pickle").write_bytes(b"")
+    # without --checkpoint or --resume nothing is kept, or cleared
+    result = runner.invoke(_import, ["templates", "-v"])
+    assert result.exit_code == 0
+    assert (checkpoint / "stale.pickle").exists()
+    result = runner.invoke(_import, ["templates", "-v", "--resume"])
+    assert result.exit_code == 0
+    # nothing was kept from an earlier import, so every template was read
+    assert not any("Using data already read" in x[2] for x in caplog.record_tuples)
+    # and what was read is removed once the import has finished
+    assert not checkpoint.exists()
+    # leaving what was kept for another input directory
+    assert (other / "stale.pickle").exists()
+
+
+def test_import_watch_zip_rejected(mock_config, caplog, tmp_path):
+    runner = CliRunner()
+    mock_config.initialise()
+    caplog.set_level(logging.INFO)
+    zipped = tmp_path / "templates.zip"
+    zipped.write_bytes(b"")
+    result = runner.invoke(_import, ["templates", "-m", "--watch", "-z", str(zipped)])
+    assert result.exit_code == 1
+    assert "Cannot watch a zip file. Use --inputdir with --watch." in [x[2] for x in caplog.record_tuples]
+
+
+def test_import_watch_rejects_unwatched_options(mock_config, caplog):
+    runner = CliRunner()
+    mock_config.initialise()
+    caplog.set_level(logging.INFO)
+    result = runner.invoke(
+        _import, ["templates", "-m", "--watch", "--dedupe", "files", "--timings"]
+    )
+    assert result.exit_code == 1
+    assert "Cannot use --dedupe, --timings with --watch." in [x[2] for x in caplog.record_tuples]
+
+
+def test_import_dedupe(mock_config, resource_dir, caplog, monkeypatch, tmp_path):
+    runner = CliRunner()
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    caplog.set_level(logging.INFO)
+    _copy_resources_to_input(mock_config, resource_dir)
+    input_dir = Path(mock_config.PLATFORM_DOCS_DIR) / "input"
+    shutil.copy(input_dir / "dft1_tmp.xlsm", input_dir / "dft1_tmp_copy.xlsm")
+    result = runner.invoke(_import, ["templates", "-v", "--dedupe", "files", "--rowlimit", "500"])
+    assert result.exit_code == 0
+    assert "Not importing dft1_tmp_copy.xlsm. Same file as dft1_tmp.xlsm." in [
+        x[2] for x in caplog.record_tuples
+    ]
+    report = next(tmp_path.glob("validation_report_*.csv")).read_text()
+    assert "dft1_tmp_copy.xlsm,,Not imported. Same file as dft1_tmp.xlsm." in report
+
+
+@pytest.mark.parametrize("pipeline", [[], ["--pipeline"]])
+def test_import_master_as_csv(mock_config, resource_dir, monkeypatch, tmp_path, pipeline):
+    runner = CliRunner()
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    _copy_resources_to_input(mock_config, resource_dir)
+    output = Path(mock_config.PLATFORM_DOCS_DIR) / "output"
+    for f in output.glob("master.*"):
+        f.unlink()
+    result = runner.invoke(_import, ["templates", "-m", "--format", "both", "--rowlimit", "500"] + pipeline)
+    assert result.exit_code == 0
+    ws = load_workbook(output / "master.xlsx").active
+    expected = [["" if c.value is None else str(c.value) for c in row] for row in ws.iter_rows()]
+    with open(output / "master.csv", newline="") as f:
+        assert list(csv.reader(f)) == expected
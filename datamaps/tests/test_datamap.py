@@ -0,0 +1,77 @@
+import shutil
+
+from engine.adapters import cli as engine_cli
+from engine.config import Config
+from engine.utils.extraction import datamap_reader
+from engine.utils.validation import validation_checker
+from openpyxl import load_workbook
+from openpyxl.utils.cell import coordinate_to_tuple
+
+from ..process import datamap as compiled_datamap
+from ..process.datamap import compile_datamap
+from ..process.exporter import write_master_to_templates
+from ..process.importer import format_data_for_master, read_template
+
+
+def test_compiled_datamap_matches_engine(resource_dir, tmp_path):
+    compiled = compile_datamap(resource_dir / "datamap.csv", cache_dir=tmp_path)
+    assert compiled.to_dicts() == [x.to_dict() for x in datamap_reader(resource_dir / "datamap.csv")]
+    assert compiled.is_typed
+    for line in compiled.lines:
+        assert (line.row, line.column) == coordinate_to_tuple(line.cellref)
+    for sheet in compiled.sheets:
+        assert compiled.max_row(sheet) == max(row for _, row, _ in compiled.coordinates(sheet))
+
+
+def test_compiled_datamap_is_cached(resource_dir, tmp_path, monkeypatch):
+    dm = tmp_path / "datamap.csv"
+    shutil.copy(resource_dir / "datamap.csv", dm)
+    monkeypatch.setattr(compiled_datamap, "_compiled", {})
+    compiled = compile_datamap(dm, cache_dir=tmp_path / "cache")
+    assert (tmp_path / "cache" / f"{compiled.checksum}.json").is_file()
+
+    def fail(_):
+        raise AssertionError("datamap parsed again")
+
+    monkeypatch.setattr(compiled_datamap, "datamap_reader", fail)
+    compiled_datamap._compiled.clear()
+    cached = compile_datamap(dm, cache_dir=tmp_path / "cache")
+    assert cached.lines == compiled.lines
+    assert cached.path == dm
+
+
+def test_read_template_with_datamap_matches_full_read(resource_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "TEMPLATE_ROW_LIMIT", 500)
+    compiled = compile_datamap(resource_dir / "datamap.csv", cache_dir=tmp_path)
+    datamap_data = compiled.to_dicts()
+    full = read_template(resource_dir / "dft1_tmp.xlsm", row_limit=500)
+    ours = read_template(resource_dir / "dft1_tmp.xlsm", row_limit=500, datamap=compiled)
+    assert ours["dft1_tmp.xlsm"]["data"].keys() == full["dft1_tmp.xlsm"]["data"].keys()
+    assert format_data_for_master(datamap_data, ours) == format_data_for_master(datamap_data, full)
+    assert validation_checker(datamap_data, ours) == validation_checker(datamap_data, full)
+
+
+def test_export_matches_engine(mock_config, resource_dir, master):
+    mock_config.initialise()
+    output = mock_config.PLATFORM_DOCS_DIR / "output"
+    blank = resource_dir / "blank_template.xlsm"
+    datamap = resource_dir / "datamap_short.csv"
+    engine_cli.write_master_to_templates(blank, datamap, master)
+    theirs = output.parent / "theirs"
+    shutil.rmtree(theirs, ignore_errors=True)
+    output.rename(theirs)
+    output.mkdir()
+    written = write_master_to_templates(blank, datamap, master)
+    assert sorted(p.name for p in written) == sorted(p.name for p in theirs.iterdir())
+    for path in written:
+        ours_wb = load_workbook(path)
+        theirs_wb = load_workbook(theirs / path.name)
+        for ws in theirs_wb.worksheets:
+            ours_ws = ours_wb[ws.title]
+            for row in ws.iter_rows():
+                for cell in row:
+                    # array formulas are compared by their text
+                    ours_value = ours_ws[cell.coordinate].value
+                    assert getattr(ours_value, "text", ours_value) == getattr(
+                        cell.value, "text", cell.value
+                    )
@@ -0,0 +1,117 @@
+import datetime
+
+from openpyxl import Workbook
+
+from ..core import Quarter
+from ..plugins.dft.diff import (DUPLICATE_KEY, KEY_ADDED, KEY_REMOVED,
+                                PROJECT_ADDED, PROJECT_REMOVED, VALUE_CHANGED,
+                                Change, diff_data, diff_master_files,
+                                diff_rows, write_diff_report)
+from ..plugins.dft.master import Master
+
+
+def _write_master(path, rows):
+    wb = Workbook()
+    ws = wb.active
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return path
+
+
+def test_diff_data():
+    a = {
+        "Bridge": {"Name": "Bridge", "Cost": 10, "Start": datetime.date(2021, 1, 1)},
+        "Tunnel": {"Name": "Tunnel", "Cost": 20, "Start": None},
+    }
+    b = {
+        "Tunnel": {"Name": "Tunnel", "Cost": 25, "Start": None, "Owner": "Jim"},
+        "Road": {"Name": "Road", "Cost": 5, "Start": None, "Owner": "Sue"},
+    }
+    changes = list(diff_data(a, b))
+    assert changes == [
+        Change(PROJECT_REMOVED, "Bridge", None),
+        Change(PROJECT_ADDED, "Road", None),
+        Change(VALUE_CHANGED, "Tunnel", "Cost", 20, 25),
+        Change(KEY_ADDED, None, "Owner"),
+    ]
+    assert list(diff_data(a, a)) == []
+
+
+def test_master_diff_matches_streamed_file_diff(tmp_path):
+    a = _write_master(
+        tmp_path / "a.xlsx",
+        [
+            ["file name", "Bridge", "Tunnel"],
+            ["Name", "Bridge", "Tunnel"],
+            ["Cost ", 10, 20],
+            ["Start", datetime.datetime(2021, 1, 1), None],
+            ["Retired", "yes", "no"],
+        ],
+    )
+    # projects and keys in a different order
+    b = _write_master(
+        tmp_path / "b.xlsx",
+        [
+            ["file name", "Tunnel", "Bridge"],
+            ["Start", None, datetime.datetime(2021, 2, 1)],
+            ["Name", "Tunnel", "Bridge"],
+            ["Cost ", 20, 12],
+            ["Owner", "Jim", "Sue"],
+        ],
+    )
+    m1 = Master(Quarter(1, 2021), str(a))
+    m2 = Master(Quarter(2, 2021), str(b))
+    expected = [
+        Change(VALUE_CHANGED, "Bridge", "Cost", 10, 12),
+        Change(VALUE_CHANGED, "Bridge", "Start", datetime.date(2021, 1, 1), datetime.date(2021, 2, 1)),
+        Change(KEY_REMOVED, None, "Retired"),
+        Change(KEY_ADDED, None, "Owner"),
+    ]
+    assert sorted(m1.diff(m2), key=str) == sorted(expected, key=str)
+    assert sorted(diff_master_files(a, b), key=str) == sorted(expected, key=str)
+
+    out = tmp_path / "diff.csv"
+    counts = write_diff_report(diff_master_files(a, b), out)
+    assert counts[VALUE_CHANGED] == 2
+    assert counts[KEY_ADDED] == counts[KEY_REMOVED] == 1
+    assert len(out.read_text().splitlines()) == 5
+
+
+def test_duplicate_keys_are_reported(tmp_path, caplog):
+    a = _write_master(
+        tmp_path / "a.xlsx",
+        [
+            ["file name", "Bridge"],
+            ["Cost", 10],
+            ["Cost", 11],
+            ["Name", "Bridge"],
+        ],
+    )
+    b = _write_master(
+        tmp_path / "b.xlsx",
+        [
+            ["file name", "Bridge"],
+            ["Name", "Bridge"],
+            ["Cost", 12],
+            ["Name", "Bridge 2"],
+            ["Cost", 13],
+        ],
+    )
+    changes = list(diff_master_files(a, b))
+    assert sorted(changes, key=str) == sorted(
+        [
+            Change(VALUE_CHANGED, "Bridge", "Cost", 10, 12),
+            Change(DUPLICATE_KEY, None, "Cost", old=(11,)),
+            Change(DUPLICATE_KEY, None, "Name", new=("Bridge 2",)),
+            Change(DUPLICATE_KEY, None, "Cost", new=(13,)),
+        ],
+        key=str,
+    )
+    assert "Key Cost appears more than once in the first master" in caplog.text
+    # a duplicate is never mistaken for an added or removed key
+    assert list(diff_rows(["P"], [("k", (1,)), ("k", (1,))], ["P"], [("k", (1,))])) == [
+        Change(DUPLICATE_KEY, None, "k", old=(1,))
+    ]
+    counts = write_diff_report(diff_master_files(a, b), tmp_path / "diff.csv")
+    assert counts[DUPLICATE_KEY] == 3
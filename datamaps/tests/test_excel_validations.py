@@ -0,0 +1,67 @@
+import json
+import shutil
+import zipfile
+
+from engine.adapters.cli import report_data_validations_in_file
+
+from ..process import excel_validations
+from ..process.excel_validations import (ValidationCache, ValidationReportWriter,
+                                         expand_targets, file_validations,
+                                         report_validations)
+
+
+def test_file_validations_match_engine(resource_dir):
+    template = resource_dir / "dft1_tmp.xlsm"
+    lines = [v.report_line for v in file_validations(template)]
+    assert lines == report_data_validations_in_file(template)
+
+
+def test_expand_targets(resource_dir, tmp_path):
+    shutil.copy(resource_dir / "test_template.xlsm", tmp_path / "a.xlsm")
+    shutil.copy(resource_dir / "dft1_tmp.xlsm", tmp_path / "b.xlsm")
+    (tmp_path / "notes.txt").write_text("not a spreadsheet")
+    with zipfile.ZipFile(tmp_path / "templates.zip", "w") as zf:
+        zf.write(tmp_path / "a.xlsm", "dir/a.xlsm")
+    targets = [tmp_path, str(tmp_path / "b.*"), tmp_path / "templates.zip"]
+    with expand_targets(targets) as files:
+        names = [name for _, name in files]
+        extracted = files[-1][0]
+        assert extracted.is_file()
+    assert names == ["a.xlsm", "b.xlsm", "b.xlsm", "templates.zip/dir/a.xlsm"]
+    assert not extracted.exists()
+
+
+def test_report_validations_cached_and_streamed(resource_dir, tmp_path, monkeypatch):
+    files = [
+        (resource_dir / "dft1_tmp.xlsm", "dft1_tmp.xlsm"),
+        (resource_dir / "test_template.xlsm", "test_template.xlsm"),
+        (tmp_path / "broken.xlsx", "broken.xlsx"),
+    ]
+    (tmp_path / "broken.xlsx").write_text("not a spreadsheet")
+    cache_file = tmp_path / "cache.json"
+    results = list(report_validations(files, ValidationCache(cache_file), jobs=2))
+    assert [(name, len(v), error is None) for name, v, error in results] == [
+        ("dft1_tmp.xlsm", 146, True),
+        ("test_template.xlsm", 0, True),
+        ("broken.xlsx", 0, False),
+    ]
+
+    read = []
+    real = excel_validations.file_validations
+
+    def counting(file_path, file_name=None):
+        read.append(file_name)
+        return real(file_path, file_name)
+
+    monkeypatch.setattr(excel_validations, "file_validations", counting)
+    again = list(report_validations(files, ValidationCache(cache_file), jobs=1))
+    assert again[0][1] == results[0][1]
+    # only the file which could not be read is read again
+    assert read == ["broken.xlsx"]
+
+    with ValidationReportWriter(tmp_path / "report.json") as writer:
+        for v in results[0][1]:
+            writer.write(v)
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert len(report) == 146
+    assert report[0]["File"] == "dft1_tmp.xlsm"
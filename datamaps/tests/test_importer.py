@@ -0,0 +1,110 @@
+import shutil
+import zipfile
+
+import pytest
+from engine.config import Config
+from engine.utils.extraction import datamap_reader, template_reader
+
+from ..benchmarks import generators
+from ..process.datamap import compile_datamap
+from ..process.importer import (AUTO_ROW_LIMIT, drop_duplicate_files,
+                                drop_duplicate_templates, extract,
+                                format_data_for_master, read_template)
+from ..process.timings import Timings
+
+
+def test_read_template_matches_engine(resource_dir, monkeypatch):
+    monkeypatch.setattr(Config, "TEMPLATE_ROW_LIMIT", 500)
+    template = resource_dir / "dft1_tmp.xlsm"
+    ours = read_template(template, row_limit=500)["dft1_tmp.xlsm"]
+    theirs = template_reader(template)["dft1_tmp.xlsm"]
+    assert ours["checksum"] == theirs["checksum"]
+    assert ours["data"].keys() == theirs["data"].keys()
+    diffs = []
+    for sheet, cells in theirs["data"].items():
+        assert ours["data"][sheet].keys() == cells.keys()
+        diffs.extend(ours["data"][sheet][ref] for ref in cells if ours["data"][sheet][ref] != cells[ref])
+    # bcompiler-engine re-uses the previous cell's value for a cell containing a time
+    assert diffs
+    assert all(cell["value"] == "00:00:00" for cell in diffs)
+
+
+def test_read_template_records_timings(resource_dir):
+    timings = Timings()
+    read_template(resource_dir / "dft1_tmp.xlsm", row_limit=500, timings=timings)
+    timings.stop()
+    assert [(r.template, r.stage) for r in timings.records] == [
+        ("dft1_tmp.xlsm", "workbook_open"),
+        ("dft1_tmp.xlsm", "cell_extraction"),
+    ]
+
+
+def test_format_data_for_master(resource_dir):
+    datamap_data = [x.to_dict() for x in datamap_reader(resource_dir / "datamap.csv")]
+    template_data = read_template(resource_dir / "dft1_tmp.xlsm", row_limit=500)
+    data = format_data_for_master(datamap_data, template_data)
+    column = data[0]["dft1_tmp.xlsm"]
+    assert len(column) == len(datamap_data)
+    assert column[0][0] == datamap_data[0]["key"]
+
+
+@pytest.mark.parametrize("row_limit", [500, 20])
+def test_streamed_template_matches_loaded(resource_dir, tmp_path, row_limit):
+    compiled = compile_datamap(resource_dir / "datamap.csv", cache_dir=tmp_path)
+    template = resource_dir / "dft1_tmp.xlsm"
+    loaded = read_template(template, row_limit=row_limit, datamap=compiled)
+    streamed = read_template(template, row_limit=row_limit, datamap=compiled, streaming=True)
+    assert streamed == loaded
+
+
+def test_streamed_template_from_generated_templates(tmp_path):
+    lines = generators.datamap_lines(60)
+    datamap = generators.write_datamap(tmp_path / "datamap.csv", lines)
+    template = generators.write_template(tmp_path / "template.xlsx", lines, filler_rows=30)
+    compiled = compile_datamap(datamap, cache_dir=tmp_path)
+    streamed = read_template(template, row_limit=500, datamap=compiled, streaming=True)
+    full = read_template(template, row_limit=500)
+    datamap_data = compiled.to_dicts()
+    assert format_data_for_master(datamap_data, streamed) == format_data_for_master(
+        datamap_data, full
+    )
+
+
+def test_streaming_needs_a_datamap(resource_dir):
+    with pytest.raises(ValueError):
+        read_template(resource_dir / "dft1_tmp.xlsm", streaming=True)
+
+
+def test_auto_row_limit_reads_as_far_as_the_datamap(tmp_path):
+    lines = generators.datamap_lines(60)
+    datamap = generators.write_datamap(tmp_path / "datamap.csv", lines)
+    template = generators.write_template(tmp_path / "template.xlsx", lines, filler_rows=30)
+    compiled = compile_datamap(datamap, cache_dir=tmp_path)
+    auto = read_template(template, row_limit=AUTO_ROW_LIMIT, datamap=compiled)
+    full = read_template(template, row_limit=500)
+    datamap_data = compiled.to_dicts()
+    assert format_data_for_master(datamap_data, auto) == format_data_for_master(datamap_data, full)
+    # a fixed limit below the datamap's last row loses data
+    short = read_template(template, row_limit=5, datamap=compiled)
+    assert format_data_for_master(datamap_data, short) != format_data_for_master(datamap_data, full)
+
+
+def test_drop_duplicate_templates(resource_dir, tmp_path):
+    shutil.copy(resource_dir / "dft1_tmp.xlsm", tmp_path / "b.xlsm")
+    shutil.copy(resource_dir / "dft1_tmp.xlsm", tmp_path / "a.xlsm")
+    shutil.copy(resource_dir / "test_template.xlsm", tmp_path / "c.xlsm")
+    # the same cells, but not the same file
+    with zipfile.ZipFile(resource_dir / "dft1_tmp.xlsm") as src:
+        with zipfile.ZipFile(tmp_path / "d.xlsm", "w", zipfile.ZIP_DEFLATED, compresslevel=1) as dst:
+            for item in src.infolist():
+                dst.writestr(item.filename, src.read(item))
+    templates = [tmp_path / name for name in ("b.xlsm", "a.xlsm", "c.xlsm", "d.xlsm")]
+
+    files, duplicates = drop_duplicate_files(templates)
+    assert files == [tmp_path / "a.xlsm", tmp_path / "c.xlsm", tmp_path / "d.xlsm"]
+    assert duplicates == {"b.xlsm": "Same file as a.xlsm."}
+
+    datamap = compile_datamap(resource_dir / "datamap.csv", cache_dir=tmp_path / "datamaps")
+    data, duplicates = drop_duplicate_templates(extract(files, 500, datamap=datamap), datamap)
+    assert sorted(data) == ["a.xlsm", "c.xlsm"]
+    assert duplicates == {"d.xlsm": "Same data as a.xlsm."}
@@ -0,0 +1,27 @@
+from ..api import project_data_from_master
+from ..plugins.dft.metrics import InMemoryMetrics, get_metrics, set_metrics
+from ..plugins.dft.portfolio import project_data_from_master as load_master
+
+
+def test_master_load_emits_metrics(master):
+    metrics = InMemoryMetrics()
+    data = load_master(master, metrics=metrics)
+    for name in ["master.load", "master.workbook_open", "master.key_cleanse", "master.columns_read"]:
+        assert len(metrics.timings[name]) == 1
+    assert metrics.counts["master.projects"] == len(data)
+    assert metrics.counts["master.keys"] > 0
+    assert metrics.counts["master.cells"] == sum(len(p) for p in data.values())
+    assert all(tags == {"master": "master.xlsx"} for _, _, _, tags in metrics.events)
+
+
+def test_process_wide_metrics(master):
+    metrics = InMemoryMetrics()
+    set_metrics(metrics)
+    try:
+        m = project_data_from_master(master, 1, 2019)
+        m.duplicate_keys()
+    finally:
+        set_metrics(None)
+    assert metrics.counts["master.projects"] == len(m.projects)
+    assert len(metrics.timings["master.duplicate_keys"]) == 1
+    assert not isinstance(get_metrics(), InMemoryMetrics)
@@ -0,0 +1,61 @@
+import csv
+import shutil
+import zipfile
+
+from openpyxl import load_workbook
+
+from ..benchmarks import generators
+from ..main import output_funcs
+from ..process import importer
+from ..process.pipeline import iter_in_pool
+
+
+def _square(x):
+    return x * x
+
+
+def test_iter_in_pool_keeps_order():
+    assert list(iter_in_pool(_square, range(10), jobs=2, ahead=3)) == [(i, i * i) for i in range(10)]
+
+
+def _import(config, input_dir, report_dir, monkeypatch, **kwargs):
+    monkeypatch.setattr(config, "FULL_PATH_OUTPUT", report_dir)
+    report_dir.mkdir()
+    importer.import_and_create_master(output_funcs, inputdir=input_dir, rowlimit=500, **kwargs)
+    master = load_workbook(config.PLATFORM_DOCS_DIR / "output" / "master.xlsx")
+    values = [[cell.value for cell in row] for row in master.active.iter_rows()]
+    with open(next(report_dir.glob("validation_report_*.csv")), newline="") as f:
+        report = sorted(map(tuple, csv.reader(f)))
+    return values, report
+
+
+def test_pipelined_import_matches_import(mock_config, tmp_path, monkeypatch):
+    mock_config.initialise()
+    lines = generators.datamap_lines(80)
+    generators.write_datamap(tmp_path / "datamap.csv", lines)
+    generators.write_templates(tmp_path, lines, 3)
+    # a template without the sheets in the datamap is left out of both
+    generators.write_template(tmp_path / "Other.xlsx", generators.datamap_lines(5, sheets=["Other"]))
+    expected = _import(mock_config, tmp_path, tmp_path / "a", monkeypatch)
+    pipelined = _import(mock_config, tmp_path, tmp_path / "b", monkeypatch, pipeline=True)
+    assert pipelined == expected
+    assert len(expected[0][0]) == 4
+
+
+def test_pipelined_import_dedupe_matches_import(mock_config, tmp_path, monkeypatch):
+    mock_config.initialise()
+    lines = generators.datamap_lines(40)
+    generators.write_datamap(tmp_path / "datamap.csv", lines)
+    generators.write_templates(tmp_path, lines, 2)
+    first = sorted(tmp_path.glob("*.xlsx"))[0]
+    shutil.copy(first, tmp_path / "zz_copy.xlsx")
+    with zipfile.ZipFile(first) as src:
+        with zipfile.ZipFile(tmp_path / "zz_resaved.xlsx", "w", zipfile.ZIP_DEFLATED, compresslevel=1) as dst:
+            for item in src.infolist():
+                dst.writestr(item.filename, src.read(item))
+    expected = _import(mock_config, tmp_path, tmp_path / "a", monkeypatch, dedupe="cells")
+    pipelined = _import(mock_config, tmp_path, tmp_path / "b", monkeypatch, dedupe="cells", pipeline=True)
+    assert pipelined == expected
+    assert len(expected[0][0]) == 3
+    not_imported = [row[1] for row in expected[1] if row[3].startswith("Not imported.")]
+    assert sorted(not_imported) == ["zz_copy.xlsx", "zz_resaved.xlsx"]
@@ -0,0 +1,72 @@
+import datetime
+
+import pytest
+from openpyxl import Workbook
+
+from ..core import Quarter
+from ..plugins.dft import portfolio
+from ..plugins.dft.master import Master
+from ..plugins.dft.query import Query
+
+
+@pytest.fixture
+def query_master(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    for row in [
+        ["file name", "Bridge", "Tunnel", "Road", "Rail"],
+        ["Name", "Bridge", "Tunnel", "Road", "Rail"],
+        ["DCA", "Red", "Amber", "Red", "Red"],
+        ["Total Budget", 60_000_000, 80_000_000, None, "£75000000"],
+        ["Start", datetime.datetime(2021, 1, 1), None, None, None],
+    ]:
+        ws.append(row)
+    wb.save(tmp_path / "master.xlsx")
+    return tmp_path / "master.xlsx"
+
+
+def test_query_master(query_master):
+    m = Master(Quarter(1, 2021), str(query_master))
+    red = m.query().where("DCA", "==", "Red")
+    assert list(red.results()) == ["Bridge", "Road", "Rail"]
+    big = red.select("Name", "Total Budget").where("Total Budget", ">", 50_000_000)
+    assert big.results() == {"Bridge": {"Name": "Bridge", "Total Budget": 60_000_000}}
+    # each step returns a new query
+    assert list(red.results()) == ["Bridge", "Road", "Rail"]
+    assert list(m.query().projects("Tunnel", "Road").select("DCA")) == [
+        ("Tunnel", {"DCA": "Amber"}),
+        ("Road", {"DCA": "Red"}),
+    ]
+    assert list(m.query().projects(where=lambda p: p.startswith("R")).results()) == [
+        "Road",
+        "Rail",
+    ]
+    assert list(m.query().where("Name", "contains", "n").results()) == ["Tunnel"]
+    assert list(m.query().where("Start", lambda d: d is not None).results()) == ["Bridge"]
+    with pytest.raises(KeyError):
+        m.query().where("Cost", "==", 1).results()
+    with pytest.raises(ValueError):
+        m.query().where("DCA", "~", "Red")
+
+
+def test_query_file_only_reads_wanted_rows(query_master, monkeypatch):
+    converted = []
+    master_value = portfolio._master_value
+
+    def spy(value):
+        converted.append(value)
+        return master_value(value)
+
+    monkeypatch.setattr(portfolio, "_master_value", spy)
+    q = (
+        Query.from_file(query_master, type_values=True)
+        .select("Name")
+        .where("DCA", "==", "Red")
+        .where("Total Budget", ">", 70_000_000)
+    )
+    assert q.results() == {"Rail": {"Name": "Rail"}}
+    # the Start row is never converted
+    assert len(converted) == 12
+    assert Query.from_file(query_master).select("Start").results()["Bridge"] == {
+        "Start": datetime.date(2021, 1, 1)
+    }
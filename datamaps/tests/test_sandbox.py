@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+
+import pytest
+
+from ..process.sandbox import memory_use, run_isolated
+
+
+def _work(item):
+    if item == "raise":
+        raise ValueError("bad item")
+    if item == "sleep":
+        time.sleep(30)
+    if item == "exit":
+        os._exit(3)
+    if item == "memory":
+        hog = bytearray(400 * 1024 * 1024)
+        for i in range(0, len(hog), 4096):
+            hog[i] = 1
+        time.sleep(30)
+    return item * 2
+
+
+def test_run_isolated_keeps_order():
+    outcomes = run_isolated(_work, [1, 2, 3, 4, 5], jobs=2)
+    assert [o.result for o in outcomes] == [2, 4, 6, 8, 10]
+    assert all(o.error is None for o in outcomes)
+
+
+def test_run_isolated_failures_do_not_stop_the_rest():
+    outcomes = run_isolated(_work, [1, "raise", "exit", "sleep", 2], jobs=5, timeout=1)
+    assert [o.result for o in outcomes] == [2, None, None, None, 4]
+    assert outcomes[1].error == "ValueError: bad item"
+    assert "exit code 3" in outcomes[2].error
+    assert outcomes[3].error == "Took longer than 1 seconds."
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="memory use is read from /proc")
+def test_run_isolated_memory_limit():
+    assert memory_use(os.getpid()) > 0
+    outcomes = run_isolated(_work, ["memory", 1], max_memory=200, timeout=20)
+    assert outcomes[0].error == "Used more than 200MB of memory."
+    assert outcomes[1].result == 2
@@ -0,0 +1,67 @@
+import datetime
+
+import pytest
+
+from ..core import Quarter
+from ..plugins.dft.master import Master
+from ..plugins.dft.snapshot import Snapshot, write_snapshot
+
+
+def test_master_round_trip_through_snapshot(master, tmp_path):
+    m = Master(Quarter(1, 2019), str(master))
+    path = m.to_snapshot(tmp_path / "master.snapshot")
+    snap = Master.from_snapshot(path)
+    assert snap.projects == m.projects
+    assert snap.quarter.quarter == 1 and snap.year == 2019
+    assert snap.filename == "master.xlsx"
+    assert dict(snap.data["Chutney Bridge.xlsm"]) == dict(m.data["Chutney Bridge.xlsm"])
+    keys = ["Project/Programme Name", "Controls Project ID number"]
+    assert snap["Chutney Bridge.xlsm"].pull_keys(keys) == m["Chutney Bridge.xlsm"].pull_keys(keys)
+    assert list(snap.diff(m)) == []
+
+
+def test_snapshot_values(tmp_path):
+    values = {
+        "Date": datetime.date(2021, 1, 1),
+        "Datetime": datetime.datetime(2021, 1, 1, 12, 30, 5, 7),
+        "Time": datetime.time(9, 15, 1, 2),
+        "Int": -10,
+        "Big": 2 ** 70,
+        "Float": 1.5,
+        "Bool": False,
+        "Text": "Brïdge – 1",
+        "Empty": None,
+    }
+    path = write_snapshot(
+        tmp_path / "m.snapshot", {"A": values, "B": {"Int": 3}}, quarter=2, year=2021
+    )
+    snap = Snapshot(path)
+    assert snap["A"] == values
+    assert dict(snap["B"]) == {"Int": 3}
+    assert snap["B"].get("Text") is None
+    assert (snap.quarter, snap.year, snap.declared_month, snap.master_path) == (2, 2021, None, None)
+    with pytest.raises(KeyError):
+        snap["C"]
+    snap.close()
+
+    (tmp_path / "not.snapshot").write_bytes(b"x" * 200)
+    with pytest.raises(ValueError):
+        Snapshot(tmp_path / "not.snapshot")
+
+
+def test_snapshot_keeps_none_apart_from_text(tmp_path):
+    data = {
+        "A": {None: 1, "None": 2, "Key": 3},
+        None: {None: 4, "None": 5, "Key": 6},
+    }
+    snap = Snapshot(write_snapshot(tmp_path / "m.snapshot", data))
+    assert list(snap) == ["A", None]
+    assert {p: dict(snap[p]) for p in snap} == data
+    assert snap["A"].subset([None]) == {None: 1}
+    snap.close()
+
+    # a snapshot written before None was kept apart is not read
+    path = tmp_path / "m.snapshot"
+    path.write_bytes(b"DMSNAP\x00\x01" + path.read_bytes()[8:])
+    with pytest.raises(ValueError):
+        Snapshot(path)
@@ -0,0 +1,43 @@
+from openpyxl import Workbook, load_workbook
+
+from ..process.datamap import compile_datamap
+from ..process.importer import screen_templates
+from ..process.sniff import oversized_sheets, sheet_sizes
+
+
+def test_sheet_sizes_match_openpyxl(resource_dir):
+    template = resource_dir / "dft1_tmp.xlsm"
+    wb = load_workbook(template, read_only=True)
+    expected = {ws.title: (ws.max_row, ws.max_column) for ws in wb.worksheets}
+    wb.close()
+    sizes = sheet_sizes(template)
+    assert {s.sheet: (s.max_row, s.max_column) for s in sizes} == expected
+    assert all(s.xml_size > 0 for s in sizes)
+
+
+def test_oversized_sheets(tmp_path):
+    wb = Workbook()
+    wb.active.title = "Inflated"
+    wb.active["A1"] = "Project"
+    wb.active.cell(row=200_000, column=2, value=" ")
+    wb.create_sheet("Fine")["A1"] = "ok"
+    wb.save(tmp_path / "inflated.xlsx")
+    assert oversized_sheets(tmp_path / "inflated.xlsx") == [
+        'Sheet "Inflated" claims to use 200000 rows.'
+    ]
+    assert oversized_sheets(tmp_path / "inflated.xlsx", sheets=["Fine"]) == []
+
+
+def test_screen_templates(resource_dir, tmp_path, caplog):
+    compiled = compile_datamap(resource_dir / "datamap.csv", cache_dir=tmp_path)
+    wb = Workbook()
+    wb.active.title = compiled.lines[0].sheet
+    wb.active.cell(row=500_000, column=1, value="x")
+    wb.save(tmp_path / "inflated.xlsx")
+    template = resource_dir / "dft1_tmp.xlsm"
+    kept, left_out = screen_templates([template, tmp_path / "inflated.xlsx"], compiled)
+    assert kept == [template]
+    assert left_out == {
+        "inflated.xlsx": f'Sheet "{compiled.lines[0].sheet}" claims to use 500000 rows.'
+    }
+    assert "Not importing inflated.xlsx." in caplog.text
@@ -0,0 +1,58 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ..core import Quarter
+from ..plugins.dft.master import Master, SQLiteProjectData
+from ..plugins.dft.sqlite import list_masters
+
+
+def test_master_round_trip_through_sqlite(master, tmp_path):
+    db = tmp_path / "masters.db"
+    m = Master(Quarter(1, 2019), str(master))
+    assert m.to_sqlite(db) == "master.xlsx"
+    # saving again replaces it
+    m.to_sqlite(db)
+    m.to_sqlite(db, name="q1")
+    assert list_masters(db) == ["master.xlsx", "q1"]
+
+    from_db = Master.from_sqlite(db, "q1")
+    assert from_db.projects == m.projects
+    assert from_db.quarter.quarter == 1 and from_db.year == 2019
+    assert from_db.filename == "master.xlsx"
+    assert from_db.data["Chutney Bridge.xlsm"] == m.data["Chutney Bridge.xlsm"]
+    project = from_db["Chutney Bridge.xlsm"]
+    assert isinstance(project, SQLiteProjectData)
+    keys = ["Project/Programme Name", "Controls Project ID number", "Department"]
+    assert project.pull_keys(keys) == m["Chutney Bridge.xlsm"].pull_keys(keys)
+    assert project.pull_keys(keys, flat=True) == m["Chutney Bridge.xlsm"].pull_keys(
+        keys, flat=True
+    )
+    assert len(project) == len(m["Chutney Bridge.xlsm"])
+    with pytest.raises(KeyError):
+        from_db["Not a project"]
+    with pytest.raises(KeyError):
+        Master.from_sqlite(db, "q2")
+
+
+def test_sqlite_values_and_threads(tmp_path):
+    from ..plugins.dft.sqlite import SQLiteMasterData, save_master
+
+    db = tmp_path / "masters.db"
+    values = {
+        "Date": datetime.date(2021, 1, 1),
+        "Datetime": datetime.datetime(2021, 1, 1, 12, 30),
+        "Time": datetime.time(9, 15),
+        "Int": 10,
+        "Float": 1.5,
+        "Bool": True,
+        "Text": "Bridge",
+        "Empty": None,
+    }
+    save_master(db, "m", {"A": values, "B": dict(values, Int=20)}, quarter=2, year=2021)
+    data = SQLiteMasterData(db, "m")
+    assert data["A"] == values
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda p: data[p]["Int"], ["A", "B"] * 10))
+    assert results == [10, 20] * 10
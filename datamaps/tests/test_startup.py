@@ -0,0 +1,40 @@
+import subprocess
+import sys
+
+import pytest
+
+# Modules which are expensive to import and are only needed once a command
+# that actually reads or writes spreadsheets is run.
+HEAVY_MODULES = ["openpyxl", "engine.adapters.cli", "dateutil"]
+
+# Generous ceiling (microseconds) on the cumulative import time of the CLI
+# entry point. Importing bcompiler-engine pushes this well past 100ms.
+IMPORT_BUDGET_US = 120_000
+
+
+def _importtime(module: str) -> dict:
+    """Return {module_name: cumulative_us} as reported by ``python -X importtime``."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+@pytest.mark.parametrize("heavy", HEAVY_MODULES)
+def test_cli_entry_point_does_not_import_heavy_modules(heavy):
+    assert heavy not in _importtime("datamaps.main")
+
+
+def test_cli_entry_point_import_budget():
+    # best of three to smooth out a cold filesystem cache
+    best = min(_importtime("datamaps.main")["datamaps.main"] for _ in range(3))
+    assert best < IMPORT_BUDGET_US, f"datamaps.main took {best}us to import"
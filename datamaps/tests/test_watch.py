@@ -0,0 +1,74 @@
+import logging
+import os
+import shutil
+
+from openpyxl import load_workbook
+
+from ..process.watch import Watcher, scan
+
+
+def _reads(caplog):
+    return sorted(x[2] for x in caplog.record_tuples if x[2].startswith("Read "))
+
+
+def _setup(resource_dir, tmp_path, monkeypatch, mock_config):
+    mock_config.initialise()
+    monkeypatch.setattr(mock_config, "FULL_PATH_OUTPUT", tmp_path)
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    shutil.copy(resource_dir / "datamap.csv", input_dir)
+    shutil.copy(resource_dir / "dft1_tmp.xlsm", input_dir)
+    return input_dir
+
+
+def test_scan_ignores_lock_files(tmp_path):
+    (tmp_path / "a.xlsx").write_bytes(b"a")
+    (tmp_path / "~$a.xlsx").write_bytes(b"lock")
+    (tmp_path / "blank_template.xlsm").write_bytes(b"blank")
+    assert list(scan(tmp_path)) == [tmp_path / "a.xlsx"]
+
+
+def test_watcher_reads_only_changed_templates(resource_dir, tmp_path, monkeypatch, mock_config, caplog):
+    caplog.set_level(logging.INFO)
+    input_dir = _setup(resource_dir, tmp_path, monkeypatch, mock_config)
+    master = tmp_path / "master.xlsx"
+    watcher = Watcher(input_dir, input_dir / "datamap.csv", 500, master, settle=1)
+    watcher.update()
+    assert _reads(caplog) == ["Read dft1_tmp.xlsm."]
+    assert [c.value for c in load_workbook(master).active[1]] == ["file name", "dft1_tmp"]
+
+    caplog.clear()
+    shutil.copy(resource_dir / "dft1_tmp.xlsm", input_dir / "dft2_tmp.xlsm")
+    # nothing is read until the directory has settled
+    assert not watcher.poll(now=100)
+    assert not watcher.poll(now=100.5)
+    assert watcher.poll(now=101)
+    assert _reads(caplog) == ["Read dft2_tmp.xlsm."]
+    assert [c.value for c in load_workbook(master).active[1]] == [
+        "file name", "dft1_tmp", "dft2_tmp"
+    ]
+    assert not watcher.poll(now=200)
+
+    caplog.clear()
+    template = input_dir / "dft1_tmp.xlsm"
+    os.utime(template, ns=(template.stat().st_atime_ns, template.stat().st_mtime_ns + 10 ** 9))
+    watcher.poll(now=300)
+    assert watcher.poll(now=301)
+    assert _reads(caplog) == ["Read dft1_tmp.xlsm."]
+
+    (input_dir / "dft2_tmp.xlsm").unlink()
+    watcher.poll(now=400)
+    assert watcher.poll(now=401)
+    assert [c.value for c in load_workbook(master).active[1]] == ["file name", "dft1_tmp"]
+    assert len(list(tmp_path.glob("validation_report_*.csv"))) == 1
+
+
+def test_watcher_reports_broken_template(resource_dir, tmp_path, monkeypatch, mock_config, caplog):
+    input_dir = _setup(resource_dir, tmp_path, monkeypatch, mock_config)
+    (input_dir / "broken.xlsx").write_bytes(b"not a spreadsheet")
+    watcher = Watcher(input_dir, input_dir / "datamap.csv", 500, tmp_path / "master.xlsx")
+    watcher.update()
+    assert [c.value for c in load_workbook(tmp_path / "master.xlsx").active[1]] == [
+        "file name", "dft1_tmp"
+    ]
+    assert "broken.xlsx,,Not imported." in watcher.report_path.read_text()
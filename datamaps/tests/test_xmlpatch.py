@@ -0,0 +1,162 @@
+import datetime
+import io
+import shutil
+import time
+import zipfile
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from ..benchmarks import generators
+from ..process.datamap import compile_datamap
+from ..process.exporter import populate_template, write_master_to_templates
+from ..process.xmlpatch import TemplatePatcher, UnsupportedTemplate
+
+VALUES = [
+    "text & <more>",
+    "  spaced ",
+    "",
+    "=1+1",
+    "#N/A",
+    12,
+    3.5,
+    True,
+    None,
+    datetime.date(2020, 1, 2),
+    datetime.datetime(2020, 1, 2, 3, 4),
+    datetime.time(9, 30),
+    datetime.timedelta(hours=30),
+]
+
+
+def _same_cells(ours: bytes, theirs: bytes):
+    ours_wb = load_workbook(io.BytesIO(ours))
+    theirs_wb = load_workbook(io.BytesIO(theirs))
+    assert ours_wb.epoch == theirs_wb.epoch
+    for ws in theirs_wb.worksheets:
+        ours_ws = ours_wb[ws.title]
+        for row in ws.iter_rows():
+            for cell in row:
+                ours_cell = ours_ws[cell.coordinate]
+                assert getattr(ours_cell.value, "text", ours_cell.value) == getattr(
+                    cell.value, "text", cell.value
+                ), cell.coordinate
+                assert getattr(ours_cell, "is_date", False) == getattr(cell, "is_date", False)
+
+
+def _populate(blank: bytes, datamap, values) -> bytes:
+    output = io.BytesIO()
+    populate_template(blank, datamap, values).save(output)
+    return output.getvalue()
+
+
+def test_patched_template_matches_openpyxl(resource_dir):
+    blank = (resource_dir / "blank_template.xlsm").read_bytes()
+    datamap = compile_datamap(resource_dir / "datamap.csv")
+    values = [(i, VALUES[i % len(VALUES)]) for i in range(len(datamap.lines))]
+    patched = TemplatePatcher(blank, datamap).populate(values)
+    _same_cells(patched, _populate(blank, datamap, values))
+    with zipfile.ZipFile(io.BytesIO(patched)) as ours, zipfile.ZipFile(io.BytesIO(blank)) as theirs:
+        assert ours.read("xl/vbaProject.bin") == theirs.read("xl/vbaProject.bin")
+
+
+@pytest.mark.parametrize("epoch", [None, datetime.datetime(1904, 1, 1)])
+def test_patched_cell_types(tmp_path, epoch):
+    lines = [
+        generators.DatamapLine(f"Key {i}", "Summary", f"{'BCD'[i % 3]}{i // 3 + 2}", "TEXT")
+        for i in range(len(VALUES))
+    ]
+    lines.append(generators.DatamapLine("Dated", "Summary", "F4", "DATE"))
+    lines.append(generators.DatamapLine("Elsewhere", "Missing", "A1", "TEXT"))
+    datamap = compile_datamap(generators.write_datamap(tmp_path / "datamap.csv", lines), cache_dir=tmp_path)
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Summary"
+    if epoch is not None:
+        wb.epoch = epoch
+    ws["A1"] = "Heading"
+    ws["C2"] = "replaced"
+    ws["C3"].number_format = "0.00"
+    ws["F4"].number_format = "dd/mm/yyyy"
+    ws["E3"] = "=C2"
+    output = io.BytesIO()
+    wb.save(output)
+    blank = output.getvalue()
+
+    values = list(enumerate(VALUES + [datetime.date(2021, 5, 6), "lost"]))
+    _same_cells(TemplatePatcher(blank, datamap).populate(values), _populate(blank, datamap, values))
+    # a blank template with no cells at all
+    empty = generators.write_blank_template(tmp_path / "empty.xlsx")
+    _same_cells(
+        TemplatePatcher(empty.read_bytes(), datamap).populate(values),
+        _populate(empty.read_bytes(), datamap, values),
+    )
+
+
+def test_merged_cell_is_not_populated(tmp_path):
+    lines = [generators.DatamapLine("Key", "Sheet", "C2", "TEXT")]
+    datamap = compile_datamap(generators.write_datamap(tmp_path / "datamap.csv", lines), cache_dir=tmp_path)
+    wb = Workbook()
+    wb.active.title = "Sheet"
+    wb.active.merge_cells("B2:C2")
+    wb.save(tmp_path / "blank.xlsx")
+    blank = (tmp_path / "blank.xlsx").read_bytes()
+    for populate in (TemplatePatcher(blank, datamap).populate, lambda v: populate_template(blank, datamap, v)):
+        with pytest.raises(AttributeError, match="PROBLEM: Key->Key"):
+            populate([(0, "x")])
+
+
+def test_shared_formula_is_unsupported(tmp_path):
+    lines = [generators.DatamapLine("Key", "Sheet", "C2", "TEXT")]
+    datamap = compile_datamap(generators.write_datamap(tmp_path / "datamap.csv", lines), cache_dir=tmp_path)
+    wb = Workbook()
+    wb.active.title = "Sheet"
+    wb.active["C2"] = "=1"
+    wb.active["C3"] = "=1"
+    wb.save(tmp_path / "blank.xlsx")
+    # C3 shares the formula of C2, so C2 cannot be overwritten
+    output = io.BytesIO()
+    with zipfile.ZipFile(tmp_path / "blank.xlsx") as zf, zipfile.ZipFile(output, "w") as out:
+        for info in zf.infolist():
+            data = zf.read(info)
+            if info.filename == "xl/worksheets/sheet1.xml":
+                data = data.replace(b"<f>1</f>", b'<f t="shared" ref="C2:C3" si="0">1</f>', 1)
+                data = data.replace(b"<f>1</f>", b'<f t="shared" si="0"/>', 1)
+            out.writestr(info, data)
+    with pytest.raises(UnsupportedTemplate):
+        TemplatePatcher(output.getvalue(), datamap)
+
+
+def test_export_with_xml_engine(mock_config, resource_dir, master):
+    mock_config.initialise()
+    output = mock_config.PLATFORM_DOCS_DIR / "output"
+    blank = resource_dir / "blank_template.xlsm"
+    datamap = resource_dir / "datamap_short.csv"
+    written = write_master_to_templates(blank, datamap, master)
+    theirs = output.parent / "openpyxl"
+    shutil.rmtree(theirs, ignore_errors=True)
+    output.rename(theirs)
+    output.mkdir()
+    ours = write_master_to_templates(blank, datamap, master, engine="xml")
+    assert [p.name for p in ours] == [p.name for p in written]
+    for path in ours:
+        _same_cells(path.read_bytes(), (theirs / path.name).read_bytes())
+    with pytest.raises(ValueError):
+        write_master_to_templates(blank, datamap, master, engine="lxml")
+
+
+def test_xml_engine_is_quicker(resource_dir):
+    blank = (resource_dir / "blank_template.xlsm").read_bytes()
+    datamap = compile_datamap(resource_dir / "datamap.csv")
+    values = [(i, VALUES[i % len(VALUES)]) for i in range(len(datamap.lines))]
+
+    def best(populate):
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            populate()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    patcher = TemplatePatcher(blank, datamap)
+    assert best(lambda: patcher.populate(values)) * 10 < best(lambda: _populate(blank, datamap, values))
@@ -0,0 +1,86 @@
+import datetime
+import time
+
+import pytest
+from openpyxl import Workbook
+
+from ..benchmarks import generators
+from ..core import Quarter
+from ..plugins.dft.master import Master
+from ..plugins.dft.portfolio import project_data_from_master
+from ..plugins.dft.xmlreader import UnsupportedMaster, read_active_sheet
+
+
+def _same(a, b):
+    assert list(a) == list(b)
+    for project in a:
+        assert list(a[project].items()) == list(b[project].items())
+        assert [type(v) for v in a[project].values()] == [type(v) for v in b[project].values()]
+
+
+@pytest.mark.parametrize("type_values", [False, True])
+def test_xml_engine_matches_openpyxl(master, tmp_path, type_values):
+    generated = generators.write_master(tmp_path / "generated.xlsx", 5, 200)
+    for path in (str(master), str(generated)):
+        _same(
+            project_data_from_master(path, engine="xml", type_values=type_values),
+            project_data_from_master(path, type_values=type_values),
+        )
+
+
+def test_xml_engine_cell_types(tmp_path):
+    wb = Workbook()
+    wb.create_sheet("Other")
+    ws = wb.create_sheet("Master")
+    wb.active = 2
+    wb.epoch = datetime.datetime(1904, 1, 1)
+    ws.append(["file name", "A", None, "B"])
+    ws.append([" Key 1 ", True, 1, 1.5])
+    ws.append(["Key 2", datetime.datetime(2020, 3, 1, 12, 30), "x", datetime.time(9, 30)])
+    ws.append([None, "orphan", None, None])
+    ws["C10"].number_format = "0.00"
+    ws.cell(row=3, column=5, value=datetime.timedelta(hours=30)).number_format = "[h]:mm:ss"
+    wb.save(tmp_path / "m.xlsx")
+    _same(
+        project_data_from_master(str(tmp_path / "m.xlsx"), engine="xml"),
+        project_data_from_master(str(tmp_path / "m.xlsx")),
+    )
+
+
+@pytest.mark.parametrize("change", ["formula", "merge"])
+def test_xml_engine_falls_back_to_openpyxl(tmp_path, change):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["file name", "A", "B"])
+    ws.append(["Key 1", 1, 2])
+    if change == "formula":
+        ws["C2"] = "=B2*2"
+    else:
+        ws.merge_cells("B2:C2")
+    wb.save(tmp_path / "m.xlsx")
+    with pytest.raises(UnsupportedMaster):
+        read_active_sheet(tmp_path / "m.xlsx")
+    assert project_data_from_master(str(tmp_path / "m.xlsx"), engine="xml") == project_data_from_master(
+        str(tmp_path / "m.xlsx")
+    )
+
+
+def test_xml_engine_is_quicker(tmp_path):
+    path = str(generators.write_master(tmp_path / "m.xlsx", 20, 1000))
+
+    def best(engine):
+        times = []
+        for _ in range(3):
+            start = time.perf_counter()
+            project_data_from_master(path, engine=engine)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    assert best("xml") * 1.5 < best("openpyxl")
+
+
+def test_master_engine(master):
+    m = Master(Quarter(1, 2019), str(master), engine="xml")
+    assert m.data == Master(Quarter(1, 2019), str(master)).data
+    with pytest.raises(ValueError):
+        Master(Quarter(1, 2019), str(master), engine="lxml")